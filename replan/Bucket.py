@@ -15,21 +15,144 @@ class Bucket:
     def connect_overflow(self, other_bucket):
         self.other_bucket = other_bucket
 
+    def chain(self):
+        """
+        This bucket and the buckets it overflows into, in order
+        """
+        chain = [self]
+        while chain[-1].other_bucket is not None and chain[-1].other_bucket not in chain:
+            chain.append(chain[-1].other_bucket)
+        return chain
+
     def tick(self):
-        if self.other_bucket is not None:
-            self.other_bucket.tick()
-            pressure = (self.level - self.other_bucket.level) * self.flow_rate
+        # Downstream buckets flow first, so that every bucket sees the level its other
+        # bucket has after its own tick
+        chain = self.chain()
+        for b in reversed(chain[:-1]):
+            pressure = (b.level - b.other_bucket.level) * b.flow_rate
             if pressure > 0.0:
-                self._flow_to_other(pressure)
+                b._flow_to_other(pressure)
 
     def _flow_to_other(self, amount):
         if self.level > 0.0:
-            self.level -= min(self.level, amount)
-            self.other_bucket.fill(min(self.level, amount))
+            moved = min(self.level, amount)
+            self.level -= moved
+            self.other_bucket.fill(moved)
 
     def fill(self, amount):
         self.level += amount
         if self.level > self.max:
+            excess = self.level - self.max
             self.level = self.max
             if self.other_bucket is None:
-                raise BucketFullException("Bucket {self.name} is full and there's no other bucket available")
\ No newline at end of file
+                raise BucketFullException(f"Bucket {self.name} is full and there's no other bucket available")
+            self.other_bucket.fill(excess)
+
+
+class BucketArray:
+    """
+    Many buckets with overflow chains simulated over many periods and scenarios at once
+
+    Bucket ``i`` holds up to ``capacity[i]``; what exceeds it overflows into bucket
+    ``overflow[i]`` or, at the end of a chain, spills. Like :meth:`Bucket.tick`, every
+    bucket additionally passes ``flow_rate[i]`` of the difference to the level of its
+    overflow bucket on, downstream buckets first.
+
+    Buckets are processed in groups of equal distance to the end of their chain, each
+    group as a single array operation over all scenarios.
+    """
+    def __init__(self, names, capacity, flow_rate=None, overflow=None):
+        """
+        :param names: Names of the buckets
+        :param capacity: Capacity of every bucket
+        :param flow_rate: Flow rate of every bucket, 0 if not given
+        :param overflow: Name of the bucket every bucket overflows into, or None
+        """
+        import numpy as np
+
+        self.names = list(names)
+        n = len(self.names)
+        index = dict([(name, i) for i, name in enumerate(self.names)])
+        self.capacity = np.asarray(capacity, dtype=float).reshape(n)
+        self.flow_rate = np.zeros(n) if flow_rate is None else np.asarray(flow_rate, dtype=float).reshape(n)
+        self.target = np.array([-1 if o is None else index[o] for o in (overflow or [None] * n)], dtype=int)
+
+        depth = [self._depth(i) for i in range(n)]
+        self.groups = [np.array([i for i in range(n) if depth[i] == d], dtype=int)
+                       for d in range(1, max(depth + [0]) + 1)]
+        self.terminal = self.target < 0
+
+    def _depth(self, i):
+        seen = set()
+        d = 0
+        while self.target[i] >= 0:
+            if i in seen:
+                raise ValueError(f"Overflow chain of {self.names[i]} is a cycle")
+            seen.add(i)
+            i = self.target[i]
+            d += 1
+        return d
+
+    def _overflow(self, level, capacity):
+        import numpy as np
+
+        # Upstream first, so that overflow passes down the whole chain in one sweep
+        for g in reversed(self.groups):
+            excess = np.clip(level[:, g] - capacity[:, g], 0.0, None)
+            level[:, g] -= excess
+            np.add.at(level, (slice(None), self.target[g]), excess)
+        excess = np.where(self.terminal, np.clip(level - capacity, 0.0, None), 0.0)
+        level -= excess
+        return excess
+
+    def _flow(self, level):
+        import numpy as np
+
+        for g in self.groups:
+            if not self.flow_rate[g].any():
+                continue
+            pressure = (level[:, g] - level[:, self.target[g]]) * self.flow_rate[g]
+            moved = np.minimum(np.clip(pressure, 0.0, None), np.clip(level[:, g], 0.0, None))
+            level[:, g] -= moved
+            np.add.at(level, (slice(None), self.target[g]), moved)
+
+    def simulate(self, inflow, capacity=None, start_level=None, carry=False):
+        """
+        :param inflow: What flows into every bucket in every period, shaped (periods, buckets)
+                       or (scenarios, periods, buckets)
+        :param capacity: Capacities overriding the ones of the array, shaped (buckets,) or
+                         (scenarios, buckets), e.g. for what-if staffing scenarios
+        :param start_level: Levels before the first period, empty if not given
+        :param carry: Whether levels are kept from one period to the next; by default every
+                      period starts empty, i.e. the levels are the allocation of the period
+        :return: Levels of every bucket at the end of every period, shaped (scenarios,
+                 periods, buckets), and what spilled over the ends of the chains in every
+                 period, shaped (scenarios, periods, buckets)
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        import numpy as np
+
+        inflow = np.asarray(inflow, dtype=float)
+        if inflow.ndim == 2:
+            inflow = inflow[np.newaxis]
+        capacity = self.capacity if capacity is None else np.asarray(capacity, dtype=float)
+        scenarios = max(inflow.shape[0], capacity.shape[0] if capacity.ndim == 2 else 1)
+        periods, n = inflow.shape[1], inflow.shape[2]
+
+        capacity = np.broadcast_to(capacity, (scenarios, n))
+        inflow = np.broadcast_to(inflow, (scenarios, periods, n))
+        level = np.zeros((scenarios, n)) if start_level is None else np.broadcast_to(
+            np.asarray(start_level, dtype=float), (scenarios, n)).copy()
+
+        levels = np.empty((scenarios, periods, n))
+        spills = np.empty((scenarios, periods, n))
+        for t in range(periods):
+            if not carry:
+                level[:] = 0.0
+            level += inflow[:, t]
+            spill = self._overflow(level, capacity)
+            self._flow(level)
+            spill += self._overflow(level, capacity)
+            levels[:, t] = level
+            spills[:, t] = spill
+        return levels, spills
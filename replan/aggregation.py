@@ -0,0 +1,182 @@
+import datetime
+
+from replan.collections import DefaultDict
+
+__all__ = ["WORK", "PAUSE", "POSTPONED", "OFF", "TAG_CLASSES", "tag_class", "DayTotals"]
+
+#: Tag classes of entries, i.e. how an entry counts in the balance and the distribution
+WORK, PAUSE, POSTPONED, OFF = range(4)
+TAG_CLASSES = 4
+
+
+def tag_class(tags):
+    """
+    The tag class of an entry with the given tags; breaks take precedence over time to be
+    distributed over all projects, which takes precedence over days off
+
+    :rtype: int
+    """
+    if "pause" in tags:
+        return PAUSE
+    if "distribute" in tags or "overhead" in tags:
+        return POSTPONED
+    if "off" in tags:
+        return OFF
+    return WORK
+
+
+class DayTotals:
+    """
+    Seconds and number of entries per (day, project, tag class) of a period
+
+    Everything the expected hours check and the resource distribution need, without
+    keeping the entries themselves: the memory needed grows with days times projects, not
+    with the number of entries.
+    """
+    def __init__(self, first, last, names=None):
+        """
+        :param first: First day of the period
+        :param last: Last day of the period
+        :param names: Project names known up front, more are added as they come
+        """
+        import numpy as np
+
+        first, last = [datetime.date(d.year, d.month, d.day) for d in (first, last)]
+        self.first = first
+        self.ndays = (last - first).days + 1
+        self.names = []
+        self._index = {}
+        self.seconds = np.zeros((self.ndays, 0, TAG_CLASSES))
+        self.counts = np.zeros((self.ndays, 0, TAG_CLASSES), dtype=np.int64)
+        for n in names or []:
+            self.name_index(n)
+
+    def name_index(self, name):
+        i = self._index.get(name)
+        if i is None:
+            import numpy as np
+
+            i = self._index[name] = len(self.names)
+            self.names.append(name)
+            pad = ((0, 0), (0, 1), (0, 0))
+            self.seconds = np.pad(self.seconds, pad, mode="constant")
+            self.counts = np.pad(self.counts, pad, mode="constant")
+        return i
+
+    def add(self, day, name, cls, seconds):
+        """
+        Folds a single entry in
+        """
+        i = (day - self.first).days
+        if 0 <= i < self.ndays:
+            n = self.name_index(name)
+            self.seconds[i, n, cls] += seconds
+            self.counts[i, n, cls] += 1
+
+    def add_arrays(self, days, names, classes, seconds):
+        """
+        Folds many entries in at once
+
+        :param days: Day of every entry as index into the period
+        :param names: Index of the project of every entry into :attr:`names`
+        :param classes: Tag class of every entry
+        :param seconds: Duration of every entry
+        """
+        import numpy as np
+
+        keep = (days >= 0) & (days < self.ndays)
+        if not keep.all():
+            days, names, classes, seconds = days[keep], names[keep], classes[keep], seconds[keep]
+        shape = self.seconds.shape
+        keys = (days * shape[1] + names) * TAG_CLASSES + classes
+        size = self.seconds.size
+        self.seconds += np.bincount(keys, weights=seconds, minlength=size).reshape(shape)
+        self.counts += np.bincount(keys, minlength=size).reshape(shape)
+
+    def merge(self, other):
+        """
+        Adds the totals of the same period, e.g. of another workspace
+        """
+        names = [self.name_index(n) for n in other.names]
+        self.seconds[:, names, :] += other.seconds
+        self.counts[:, names, :] += other.counts
+
+    def day(self, i):
+        return self.first + datetime.timedelta(days=i)
+
+    def days(self):
+        """
+        The days with entries
+
+        :rtype: list
+        """
+        return [self.day(i) for i in self.counts.sum(axis=(1, 2)).nonzero()[0].tolist()]
+
+    def slice(self, first, last):
+        """
+        The totals of a part of the period
+
+        :rtype: DayTotals
+        """
+        part = DayTotals(first, last)
+        part.names = list(self.names)
+        part._index = dict(self._index)
+        lo = (part.first - self.first).days
+        part.seconds = self.seconds[lo:lo + part.ndays].copy()
+        part.counts = self.counts[lo:lo + part.ndays].copy()
+        return part
+
+    def project_seconds(self, d, classes=(WORK,)):
+        """
+        Seconds per project of a day, counting only the given tag classes
+
+        :rtype: dict
+        """
+        i = (d - self.first).days
+        classes = list(classes)
+        counts = self.counts[i][:, classes].sum(axis=1)
+        seconds = self.seconds[i][:, classes].sum(axis=1)
+        return dict([(self.names[n], float(seconds[n])) for n in counts.nonzero()[0].tolist()])
+
+    def day_names(self):
+        """
+        The projects with entries of every day with entries
+
+        :rtype: dict
+        """
+        return dict([(d, list(self.project_seconds(d, range(TAG_CLASSES)))) for d in self.days()])
+
+    def day_seconds(self):
+        """
+        Seconds per project and seconds to be distributed of every day with entries, like
+        :meth:`replan.resource_planning.ResourcePlanner.calc_day_seconds`
+
+        :rtype: dict
+        """
+        ret = {}
+        for d in self.days():
+            i = (d - self.first).days
+            project_seconds = DefaultDict(0.0)
+            project_seconds.update(self.project_seconds(d))
+            ret[d] = (project_seconds, float(self.seconds[i, :, POSTPONED].sum()))
+        return ret
+
+    def day_hours(self, expected_day_hours):
+        """
+        Worked hours, breaks and balance of every day with entries, like
+        :func:`replan.checks.day_hours`
+
+        :param expected_day_hours: Function returning the hours to be worked on a day
+        :rtype: dict
+        """
+        from replan.checks import balance_hours
+
+        ret = {}
+        for d in self.days():
+            i = (d - self.first).days
+            seconds = self.seconds[i].sum(axis=0)
+            off = self.counts[i, :, OFF].nonzero()[0]
+            special = self.names[off[-1]] if len(off) else None
+            actual = (seconds[WORK] + seconds[POSTPONED] + seconds[OFF]) / 3600.
+            ret[d] = balance_hours(actual, seconds[PAUSE] / 3600., expected_day_hours(d), special)
+        return ret
@@ -0,0 +1,307 @@
+import random
+import re
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from replan.logging import log
+
+__all__ = ["TokenBucket", "EndpointStats", "ThrottledAdapter", "make_session", "attach", "check_attached"]
+
+#: Status codes worth another try; everything else is handed to the caller as is
+retry_statuses = (429, 500, 502, 503, 504)
+#: Methods that may be sent again after a failure without risking duplicates
+idempotent_methods = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket adapting its rate to throttling
+
+    The rate starts at ``rate`` requests per second. Every throttled request halves it,
+    every successful one raises it by a twentieth of ``rate`` again until ``rate`` is
+    reached, so that the client runs right below the limit of the server.
+    """
+    def __init__(self, rate, burst=1, min_rate=0.05):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent
+
+        :return: Seconds waited
+        :rtype: float
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2.)
+            self.tokens = 0.0
+            self.stamp = time.monotonic()
+
+    def succeeded(self):
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20.)
+
+
+class EndpointStats:
+    """
+    Counters of a single endpoint, i.e. method and path with the ids taken out
+    """
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled = 0
+        self.seconds = 0.0
+        self.waited = 0.0
+        self.bytes = 0
+
+    def as_dict(self):
+        return {
+            "endpoint": self.endpoint,
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "seconds": self.seconds,
+            "waited": self.waited,
+            "bytes": self.bytes
+        }
+
+
+_id_re = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_of(request):
+    path = requests.utils.urlparse(request.url).path
+    return f"{request.method} {_id_re.sub('/{id}', path)}"
+
+
+class ThrottledAdapter(HTTPAdapter):
+    """
+    Transport adapter sending requests through a token bucket, retrying transient failures
+    with exponential backoff and counting requests, latency, retries and bytes per endpoint
+
+    Connections are pooled per host by the underlying urllib3 pool manager, unless the
+    requests are handed to another ``transport`` adapter, e.g. a
+    :class:`replan.fake_toggl.FakeTogglAdapter`.
+    """
+    def __init__(self, rate=1.0, burst=1, max_retries=5, backoff=0.5, max_backoff=60.0,
+                 pool_maxsize=10, transport=None, **kwargs):
+        super().__init__(pool_connections=1, pool_maxsize=pool_maxsize, **kwargs)
+        self.transport = transport
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _stats(self, endpoint):
+        with self._stats_lock:
+            s = self.stats.get(endpoint)
+            if s is None:
+                s = self.stats[endpoint] = EndpointStats(endpoint)
+            return s
+
+    def _count(self, stats, **deltas):
+        # Several threads may send to the same endpoint
+        with self._stats_lock:
+            for k, v in deltas.items():
+                setattr(stats, k, getattr(stats, k) + v)
+
+    def _delay(self, attempt, retry_after):
+        if retry_after is not None:
+            return min(self.max_backoff, max(0.0, retry_after))
+        # Full jitter, so that parallel clients don't retry in lock step
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def send(self, request, **kwargs):
+        stats = self._stats(endpoint_of(request))
+        may_repeat = request.method in idempotent_methods
+
+        attempt = 0
+        while True:
+            self._count(stats, waited=self.bucket.acquire(), requests=1)
+            started = time.perf_counter()
+            try:
+                if self.transport is not None:
+                    response = self.transport.send(request, **kwargs)
+                else:
+                    response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._count(stats, seconds=time.perf_counter() - started, errors=1)
+                if not may_repeat or attempt >= self.retries:
+                    raise
+                delay = self._delay(attempt, None)
+                log.warning(f"{stats.endpoint} failed ({e}), retrying in {delay:.1f}s")
+            else:
+                status = response.status_code
+                self._count(stats, seconds=time.perf_counter() - started,
+                            bytes=0 if kwargs.get("stream") else len(response.content),
+                            throttled=1 if status == 429 else 0)
+                if status not in retry_statuses:
+                    self.bucket.succeeded()
+                    return response
+
+                self._count(stats, errors=1)
+                # A throttled request hasn't been processed, so even a POST may be sent again
+                if (not may_repeat and status != 429) or attempt >= self.retries:
+                    return response
+
+                retry_after = response.headers.get("Retry-After")
+                try:
+                    retry_after = float(retry_after) if retry_after is not None else None
+                except ValueError:
+                    retry_after = None
+                if status == 429:
+                    self.bucket.throttled()
+                delay = self._delay(attempt, retry_after)
+                log.warning(f"{stats.endpoint} returned {status}, retrying in {delay:.1f}s")
+                response.close()
+
+            self._count(stats, retries=1)
+            attempt += 1
+            time.sleep(delay)
+
+    def records(self):
+        with self._stats_lock:
+            return [self.stats[e].as_dict() for e in sorted(self.stats)]
+
+    def output(self, stream=None):
+        stream = stream or sys.stderr
+        stream.write(f"{'Endpoint':<50s} {'Reqs':>5s} {'Errs':>5s} {'Retr':>5s} {'429':>4s} "
+                     f"{'Time [s]':>9s} {'Wait [s]':>9s} {'KiB':>9s}\n")
+        for s in self.records():
+            stream.write(f"{s['endpoint']:<50s} {s['requests']:>5d} {s['errors']:>5d} {s['retries']:>5d} "
+                         f"{s['throttled']:>4d} {s['seconds']:>9.3f} {s['waited']:>9.3f} {s['bytes'] / 1024.:>9.1f}\n")
+        stream.flush()
+
+
+def make_session(**kwargs):
+    """
+    A session with a :class:`ThrottledAdapter` mounted for HTTP and HTTPS
+
+    :param kwargs: Passed on to the adapter
+    :rtype: requests.Session
+    """
+    session = requests.Session()
+    adapter = ThrottledAdapter(**kwargs)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.adapter = adapter
+    return session
+
+
+class _SessionRequests:
+    """
+    Stands in for the requests module of a client calling ``requests.get`` and friends,
+    sending everything through a session instead
+    """
+    def __init__(self, session):
+        self._session = session
+
+    def request(self, method, url, **kwargs):
+        return self._session.request(method, url, **kwargs)
+
+    def get(self, url, params=None, **kwargs):
+        return self._session.get(url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self._session.post(url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self._session.put(url, data=data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        return self._session.patch(url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self._session.delete(url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self._session.head(url, **kwargs)
+
+    def Session(self):
+        # Sessions the client creates itself get the adapter, too
+        own = requests.Session()
+        own.mount("https://", self._session.adapter)
+        own.mount("http://", self._session.adapter)
+        return own
+
+    def __getattr__(self, item):
+        return getattr(requests, item)
+
+
+def attach(api, session):
+    """
+    Makes a Toggl API client send its requests through ``session``
+
+    A session of the client is given the adapter of ``session``; a client using the
+    module level functions of requests gets them replaced in every module of its package
+    that imported requests.
+
+    If neither is found, e.g. because the client uses urllib, a warning is logged: its
+    requests are then neither throttled nor retried nor counted by ``--api-stats``. See
+    :func:`check_attached` for telling afterwards.
+
+    :return: Whether the client could be attached to
+    :rtype: bool
+    """
+    for attr in ("session", "_session"):
+        own = getattr(api, attr, None)
+        if isinstance(own, requests.Session):
+            own.mount("https://", session.adapter)
+            own.mount("http://", session.adapter)
+            return True
+
+    package = type(api).__module__.split(".")[0]
+    modules = [m for name, m in list(sys.modules.items())
+               if (name == package or name.startswith(package + ".")) and getattr(m, "requests", None) is requests]
+    for module in modules:
+        module.requests = _SessionRequests(session)
+    if modules:
+        return True
+
+    log.warning(f"Don't know how to attach to {type(api)}; its requests are neither throttled, retried nor counted")
+    return False
+
+
+def check_attached(session, fetched=True):
+    """
+    Warns if the client made requests that didn't go through ``session``
+
+    :param fetched: Whether the client fetched anything in the meantime
+    :return: Whether requests went through the session
+    :rtype: bool
+    """
+    if fetched and not session.adapter.stats:
+        log.warning("No request went through the throttled session; the Toggl client isn't attached to it")
+        return False
+    return True
@@ -0,0 +1,220 @@
+import datetime
+import json
+import os
+
+from replan.aggregation import DayTotals, tag_class
+from replan.logging import log
+from replan.timezones import DayTable, get_zone
+
+__all__ = ["EntryArchive", "RECORD", "ARCHIVE_VERSION"]
+
+#: Bump whenever the layout of the archive changes
+ARCHIVE_VERSION = 1
+
+#: One entry, or the part of an entry on a single day. ``day`` is the local day in days
+#: since the epoch, ``name`` and ``tags`` index the tables of the archive, ``id`` is -1 for
+#: entries without one.
+RECORD = [("day", "<i4"), ("name", "<i4"), ("tags", "<i4"), ("start", "<i8"), ("end", "<i8"), ("id", "<i8")]
+
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def _day_number(d):
+    return (datetime.date(d.year, d.month, d.day) - _EPOCH).days
+
+
+class EntryArchive:
+    """
+    Append-only columnar archive of entries, partitioned by month
+
+    Every month is a file of fixed size records (see :data:`RECORD`) that is read through
+    a memory map, so scanning years of entries creates no Python object per entry and
+    keeps only the pages of the month at hand resident. Project names and tag sets are
+    kept once in ``index.json``.
+
+    Project and tag bitmaps of every month are built on demand and cached, see
+    :meth:`index` and :func:`replan.entry_index.query`.
+
+    Entries are assigned to local days when they're appended, entries crossing midnight
+    are stored as one record per day. Entries already in the archive are skipped, by id and
+    day or, for entries without an id like the ones of holidays, by day, project, start and
+    end. So archiving a period again only adds what's new; to pick up changed entries,
+    delete the file of their month and archive it again.
+    """
+    def __init__(self, root, zone=None):
+        """
+        :param root: Directory of the archive, created on the first append
+        :param zone: Zone of new archives; an existing archive keeps the zone it was
+                     created with
+        """
+        self.root = root
+        self.names = []
+        self.tag_sets = []
+        self.zone = zone or get_zone()
+        index_file = os.path.join(root, "index.json")
+        if os.path.exists(index_file):
+            with open(index_file, "r") as f:
+                index = json.load(f)
+            if index.get("version") != ARCHIVE_VERSION:
+                raise ValueError(f"Archive {root} has version {index.get('version')}, expected {ARCHIVE_VERSION}")
+            self.names = index["names"]
+            self.tag_sets = [tuple(t) for t in index["tag_sets"]]
+            self.zone = get_zone(index["timezone"])
+        self._names = dict([(n, i) for i, n in enumerate(self.names)])
+        self._tag_sets = dict([(t, i) for i, t in enumerate(self.tag_sets)])
+
+    def _write_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        index_file = os.path.join(self.root, "index.json")
+        tmp_file = f"{index_file}.{os.getpid()}"
+        with open(tmp_file, "w") as f:
+            json.dump({"version": ARCHIVE_VERSION, "timezone": self.zone.name,
+                       "names": self.names, "tag_sets": self.tag_sets}, f)
+        os.replace(tmp_file, index_file)
+
+    def _path(self, year, month):
+        return os.path.join(self.root, f"{year:04d}-{month:02d}.entries")
+
+    def months(self):
+        """
+        The months in the archive
+
+        :rtype: list
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted([(int(f[:4]), int(f[5:7])) for f in os.listdir(self.root) if f.endswith(".entries")])
+
+    def month(self, year, month):
+        """
+        The records of a month, memory mapped
+
+        :rtype: numpy.ndarray
+        """
+        import numpy as np
+
+        path = self._path(year, month)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return np.zeros(0, dtype=RECORD)
+        return np.memmap(path, dtype=RECORD, mode="r")
+
+    def index(self, year, month):
+        """
+        Project and tag bitmaps of the records of a month, cached next to the month as long
+        as no records are appended to it
+
+        :rtype: replan.entry_index.EntryIndex
+        """
+        from replan.entry_index import EntryIndex
+
+        records = self.month(year, month)
+        path = f"{self._path(year, month)}.index"
+        if os.path.exists(path):
+            try:
+                index = EntryIndex.load(path)
+                if index.size == len(records):
+                    return index
+            except (OSError, ValueError, KeyError) as e:
+                log.debug(f"Ignoring unreadable index {path}: {e}")
+        index = EntryIndex.build(records, self.names, self.tag_sets)
+        try:
+            index.save(path)
+        except OSError as e:
+            log.debug(f"Could not write index {path}: {e}")
+        return index
+
+    def append(self, entries):
+        """
+        Adds entries to the archive
+
+        :param entries: List of :class:`replan.entry.Entry`
+        :return: Number of records written
+        :rtype: int
+        """
+        import numpy as np
+
+        if not entries:
+            return 0
+        first = min([self.zone.local_day(e.start_ts) for e in entries])
+        last = max([self.zone.local_day(max(e.end_ts - 1, e.start_ts)) for e in entries])
+
+        rows = []
+        changed = False
+        for d, e in DayTable(self.zone, first, last).split(entries):
+            name = self._names.get(e.name)
+            if name is None:
+                name = self._names[e.name] = len(self.names)
+                self.names.append(e.name)
+                changed = True
+            tags = tuple(sorted(e.tags))
+            tag_set = self._tag_sets.get(tags)
+            if tag_set is None:
+                tag_set = self._tag_sets[tags] = len(self.tag_sets)
+                self.tag_sets.append(tags)
+                changed = True
+            rows.append((_day_number(d), name, tag_set, e.start_ts, e.end_ts, -1 if e.id is None else e.id))
+        records = np.array(rows, dtype=RECORD)
+
+        # The tables first, so that the partitions never refer to names that aren't there
+        if changed:
+            self._write_index()
+
+        written = 0
+        months = records["day"].astype("datetime64[D]").astype("datetime64[M]")
+        for m in np.unique(months):
+            part = records[months == m]
+            year, month = m.astype(object).year, m.astype(object).month
+            existing = self.month(year, month)
+            if len(existing):
+                has_id = existing["id"] >= 0
+                keys = existing["id"][has_id] * 32 + existing["day"][has_id] % 32
+                new = (part["id"] < 0) | ~np.isin(part["id"] * 32 + part["day"] % 32, keys)
+                no_id = part["id"] < 0
+                if no_id.any() and not has_id.all():
+                    fields = ["day", "name", "start", "end"]
+                    seen = set(existing[~has_id][fields].tolist())
+                    new[no_id] = [r not in seen for r in part[no_id][fields].tolist()]
+                part = part[new]
+            del existing
+            if not len(part):
+                continue
+            with open(self._path(year, month), "ab") as f:
+                f.write(part.tobytes())
+            written += len(part)
+        log.info(f"Archived {written} of {len(records)} records in {self.root}")
+        return written
+
+    def scan(self, first, last):
+        """
+        The records of the days from ``first`` to ``last``, one array per month
+
+        :return: Generator of record arrays, memory mapped for whole months
+        """
+        lo, hi = _day_number(first), _day_number(last)
+        for year, month in self.months():
+            if (year, month) < (first.year, first.month) or (year, month) > (last.year, last.month):
+                continue
+            records = self.month(year, month)
+            if len(records) and (records["day"].min() < lo or records["day"].max() > hi):
+                records = records[(records["day"] >= lo) & (records["day"] <= hi)]
+            yield records
+
+    def totals(self, first, last, totals=None):
+        """
+        Folds the records of the days from ``first`` to ``last`` into totals per day,
+        project and tag class, one month at a time
+
+        :rtype: replan.aggregation.DayTotals
+        """
+        import numpy as np
+
+        totals = totals or DayTotals(first, last)
+        classes = np.array([tag_class(t) for t in self.tag_sets], dtype=np.int64)
+        names = np.array([totals.name_index(n) for n in self.names], dtype=np.int64)
+        offset = _day_number(first)
+        for records in self.scan(first, last):
+            if not len(records):
+                continue
+            totals.add_arrays(records["day"].astype(np.int64) - offset, names[records["name"]],
+                              classes[records["tags"]], (records["end"] - records["start"]).astype(float))
+        return totals
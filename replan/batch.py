@@ -0,0 +1,96 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from replan.logging import log
+
+__all__ = ["month_report", "run_batch", "rollup", "write_ezve_file"]
+
+
+def month_report(rp):
+    """
+    Summary and EZVE results of a single month
+
+    :param rp: Planner of the month, see :meth:`ResourcePlanner.split_months`
+    :type rp: replan.resource_planning.ResourcePlanner
+    :rtype: dict
+    """
+    from replan.resource_planning import to_percents
+
+    project_seconds, total_seconds = rp.calc_project_and_total_seconds()
+    return {
+        "year": rp.start.year,
+        "month": rp.start.month,
+        "project_seconds": dict(project_seconds),
+        "total_seconds": total_seconds,
+        "summary": to_percents(project_seconds, total_seconds),
+        "ezve": rp.ezve_records(),
+        "available": rp.availability(rp.start.month, rp.start.year),
+        "complete": rp.covers_month()
+    }
+
+
+def write_ezve_file(path, ezve):
+    """
+    Writes EZVE records in the tab separated format of ``ezve --to-file``
+
+    :param path: File to write
+    :param ezve: Records with date, ccenter and percent
+    """
+    with open(path, "w") as f:
+        for e in ezve:
+            d = e["date"]
+            f.write(f"{d.year}\t{d.month}\t{d.day}\t{e['ccenter']:05d}\t{e['percent']}\n")
+
+
+def rollup(reports):
+    """
+    Combines month reports into the distribution of the whole period
+
+    :param reports: Results of :func:`month_report`
+    :rtype: dict
+    """
+    from replan.resource_planning import to_percents
+
+    project_seconds = {}
+    total_seconds = 0.0
+    for r in reports:
+        total_seconds += r["total_seconds"]
+        for p in r["project_seconds"]:
+            project_seconds[p] = project_seconds.get(p, 0.0) + r["project_seconds"][p]
+
+    return {
+        "months": len(reports),
+        "project_seconds": project_seconds,
+        "total_seconds": total_seconds,
+        "summary": to_percents(project_seconds, total_seconds) if total_seconds > 0 else {}
+    }
+
+
+def run_batch(rp, jobs=None):
+    """
+    Computes the reports of every month of a loaded planner and their rollup
+
+    Months are independent of each other, so with more than one job they're computed in
+    a process pool.
+
+    :param rp: Planner with the entries of the whole period fetched
+    :type rp: replan.resource_planning.ResourcePlanner
+    :param jobs: Number of worker processes, defaults to the number of CPUs
+    :return: The month reports ordered by month and the rollup
+    :rtype: (list, dict)
+    """
+    months = rp.split_months()
+    planners = [months[k] for k in sorted(months)]
+    jobs = min(jobs or os.cpu_count() or 1, len(planners))
+
+    if jobs > 1:
+        log.info(f"Computing {len(planners)} months in {jobs} processes")
+        # Forked workers must not inherit and write out what is still buffered
+        sys.stdout.flush()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            reports = list(pool.map(month_report, planners))
+    else:
+        reports = [month_report(m) for m in planners]
+
+    return reports, rollup(reports)
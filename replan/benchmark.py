@@ -0,0 +1,256 @@
+import datetime
+import logging
+import sys
+import tracemalloc
+
+from replan.checks import day_hours, gap_threshold_seconds
+from replan.logging import log
+from replan.profiling import Profiler
+from replan.synthetic import SyntheticAccount
+from replan.timezones import epoch
+
+__all__ = ["reference_month_seconds", "equivalence", "run_benchmark", "output_benchmark"]
+
+#: Stages measured for every scale, in the order they run
+stages = ["config", "fetch", "holidays", "checks", "calc_project_and_total_seconds", "ezve_records"]
+
+
+def _raw_entries(account, start, end):
+    for e in account.entries:
+        if start <= e["start"].date() and e["stop"].date() <= end:
+            yield e
+
+
+def reference_month_seconds(account, rp):
+    """
+    Seconds per project and total seconds of a month computed straight from the raw
+    entries of the account with the original, unoptimized algorithm
+
+    :param rp: Planner of the month, only its config and working hours are used
+    :rtype: (dict, float)
+    """
+    projects = dict([(p["id"], p["name"]) for p in account.projects])
+    all_hours = rp.bh.get_actual_working_hours(month=rp.start.month)
+    total_seconds = all_hours * 3600
+    project_seconds = {}
+    postponed_seconds = 0.0
+    for e in _raw_entries(account, rp.start, rp.end):
+        tags = [t.lower() for t in e["tags"]]
+        seconds = (e["stop"] - e["start"]).seconds
+        if "pause" in tags:
+            continue
+        if "distribute" in tags or "overhead" in tags:
+            postponed_seconds += seconds
+            continue
+        name = projects[e["pid"]]
+        project_seconds[name] = project_seconds.get(name, 0.0) + seconds
+
+    sick_days = rp.bh.get_sick_days(month=rp.start.month, year=rp.start.year)
+    postponed_seconds += rp.bh.get_daily_working_hours() * 3600. * len(sick_days)
+    for p in project_seconds:
+        project_seconds[p] += postponed_seconds / len(project_seconds)
+
+    small = [p for p in project_seconds if 0.0 < project_seconds[p] / total_seconds < 0.05]
+    distribute_seconds = sum([project_seconds.pop(p) for p in small])
+    if small:
+        for p in project_seconds:
+            project_seconds[p] += distribute_seconds / len(project_seconds)
+
+    vac_days = rp.bh.get_vacations(month=rp.start.month, year=rp.start.year)
+    course_days = rp.bh.get_course_days(month=rp.start.month)
+    project_seconds["Vacations"] = rp.bh.get_daily_labor_hours() * 3600. * len(vac_days)
+    project_seconds["Courses"] = rp.bh.get_daily_labor_hours() * 3600. * len(course_days)
+    return project_seconds, total_seconds
+
+
+def reference_day_hours(account, rp):
+    """
+    Worked hours of every local day with entries, straight from the raw entries. Entries
+    crossing midnight count on every day they last into.
+
+    :rtype: dict
+    """
+    ret = {}
+    for e in _raw_entries(account, rp.start, rp.end):
+        if "pause" in [t.lower() for t in e["tags"]]:
+            continue
+        start, stop = epoch(e["start"]), epoch(e["stop"])
+        while start < stop:
+            d = rp.zone.local_day(start)
+            end = min(stop, rp.zone.midnight(d + datetime.timedelta(days=1)))
+            ret[d] = ret.get(d, 0.0) + (end - start) / 3600.
+            start = end
+    return ret
+
+
+def reference_gaps(account, rp):
+    """
+    Findings of the check for gaps and overlaps straight from the raw entries, with every
+    entry on the local day it starts on
+
+    :return: (kind, day) of every finding
+    :rtype: list
+    """
+    days = {}
+    for e in _raw_entries(account, rp.start, rp.end):
+        start, stop = epoch(e["start"]), epoch(e["stop"])
+        days.setdefault(rp.zone.local_day(start), []).append((start, stop))
+    ret = []
+    for d in days:
+        items = sorted(days[d])
+        for first, second in zip(items[:-1], items[1:]):
+            for start, stop in (first, second):
+                if rp.zone.local_day(stop - 1) != d:
+                    ret.append(("midnight", d))
+            diff = second[0] - first[1]
+            if diff >= gap_threshold_seconds:
+                ret.append(("gap", d))
+            elif diff <= -gap_threshold_seconds:
+                ret.append(("ovl", d))
+    return sorted(ret)
+
+
+def add_late_entries(account):
+    """
+    Adds a two hour entry crossing local midnight to every month with entries, on its last
+    day with entries between the 10th and the 16th that is followed by one with entries.
+    The planner adds entries for the days off, so no entry ends on one of them.
+    """
+    days = set([e["start"].date() for e in account.entries])
+    last = {}
+    for e in account.entries:
+        d = e["start"].date()
+        if not 10 <= d.day <= 16 or "Pause" in e["tags"] or d + datetime.timedelta(days=1) not in days:
+            continue
+        k = (d.year, d.month)
+        if k not in last or e["start"] > last[k]["start"]:
+            last[k] = e
+    for k in sorted(last):
+        e = last[k]
+        # 22:30 to 0:30 in winter, 23:30 to 1:30 in summer time
+        start = datetime.datetime.combine(e["start"].date(), datetime.time(21, 30))
+        account.create_entry({"pid": e["pid"], "start": start.isoformat(), "duration": 7200,
+                              "tags": e["tags"], "description": "late"})
+
+
+def equivalence(account, rp, months):
+    """
+    Compares the results of the planner with the reference implementation
+
+    :param rp: Planner of the whole period with entries fetched and holidays applied
+    :param months: Month planners, see :meth:`ResourcePlanner.split_months`
+    :return: Descriptions of the differences found
+    :rtype: list
+    """
+    from replan.resource_planning import to_percents
+
+    diffs = []
+    # Entries crossing midnight are split into one part per day with the same id
+    fetched = len(set([e.id for d in rp.days for e in rp.days[d] if e.id is not None]))
+    raw = len(list(_raw_entries(account, rp.start, rp.end)))
+    if fetched != raw:
+        diffs.append(f"{fetched} entries fetched, {raw} expected")
+
+    reference = reference_day_hours(account, rp)
+    for d in sorted(reference):
+        if d not in rp.days:
+            diffs.append(f"{d}: missing")
+            continue
+        hours = day_hours(rp.days[d], rp.get_labor_hours(d))[0]
+        if abs(hours - reference[d]) > 1e-9:
+            diffs.append(f"{d}: {hours}h worked, {reference[d]}h expected")
+
+    gaps = [r for r in rp.check_results if r.name == "Gaps and overlaps"][0]
+    actual = sorted([(f.kind, f.day) for f in gaps.findings if f.day in reference])
+    expected = [f for f in reference_gaps(account, rp) if f[1] in reference]
+    if actual != expected:
+        diffs.append(f"gaps and overlaps: {len(actual)} findings, {len(expected)} expected")
+
+    for k in sorted(months):
+        m = months[k]
+        actual = to_percents(*m.calc_project_and_total_seconds())
+        expected = to_percents(*reference_month_seconds(account, m))
+        if actual != expected:
+            diffs.append(f"{k[0]}-{k[1]:02d}: distribution {actual}, {expected} expected")
+    return diffs
+
+
+def run_scale(years, workspaces=1, projects=6, entries_per_day=8, seed=1):
+    """
+    Runs every stage on a synthetic account of the given size
+
+    :return: Size of the account, the measurements of every stage and the differences
+             to the reference implementation
+    :rtype: dict
+    """
+    from replan.resource_planning import ResourcePlanner
+
+    account = SyntheticAccount(years=range(2018, 2018 + years), workspaces=workspaces,
+                               projects=projects, entries_per_day=entries_per_day, seed=seed)
+    add_late_entries(account)
+    prof = Profiler()
+    prof.enable()
+
+    with prof.measure("config"):
+        config = account.config()
+    rp = ResourcePlanner(account.start, account.end, config=config, api=account.api())
+    rp.log_header()
+    with prof.measure("fetch"):
+        rp.calculate_percents()
+    with prof.measure("holidays"):
+        rp.apply_holidays()
+    with prof.measure("checks"):
+        rp.checks()
+
+    months = rp.split_months()
+    for k in sorted(months):
+        months[k].log_header()
+        with prof.measure("calc_project_and_total_seconds"):
+            months[k].calc_project_and_total_seconds()
+        with prof.measure("ezve_records"):
+            months[k].ezve_records()
+
+    return {
+        "years": years,
+        "workspaces": workspaces,
+        "projects": projects * workspaces,
+        "entries": len(account.entries),
+        "stages": [prof.timings[s].as_dict() for s in stages],
+        "differences": equivalence(account, rp, months)
+    }
+
+
+def run_benchmark(scales=(1, 2, 4), **kwargs):
+    """
+    Runs :func:`run_scale` for every number of years in ``scales``
+
+    Times are measured with tracemalloc running, so they're higher than in a normal run,
+    but comparable between runs of the benchmark. A small warm up run, whose results are
+    dropped, keeps the imports of the first stages out of the measurements.
+
+    :rtype: list
+    """
+    level = log.level
+    log.setLevel(logging.CRITICAL)
+    try:
+        run_scale(1, workspaces=1, projects=3, entries_per_day=2)
+        return [run_scale(years, **kwargs) for years in scales]
+    finally:
+        log.setLevel(level)
+        tracemalloc.stop()
+
+
+def output_benchmark(results, stream=None):
+    stream = stream or sys.stdout
+    stream.write(f"{'Years':>5s} {'Entries':>8s} {'Stage':<32s} {'Calls':>6s} {'Wall [s]':>9s} "
+                 f"{'CPU [s]':>9s} {'Peak [KiB]':>11s} {'us/entry':>9s}\n")
+    for r in results:
+        for s in r["stages"]:
+            per_entry = s["wall"] / r["entries"] * 1e6 if r["entries"] else 0.0
+            stream.write(f"{r['years']:>5d} {r['entries']:>8d} {s['stage']:<32s} {s['calls']:>6d} {s['wall']:>9.4f} "
+                         f"{s['cpu']:>9.4f} {s['peak_memory'] / 1024.:>11.1f} {per_entry:>9.2f}\n")
+        status = "OK" if not r["differences"] else f"{len(r['differences'])} differences"
+        stream.write(f"{r['years']:>5d} {r['entries']:>8d} {'equivalence':<32s} {status}\n")
+        for d in r["differences"]:
+            stream.write(f"      {d}\n")
+    stream.flush()
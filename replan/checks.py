@@ -1,5 +1,5 @@
 import datetime
-import pytz
+import logging
 
 from datetime import timedelta as tdelta, datetime as dt
 
@@ -7,145 +7,280 @@ from replan.entry import Entry
 from replan.logging import log
 from .colour import Colour
 from .functions import mk_headline
+from .profiling import profiler
+
+
+class Finding:
+    """
+    Something a check found, e.g. a gap between two entries or a missing workday
+    """
+    def __init__(self, kind, day, **details):
+        self.kind = kind
+        self.day = day
+        self.details = details
+
+    def as_dict(self):
+        return dict(kind=self.kind, day=self.day, **self.details)
+
+    def __repr__(self):
+        return f"Finding: [{self.kind}] [{self.day}] {self.details}"
+
+
+class CheckResult:
+    """
+    Outcome of a check; evaluates to whether the check passed
+    """
+    def __init__(self, name, okay, findings, aggregates=None):
+        self.name = name
+        self.okay = okay
+        self.findings = findings
+        self.aggregates = aggregates or {}
+
+    def __bool__(self):
+        return bool(self.okay)
+
+    def as_dict(self):
+        return {
+            "check": self.name,
+            "okay": bool(self.okay),
+            "aggregates": self.aggregates,
+            "findings": [f.as_dict() for f in self.findings]
+        }
+
+    def __repr__(self):
+        return f"Check {self.name}: {'OK' if self.okay else 'Not OK'} ({len(self.findings)} findings)"
 
 
 def check(msg):
     def wrap(func):
         def wrapper(*args, **kwargs):
-            m = f"Check: {msg}"
-            log.info(mk_headline(m, ">", indent = 5))
-            okay = func(*args, **kwargs)
-            if not okay:
+            verbose = log.isEnabledFor(logging.INFO)
+            if verbose:
+                m = f"Check: {msg}"
+                log.info(mk_headline(m, ">", indent = 5))
+            result = CheckResult(msg, True, [])
+            with profiler.measure(f"check {msg}"):
+                result.okay = func(*args, result=result, **kwargs)
+            if not result.okay and log.isEnabledFor(logging.WARNING):
                 log.warn(mk_headline(f"{Colour.RED}{Colour.BOLD}Not OK!{Colour.END}"))
-            else:
+            elif verbose:
                 log.info(mk_headline(f"{Colour.GREEN}{Colour.BOLD}OK!{Colour.END}"))
-            log.info(mk_headline(sgn="<"))
-            log.info("")
-            return okay
+            if verbose:
+                log.info(mk_headline(sgn="<"))
+                log.info("")
+            return result
         return wrapper
     return wrap
 
 
+def day_hours(entries, expected_day_hours):
+    """
+    Worked hours, breaks and balance of a single day
+
+    :param entries: The entries of the day
+    :param expected_day_hours: The hours to be worked on the day
+    :return: Worked hours, remaining break hours, balance and the name of the day off
+             entry (or None)
+    :rtype: (float, float, float, str)
+    """
+    pause_hours = 0.0
+    actual_day_hours = 0.0
+    special_day_type = None
+
+    for e in entries: # type: Entry
+        if "pause" in e.tags:
+            pause_hours += e.seconds/3600.0
+            continue
+        if "off" in e.tags:
+            special_day_type = e.name
+
+        actual_day_hours += e.seconds/3600.0
+
+    return balance_hours(actual_day_hours, pause_hours, expected_day_hours, special_day_type)
+
+
+def balance_hours(actual_day_hours, pause_hours, expected_day_hours, special_day_type=None):
+    """
+    Balance of a day from its worked and break hours, see :func:`day_hours`
+
+    :rtype: (float, float, float, str)
+    """
+    overunder = actual_day_hours - expected_day_hours
+    if overunder < 0.0:
+        p = pause_hours
+        overunder += p
+        pause_hours -= p
+
+    return actual_day_hours, pause_hours, overunder, special_day_type
+
+
 @check("Expected hours")
-def check_for_expected_hours(days, get_working_hours_func):
+def check_for_expected_hours(days, get_working_hours_func, result, hours=None):
+    """
+    :param hours: Results of :func:`day_hours` for every day, computed from the entries of
+                  ``days`` if not given
+    """
+    verbose = log.isEnabledFor(logging.INFO)
     days_sorted = sorted(days.keys())
     total_hours = 0.0
     overunder_sum = 0.0
     for d in days_sorted:
-        pause_hours = 0.0
-        expected_day_hours = get_working_hours_func(d)
-        actual_day_hours = 0.0
-        special_day_type = None
-
-        for e in days[d]: # type: Entry
-            if "pause" in e.tags:
-                pause_hours += e.duration.total_seconds()/3600.0
-                continue
-            if "off" in e.tags:
-                special_day_type = e.name
-
-            entry_time = e.duration
-            entry_hours = entry_time.total_seconds()/3600.0
-            actual_day_hours += entry_hours
+        if hours is not None:
+            actual_day_hours, pause_hours, overunder, special_day_type = hours[d]
+        else:
+            actual_day_hours, pause_hours, overunder, special_day_type = day_hours(days[d], get_working_hours_func(d))
 
         total_hours += actual_day_hours
-        overunder = actual_day_hours - expected_day_hours
-        if overunder < 0.0:
-            p = pause_hours
-            overunder += p
-            pause_hours -= p
-
         overunder_sum += overunder
 
+        if pause_hours < 1.0 and not special_day_type:
+            result.findings.append(Finding("breaks", d, hours=actual_day_hours, breaks=pause_hours, balance=overunder))
+
+        if not verbose:
+            continue
+
         c = Colour.RED if overunder < 0.0 else Colour.BLUE
         overunder_str = f"{Colour.BOLD}{c}{overunder:>+5.2f}{Colour.END}"
 
         c = Colour.RED if pause_hours < 1.0 else Colour.BLUE
         pause_str = f"{Colour.BOLD}{c}{pause_hours:>5.2f}{Colour.END}"
 
-        result = [dt.strftime(d, '%d.%m.%Y')]
+        line = [dt.strftime(d, '%d.%m.%Y')]
 
         if special_day_type is None:
-            result.append(f"{actual_day_hours:>5.2f}h")
-            result.append(f"breaks: {pause_str}h => +/- {overunder_str}h")
+            line.append(f"{actual_day_hours:>5.2f}h")
+            line.append(f"breaks: {pause_str}h => +/- {overunder_str}h")
         else:
             if special_day_type == "Vacations" or special_day_type == "Holidays":
-                result.append(f"{Colour.GREEN}{Colour.BOLD}is a day off{Colour.END}")
+                line.append(f"{Colour.GREEN}{Colour.BOLD}is a day off{Colour.END}")
             elif special_day_type == "Sick":
-                result.append(f"{Colour.YELLOW}{Colour.BOLD}Hope you got well!{Colour.END}")
+                line.append(f"{Colour.YELLOW}{Colour.BOLD}Hope you got well!{Colour.END}")
 
 
         if pause_hours < 1.0 and not special_day_type:
-            result.append(f"{Colour.BOLD}You need sufficient breaks!{Colour.END}")
+            line.append(f"{Colour.BOLD}You need sufficient breaks!{Colour.END}")
 
-        log.info("; ".join(result))
+        log.info("; ".join(line))
 
-    log.info(mk_headline("Sum of daily hours"))
-    log.info(f" Sum: {total_hours:>6.1f}h")
-    log.info(f" +/- {overunder_sum:>6.1f}h")
+    result.aggregates = {
+        "total_hours": total_hours,
+        "balance": overunder_sum
+    }
 
-    log.info(mk_headline("So..."))
+    if verbose:
+        log.info(mk_headline("Sum of daily hours"))
+        log.info(f" Sum: {total_hours:>6.1f}h")
+        log.info(f" +/- {overunder_sum:>6.1f}h")
+
+        log.info(mk_headline("So..."))
     if overunder_sum < 0.0:
         log.warn("  You have a negative time record in the given period!")
-    elif overunder_sum > 0.0:
+    elif overunder_sum > 0.0 and verbose:
         log.info("  You have worked overtime in the given period!")
 
     return overunder_sum >= 0.0
 
 
+def _continuations(days):
+    """
+    The parts of entries crossing midnight that continue a part of the day before, see
+    :meth:`replan.timezones.DayTable.split`
+
+    :return: The continuing parts by name, id and start
+    :rtype: dict
+    """
+    ends = set()
+    starts = {}
+    for d in days:
+        midnight = None
+        for e in days[d]:
+            ends.add((e.name, e.id, e.end_ts))
+            if midnight is None:
+                midnight = e.zone.midnight(d)
+            if e.start_ts == midnight:
+                starts[(e.name, e.id, e.start_ts)] = e
+    return dict([(k, starts[k]) for k in starts if k in ends])
+
+
 @check("Gaps and overlaps")
-def check_for_gaps_and_overlaps(days):
+def check_for_gaps_and_overlaps(days, result):
+    """
+    Entries split at midnight are checked as a whole on the day they start on: the parts
+    continuing them on the following days are left out and the first part ends where the
+    entry ends
+    """
+    verbose = log.isEnabledFor(logging.WARNING)
     okay = True
+    continued = _continuations(days)
+
+    def end_ts(e):
+        while (e.name, e.id, e.end_ts) in continued:
+            e = continued[(e.name, e.id, e.end_ts)]
+        return e.end_ts
+
     for d in days:
-        items = sorted(days[d], key=lambda x: x.start)
+        items = sorted([e for e in days[d] if (e.name, e.id, e.start_ts) not in continued],
+                       key=lambda x: x.start_ts)
 
         for i, first in enumerate(items[:-1]):
             second = items[i+1]
 
-            if first.start.date() != first.end.date():
-                log.warn(f"    [step] {first.name:<10s} overlaps midnight")
-            if second.start.date() != second.end.date():
-                log.warn(f"    [step] {second.name:<10s} overlaps midnight")
-
-            f_end_str = dt.strftime(first.end.astimezone(pytz.timezone("Europe/Berlin")), "%H:%M:%S")
-            s_start_str = dt.strftime(second.start.astimezone(pytz.timezone("Europe/Berlin")), "%H:%M:%S")
+            for e in (first, second):
+                # An entry ending at midnight ends on the day before
+                if e.day != e.zone.local_day(max(end_ts(e) - 1, e.start_ts)):
+                    result.findings.append(Finding("midnight", d, project=e.name))
+                    if verbose:
+                        log.warn(f"    [step] {e.name:<10s} overlaps midnight")
 
-            diff = second.start - first.end
-            if diff.total_seconds() >= gap_threshold_seconds:
+            end = end_ts(first)
+            diff = second.start_ts - end
+            if diff >= gap_threshold_seconds:
                 stat = "gap"
                 okay = False
-            elif diff.total_seconds() <= -gap_threshold_seconds:
+            elif diff <= -gap_threshold_seconds:
                 stat = "ovl"
                 okay = False
             else:
                 stat = None
 
             if stat:
-                log.warn(f"    [{stat}] {abs(diff.total_seconds()):>8.0f}s; {first.name:10s} and {second.name:10s} on {first.start.date()}: {f_end_str} -> {s_start_str}")
+                result.findings.append(Finding(stat, d, seconds=float(abs(diff)),
+                                               first=first.name, second=second.name))
+                if verbose:
+                    log.warn(f"    [{stat}] {abs(diff):>8d}s; {first.name:10s} and {second.name:10s} on {first.day}: {first.zone.local(end):%H:%M:%S} -> {second.start:%H:%M:%S}")
 
     return okay
 
 
 @check("Completeness")
-def check_for_completeness(days, actual_work_days):
+def check_for_completeness(days, actual_work_days, result):
     okay = True
     for d in actual_work_days:
         if d >= datetime.datetime.today().date():
             break
         if d not in days:
-            log.warn(f"Workday {dt.strftime(d, '%d.%m.%Y')} has no entry")
+            result.findings.append(Finding("missing", d))
+            if log.isEnabledFor(logging.WARNING):
+                log.warn(f"Workday {dt.strftime(d, '%d.%m.%Y')} has no entry")
             okay = False
     return okay
 
 
 @check("Weekends")
-def check_weekends(days, weekends):
+def check_weekends(days, weekends, result, names=None):
+    """
+    :param names: Project names of the entries of every day, taken from the entries in
+                  ``days`` if None
+    """
     okay = True
     for d in days:
-        at_work_entries = [e.name not in ["Vacations", "Sick"] for e in days[d]]
+        day_names = names[d] if names is not None else [e.name for e in days[d]]
+        at_work_entries = [n not in ["Vacations", "Sick"] for n in day_names]
         if d.weekday()+1 in weekends and any(at_work_entries):
-            log.warn(f"Seems like {dt.strftime(d, '%d.%m.%Y')} is set as a weekend day. Were you really working then?")
-            log.info(f"Entry: {days[d]}")
+            result.findings.append(Finding("weekend", d, projects=day_names))
+            if log.isEnabledFor(logging.WARNING):
+                log.warn(f"Seems like {dt.strftime(d, '%d.%m.%Y')} is set as a weekend day. Were you really working then?")
+                log.info(f"Entry: {days[d] or day_names}")
             okay = False
     return okay
 
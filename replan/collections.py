@@ -1,8 +1,3 @@
-from datetime import timedelta as tdelta
-
-from replan.logging import log
-
-
 class StrictList(list):
     def __init__(self, t):
         super(StrictList,self).__init__()
@@ -16,19 +11,11 @@ class StrictList(list):
         assert isinstance(value, self.type), f"{i} => {value} is not of type {self.type}"
         super(StrictList, self).__setitem__(i, value)
 
+    def __reduce__(self):
+        # The type has to be known before the items are appended again
+        return self.__class__, (self.type,), None, iter(self)
+
 
-# class SmartList(StrictList):
-#     def shrinked(self):
-#         ret = DefaultDict(tdelta(0.0))
-#         for i, u in enumerate(self):
-#             for j, v in enumerate(self):
-#                 if v is u: continue
-#                 log.info(f"Checking {u} == {v}")
-#                 if u.name == v.name:
-#                     ret[u.name] += v.duration
-#         return ret
-#
-#
 class StrictDict(dict):
     def __init__(self, t):
         super(StrictDict,self).__init__()
@@ -38,6 +25,9 @@ class StrictDict(dict):
         assert isinstance(value, self.type), f"{i} => {value} is not of type {self.type}"
         super(StrictDict, self).__setitem__(i, value)
 
+    def __reduce__(self):
+        return self.__class__, (self.type,), None, None, iter(self.items())
+
 
 class DefaultDict(dict):
     def __init__(self, d):
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import pickle
+
+from replan.logging import log
+
+__all__ = ["load_config", "compile_config"]
+
+cache_dir = os.path.expanduser("~/.toggl_summary/cache")
+
+#: Bump whenever the layout of the cached objects changes
+CACHE_VERSION = 2
+
+
+def compile_config(path):
+    """
+    Parses a config file and resolves its holiday calendar and project indexes
+
+    :param path: Path to the YAML config file
+    :return: The compiled config
+    :rtype: replan.yaml_classes.Config
+    """
+    import yaml
+    from replan.yaml_classes import Loader
+
+    with open(path, "r") as f:
+        config = yaml.load(f, Loader=Loader)
+    return config.compile()
+
+
+def _cache_file(path):
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"config-{digest}.pickle")
+
+
+def _cache_key(path):
+    st = os.stat(path)
+    return CACHE_VERSION, path, st.st_mtime_ns, st.st_size
+
+
+def load_config(path, use_cache=True):
+    """
+    Loads a config file, using the compiled cache if the file hasn't changed
+
+    The cache is keyed by the absolute path, the modification time and the size of the
+    config file and holds the compiled :class:`replan.yaml_classes.Config` as a pickle.
+
+    :param path: Path to the YAML config file
+    :param use_cache: Whether to read and write the compiled cache at all
+    :return: The compiled config
+    :rtype: replan.yaml_classes.Config
+    """
+    path = os.path.abspath(path)
+    if not use_cache:
+        return compile_config(path)
+
+    key = _cache_key(path)
+    cache_file = _cache_file(path)
+    try:
+        with open(cache_file, "rb") as f:
+            cached_key, config = pickle.load(f)
+        if cached_key == key:
+            log.debug(f"Using compiled config from {cache_file}")
+            return config
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.debug(f"Ignoring unreadable config cache {cache_file}: {e}")
+
+    config = compile_config(path)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}"
+        with open(tmp_file, "wb") as f:
+            pickle.dump((key, config), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        log.debug(f"Could not write config cache {cache_file}: {e}")
+
+    return config
@@ -0,0 +1,240 @@
+import hmac
+import json
+import os
+import secrets
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from replan.logging import log
+from replan.output import json_default
+
+__all__ = ["WarmState", "serve", "RESOURCES"]
+
+#: What the daemon serves via GET
+RESOURCES = ["summary", "ezve", "checks", "planning", "status"]
+
+
+class WarmState:
+    """
+    Keeps everything a report needs in memory: the config with its project indexes,
+    the working hours calendar, the API client and the fetched entries
+
+    The entries are loaded once and then synced in the background: a sync fetches the
+    entries that may have changed outside of the lock, so requests never wait for the API,
+    and applies only what changed since the last sync, see :class:`replan.watch.Watcher`. Responses are computed
+    once per synced generation.
+    """
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.config = pipeline.get("config")
+        self.api = pipeline.get("api")
+        self.calendar = pipeline.get("calendar")
+        self.rp = None
+        self.watcher = None
+        self.generation = 0
+        self.synced_at = None
+        self._responses = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _check(self):
+        if not self.pipeline.args.no_checks:
+            self.rp.checks()
+
+    def load(self):
+        """
+        Fetches all entries of the period
+        """
+        from replan.resource_planning import ResourcePlanner
+        from replan.watch import Watcher
+
+        with self._sync_lock:
+            started = time.time()
+            rp = ResourcePlanner(self.pipeline.start, self.pipeline.end, config=self.config, api=self.api)
+            rp.bh = self.calendar
+            with self._lock:
+                self.rp = rp
+                self.watcher = Watcher(rp)
+                self.watcher.load()
+                self._check()
+                self.generation += 1
+                self.synced_at = time.time()
+                self._responses = {}
+            log.info(f"Loaded generation {self.generation} in {self.synced_at - started:.2f}s")
+
+    def sync(self):
+        """
+        Applies the entries that changed since the last sync
+
+        :return: The days that changed
+        :rtype: set
+        """
+        with self._sync_lock:
+            started = time.time()
+            versions, window = self.watcher.fetch()
+            with self._lock:
+                days = self.watcher.apply(versions, window)
+                self.synced_at = time.time()
+                if days:
+                    self._check()
+                    self.generation += 1
+                    self._responses = {}
+            if days:
+                log.info(f"Synced generation {self.generation} with {len(days)} changed days "
+                         f"in {self.synced_at - started:.2f}s")
+            return days
+
+    def response(self, what):
+        """
+        :param what: One of :data:`RESOURCES`
+        :return: The JSON encoded response
+        :rtype: bytes
+        """
+        if what not in RESOURCES:
+            raise ValueError(f"Unknown resource {what}")
+
+        with self._lock:
+            if what == "status":
+                return json.dumps({"generation": self.generation, "synced_at": self.synced_at,
+                                   "start": self.pipeline.start, "end": self.pipeline.end},
+                                  default=json_default).encode("utf-8")
+            cached = self._responses.get(what)
+            if cached is not None:
+                return cached
+
+            # Computed under the lock, so that a sync doesn't change the days meanwhile
+            rp = self.rp
+            if what == "summary":
+                data = rp.calc_results()
+            elif what == "ezve":
+                data = rp.ezve_records()
+            elif what == "checks":
+                data = [r.as_dict() for r in getattr(rp, "check_results", [])]
+            else:
+                data = rp.planning_record()
+            body = self._responses[what] = json.dumps(data, default=json_default).encode("utf-8")
+            return body
+
+    def add(self, project, description, tags, date_start, date_end):
+        with self._lock:
+            rp, watcher = self.rp, self.watcher
+        rp.add(project, description, tags, date_start, date_end)
+        watcher.touch(date_start.date())
+        threading.Thread(target=self.sync, daemon=True).start()
+
+    def run_sync_loop(self, interval):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sync()
+                except Exception as e:
+                    log.error(f"Sync failed: {e}")
+        threading.Thread(target=loop, daemon=True).start()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    state = None  # type: WarmState
+    #: Token POST requests have to send in the X-Replan-Token header, if set
+    token = None
+
+    def _send(self, code, body):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code, msg):
+        self._send(code, json.dumps({"error": msg}).encode("utf-8"))
+
+    def do_GET(self):
+        what = self.path.strip("/").split("?")[0]
+        if what not in RESOURCES:
+            return self._error(404, f"Unknown resource {self.path}")
+        try:
+            self._send(200, self.state.response(what))
+        except Exception as e:
+            log.error(f"GET {self.path} failed: {e}")
+            self._error(500, f"{e.__class__.__name__}: {e}")
+
+    def _authorized(self):
+        # A cross site form can't send JSON or custom headers without a preflight request,
+        # which isn't answered
+        if self.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+            self._error(415, "Content-Type has to be application/json")
+            return False
+        if self.token is not None and not hmac.compare_digest(self.headers.get("X-Replan-Token", ""), self.token):
+            self._error(403, "Missing or wrong X-Replan-Token")
+            return False
+        return True
+
+    def do_POST(self):
+        from replan.resource_planning import parse
+
+        if self.path.strip("/") != "add":
+            return self._error(404, f"Unknown resource {self.path}")
+        if not self._authorized():
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            e = json.loads(self.rfile.read(length))
+            self.state.add(e["project"], e["description"], e.get("tags", ""),
+                           parse(f"{e['date']} {e['start_time']}"), parse(f"{e['date']} {e['end_time']}"))
+            self._send(201, b'{"created": true}')
+        except Exception as e:
+            self._error(400, str(e))
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(pipeline, host="127.0.0.1", port=8765, socket_path=None, interval=300, token=None):
+    """
+    Serves summary, ezve, checks, planning and status as JSON via GET and adds entries
+    via POST to /add, either on a local TCP port or on a Unix socket
+
+    :param interval: Seconds between two background syncs of the entries
+    :param token: Token POST requests have to send in the X-Replan-Token header. On a
+                  TCP port one is generated and logged if None; on a Unix socket the
+                  permissions of the socket file guard it instead.
+    """
+    if token is None and socket_path is None:
+        token = secrets.token_urlsafe(16)
+        log.warn(f"POST requests have to send the header X-Replan-Token: {token}")
+
+    state = WarmState(pipeline)
+    state.load()
+    state.run_sync_loop(interval)
+
+    handler = type("Handler", (RequestHandler,), {"state": state, "token": token})
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, handler)
+        log.info(f"Serving on {socket_path}")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        log.info(f"Serving on http://{host}:{port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
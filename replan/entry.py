@@ -1,18 +1,99 @@
-from datetime import datetime as dt
+from datetime import timedelta as tdelta
 
 from replan.functions import format_td
+from replan.timezones import get_zone
 
 
 class Entry:
-    def __init__(self, name, start, end, duration, tags = None):
-        assert hasattr(start, "time"), "Start of entry must have time information"
-        assert hasattr(end, "time"), "End of entry must have time information"
+    """
+    A time entry; start and end are int epoch seconds, local times are derived from the zone
+    """
+    __slots__ = ("name", "start_ts", "end_ts", "tags", "id", "zone", "merged", "_seconds")
+
+    def __init__(self, name, start, end, tags = None, id = None, zone = None, seconds = None):
+        assert isinstance(start, int) and isinstance(end, int), "Start and end of entry must be epoch seconds"
 
         self.name = name
-        self.start = start
-        self.end = end
-        self.duration = duration
+        self.start_ts = start
+        self.end_ts = end
         self.tags = tags or []
+        self.id = id
+        self.zone = zone or get_zone()
+        self.merged = None
+        self._seconds = seconds
+
+    @property
+    def seconds(self):
+        """
+        Duration in seconds; the sum of the durations of the parts of a compacted entry,
+        see :func:`compact`
+        """
+        if self._seconds is not None:
+            return self._seconds
+        return self.end_ts - self.start_ts
+
+    @property
+    def duration(self):
+        return tdelta(seconds=self.seconds)
+
+    @property
+    def ids(self):
+        """
+        Ids of the Toggl entries this entry stands for, more than one if it was compacted,
+        see :func:`compact`
+        """
+        if self.merged is not None:
+            return self.merged
+        return () if self.id is None else (self.id,)
+
+    @property
+    def start(self):
+        return self.zone.local(self.start_ts)
+
+    @property
+    def end(self):
+        return self.zone.local(self.end_ts)
+
+    @property
+    def day(self):
+        return self.zone.local_day(self.start_ts)
 
     def __repr__(self):
-        return f"{self.name} {dt.strftime(self.start, '%H:%M')} - {dt.strftime(self.end, '%H:%M')} => {format_td(self.duration)} [{', '.join(self.tags)}]"
\ No newline at end of file
+        return f"{self.name} {self.start:%H:%M} - {self.end:%H:%M} => {format_td(self.duration)} [{', '.join(self.tags)}]"
+
+
+def compact(entries, threshold=1):
+    """
+    Merges back to back entries of the same project with the same tags into one entry.
+    Two entries are back to back if the gap or overlap between them is shorter than
+    ``threshold`` seconds, like in :func:`replan.checks.check_for_gaps_and_overlaps`. The
+    merged entry spans both, but its :attr:`Entry.seconds` are the sum of the durations of
+    the parts, so a gap doesn't count as worked time and an overlap counts twice, just like
+    without compacting.
+
+    Takes a single pass over the entries sorted by start. A merged entry keeps the id of
+    its first part and the ids of all parts in :attr:`Entry.merged`.
+
+    :param entries: Entries of one day
+    :return: The compacted entries, sorted by start
+    :rtype: list
+    """
+    ret = []
+    last, copied = None, False
+    for e in sorted(entries, key=lambda x: x.start_ts):
+        if (last is not None and e.name == last.name and abs(e.start_ts - last.end_ts) < threshold
+                and sorted(e.tags) == sorted(last.tags)):
+            if not copied:
+                # The entries passed in stay as they are
+                merged = Entry(last.name, last.start_ts, last.end_ts, list(last.tags), id=last.id, zone=last.zone,
+                               seconds=last.seconds)
+                merged.merged = last.ids
+                last = ret[-1] = merged
+                copied = True
+            last.end_ts = max(last.end_ts, e.end_ts)
+            last.merged = last.merged + e.ids
+            last._seconds += e.seconds
+            continue
+        ret.append(e)
+        last, copied = e, False
+    return ret
@@ -0,0 +1,176 @@
+import datetime
+import os
+
+__all__ = ["EntryIndex", "query", "group_keys"]
+
+#: What query results can be grouped by
+group_keys = ["project", "ccenter", "tag", "day", "month"]
+
+
+class EntryIndex:
+    """
+    Inverted indexes of the records of an archive month: one bitmap per project and one
+    per tag, each with one bit per record
+
+    Filtering by projects and tags is then a few bitwise operations over packed bitmaps
+    instead of a loop testing the tags of every entry.
+    """
+    def __init__(self, size, projects, tags):
+        """
+        :param size: Number of records
+        :param projects: Packed bitmaps by project name
+        :param tags: Packed bitmaps by tag
+        """
+        self.size = size
+        self.projects = projects
+        self.tags = tags
+
+    @classmethod
+    def build(cls, records, names, tag_sets):
+        """
+        :param records: Records of an archive month, see :data:`replan.archive.RECORD`
+        :param names: Project names of the archive
+        :param tag_sets: Tag sets of the archive
+        :rtype: EntryIndex
+        """
+        import numpy as np
+
+        name_column = np.asarray(records["name"])
+        tag_column = np.asarray(records["tags"])
+        projects = dict([(names[i], np.packbits(name_column == i)) for i in np.unique(name_column).tolist()])
+        tags = {}
+        for tag in sorted(set([t for ts in tag_sets for t in ts])):
+            sets = [i for i, ts in enumerate(tag_sets) if tag in ts]
+            tags[tag] = np.packbits(np.isin(tag_column, sets))
+        return cls(len(records), projects, tags)
+
+    def save(self, path):
+        import numpy as np
+
+        nbytes = (self.size + 7) // 8
+        tmp_file = f"{path}.{os.getpid()}"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, size=np.array(self.size),
+                     project_names=np.array(list(self.projects), dtype=str),
+                     project_bitmaps=np.array(list(self.projects.values()), dtype=np.uint8).reshape(-1, nbytes),
+                     tag_names=np.array(list(self.tags), dtype=str),
+                     tag_bitmaps=np.array(list(self.tags.values()), dtype=np.uint8).reshape(-1, nbytes))
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :rtype: EntryIndex
+        """
+        import numpy as np
+
+        with np.load(path, allow_pickle=False) as data:
+            projects = dict(zip(data["project_names"].tolist(), data["project_bitmaps"]))
+            tags = dict(zip(data["tag_names"].tolist(), data["tag_bitmaps"]))
+            return cls(int(data["size"]), projects, tags)
+
+    def _none(self):
+        import numpy as np
+        return np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def all(self):
+        import numpy as np
+        return np.packbits(np.ones(self.size, dtype=bool))
+
+    def select(self, projects=None, tags=(), without=()):
+        """
+        Bitmap of the records of any of the given projects that have all of the given tags
+        and none of the tags in ``without``
+
+        :param projects: Project names, all projects if None
+        :rtype: numpy.ndarray
+        """
+        bitmap = self.all()
+        if projects is not None:
+            of_projects = self._none()
+            for p in projects:
+                if p in self.projects:
+                    of_projects |= self.projects[p]
+            bitmap &= of_projects
+        for t in tags:
+            bitmap &= self.tags.get(t, self._none())
+        for t in without:
+            if t in self.tags:
+                bitmap &= ~self.tags[t]
+        return bitmap
+
+    def mask(self, bitmap):
+        """
+        The bitmap unpacked to a boolean mask over the records
+
+        :rtype: numpy.ndarray
+        """
+        import numpy as np
+        return np.unpackbits(bitmap)[:self.size].astype(bool)
+
+
+def query(archive, first, last, projects=None, tags=(), without=(), by="project", ccenters=None):
+    """
+    Hours and number of entries of the archived entries matching a filter, grouped
+
+    :type archive: replan.archive.EntryArchive
+    :param first: First day of the date range
+    :param last: Last day of the date range
+    :param projects: Project names to include, all if None
+    :param tags: Tags every entry must have
+    :param without: Tags no entry may have
+    :param by: What to group by, one of :data:`group_keys`
+    :param ccenters: Cost center of every project name, needed to group by cost center
+    :return: (hours, entries) by group
+    :rtype: dict
+    """
+    import numpy as np
+
+    if by not in group_keys:
+        raise ValueError(f"Can't group by {by}, only by {', '.join(group_keys)}")
+
+    first, last = [datetime.date(d.year, d.month, d.day) for d in (first, last)]
+    epoch = datetime.date(1970, 1, 1)
+    lo, hi = (first - epoch).days, (last - epoch).days
+    seconds, counts = {}, {}
+
+    def add(keys, values):
+        for k, s, c in zip(keys, *values):
+            seconds[k] = seconds.get(k, 0.0) + s
+            counts[k] = counts.get(k, 0) + c
+
+    for year, month in archive.months():
+        if (year, month) < (first.year, first.month) or (year, month) > (last.year, last.month):
+            continue
+        records = archive.month(year, month)
+        if not len(records):
+            continue
+        index = archive.index(year, month)
+        mask = index.mask(index.select(projects, tags, without))
+        mask &= (records["day"] >= lo) & (records["day"] <= hi)
+        if not mask.any():
+            continue
+
+        durations = (records["end"] - records["start"])[mask].astype(float)
+        if by == "tag":
+            for tag, bitmap in index.tags.items():
+                selected = index.mask(bitmap)[mask]
+                if selected.any():
+                    add([tag], ([durations[selected].sum()], [int(selected.sum())]))
+            continue
+
+        if by in ("project", "ccenter"):
+            column, labels = records["name"][mask], archive.names
+            if by == "ccenter":
+                labels = [(ccenters or {}).get(n) for n in labels]
+        elif by == "day":
+            column = records["day"][mask] - lo
+            labels = [first + datetime.timedelta(days=i) for i in range(hi - lo + 1)]
+        else:
+            column = np.zeros(int(mask.sum()), dtype=np.int64)
+            labels = [f"{year:04d}-{month:02d}"]
+        keys = np.unique(column)
+        per_key = np.bincount(column, weights=durations)[keys], np.bincount(column)[keys]
+        add([labels[k] for k in keys.tolist()], (per_key[0].tolist(), per_key[1].tolist()))
+
+    return dict([(k, (seconds[k] / 3600., counts[k])) for k in seconds])
@@ -0,0 +1,157 @@
+import datetime
+import os
+import pickle
+from array import array
+from bisect import bisect_left
+from calendar import monthrange
+
+__all__ = ["EzveMatrix"]
+
+#: Bump whenever the layout of saved matrices changes
+MATRIX_VERSION = 1
+
+
+class EzveMatrix:
+    """
+    Sparse (user x day x ccenter) matrix of the daily EZVE distributions of a team
+
+    Every non-zero cell is stored once in parallel arrays sorted by day, so that the
+    cells of a period are a contiguous slice found by binary search. Fractions are
+    stored as shares of the day, i.e. 0.5 for 50%.
+    """
+    def __init__(self):
+        self.users = []
+        self.ccenters = []
+        self._user_index = {}
+        self._ccenter_index = {}
+        self.user = array("i")
+        self.day = array("i")
+        self.ccenter = array("i")
+        self.fraction = array("d")
+
+    def _index_of(self, value, values, index):
+        i = index.get(value)
+        if i is None:
+            i = index[value] = len(values)
+            values.append(value)
+        return i
+
+    def add(self, user, ezve):
+        """
+        Adds the EZVE records of a user
+
+        :param user: Name of the user
+        :param ezve: Iterable of (date, ccenter, percent) tuples
+        """
+        u = self._index_of(user, self.users, self._user_index)
+        for d, cc, percent in ezve:
+            self.user.append(u)
+            self.day.append(d.toordinal())
+            self.ccenter.append(self._index_of(int(cc), self.ccenters, self._ccenter_index))
+            self.fraction.append(percent / 100.)
+        return self
+
+    def freeze(self):
+        """
+        Sorts the cells by day; has to be called after adding records and before querying
+        """
+        order = sorted(range(len(self.day)), key=self.day.__getitem__)
+        for name in ("user", "day", "ccenter", "fraction"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, [column[i] for i in order]))
+        return self
+
+    def _cells(self, start=None, end=None):
+        lo = 0 if start is None else bisect_left(self.day, start.toordinal())
+        hi = len(self.day) if end is None else bisect_left(self.day, end.toordinal() + 1)
+        return range(lo, hi)
+
+    def _month(self, year, month):
+        if year is None or month is None:
+            return None, None
+        _, last = monthrange(year, month)
+        return datetime.date(year, month, 1), datetime.date(year, month, last)
+
+    def person_days(self, year=None, month=None):
+        """
+        Booked days per cost center, each day of each person counting 1 in total
+
+        :rtype: dict
+        """
+        ret = {}
+        for i in self._cells(*self._month(year, month)):
+            cc = self.ccenters[self.ccenter[i]]
+            ret[cc] = ret.get(cc, 0.0) + self.fraction[i]
+        return ret
+
+    def fte(self, year, month, workdays=None):
+        """
+        Full time equivalents per cost center in a month
+
+        :param workdays: Number of workdays of the month; defaults to the number of
+                         distinct days anyone of the team booked on
+        :rtype: dict
+        """
+        cells = self._cells(*self._month(year, month))
+        if workdays is None:
+            workdays = len(set([self.day[i] for i in cells]))
+        if not workdays:
+            return {}
+        days = self.person_days(year, month)
+        return dict([(cc, days[cc] / workdays) for cc in days])
+
+    def people(self, ccenter, year=None, month=None):
+        """
+        Who booked how many days to a cost center
+
+        :rtype: dict
+        """
+        c = self._ccenter_index.get(int(ccenter))
+        ret = {}
+        if c is None:
+            return ret
+        for i in self._cells(*self._month(year, month)):
+            if self.ccenter[i] == c:
+                u = self.users[self.user[i]]
+                ret[u] = ret.get(u, 0.0) + self.fraction[i]
+        return ret
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump((MATRIX_VERSION, self.users, self.ccenters,
+                         self.user, self.day, self.ccenter, self.fraction), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            version, users, ccenters, user, day, ccenter, fraction = pickle.load(f)
+        assert version == MATRIX_VERSION, f"{path} has been written by an incompatible version"
+        m = cls()
+        m.users, m.ccenters = users, ccenters
+        m._user_index = dict([(u, i) for i, u in enumerate(users)])
+        m._ccenter_index = dict([(c, i) for i, c in enumerate(ccenters)])
+        m.user, m.day, m.ccenter, m.fraction = user, day, ccenter, fraction
+        return m
+
+    @classmethod
+    def from_ezve_files(cls, directory, suffix=".ezve.tsv", users=None):
+        """
+        Builds the matrix from the per user EZVE files a team run wrote
+
+        :param directory: Directory with ``<user>.ezve.tsv`` files
+        :param users: Only the files of these users, e.g. the ones of the last run; all
+                      files in the directory if None
+        """
+        m = cls()
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(suffix):
+                continue
+            if users is not None and name[:-len(suffix)] not in users:
+                continue
+            records = []
+            with open(os.path.join(directory, name), "r") as f:
+                for line in f:
+                    year, month, day, cc, percent = line.split("\t")
+                    records.append((datetime.date(int(year), int(month), int(day)), int(cc), float(percent)))
+            m.add(name[:-len(suffix)], records)
+        return m.freeze()
@@ -0,0 +1,354 @@
+import base64
+import datetime
+import json
+import re
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from replan.logging import log
+
+__all__ = ["FakeToggl", "FakeTogglAdapter", "serve"]
+
+
+def _iso(d):
+    return d.replace(tzinfo=datetime.timezone.utc).isoformat()
+
+
+def _parse_time(s):
+    from dateutil.parser import parse
+
+    d = parse(s)
+    if d.tzinfo is not None:
+        d = d.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return d
+
+
+class HttpError(Exception):
+    def __init__(self, status, msg):
+        super().__init__(msg)
+        self.status = status
+
+
+class FakeToggl:
+    """
+    Stand-in for the Toggl API serving a :class:`replan.synthetic.SyntheticAccount`
+
+    Implements the parts of API v8 the client uses (user, workspaces, projects and time
+    entries, including creating, updating and deleting entries, and tags) and the detailed
+    report, which is paged like the real one, and the weekly report of the reports API v2.
+    The weekly report groups by the local days of the default zone, see
+    :func:`replan.timezones.get_zone`.
+
+    :param latency: Seconds every request takes
+    :param rate_limit: Requests per second and API token before requests are answered with
+                       429, unlimited if None
+    :param page_size: Entries per page of the detailed report
+    :param max_entries: Maximum number of entries the time entries endpoint returns
+    """
+    def __init__(self, account, latency=0.0, rate_limit=None, page_size=50, max_entries=1000):
+        self.account = account
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.page_size = page_size
+        self.max_entries = max_entries
+        self.requests = 0
+        self.throttled = 0
+        self._sorted = None
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._routes = [
+            ("GET", r"/api/v8/me", self.me),
+            ("GET", r"/api/v8/workspaces", self.workspaces),
+            ("GET", r"/api/v8/workspaces/(\d+)", self.workspace),
+            ("GET", r"/api/v8/workspaces/(\d+)/projects", self.projects),
+            ("GET", r"/api/v8/workspaces/(\d+)/tags", self.tags),
+            ("GET", r"/api/v8/projects/(\d+)", self.project),
+            ("GET", r"/api/v8/time_entries", self.time_entries),
+            ("POST", r"/api/v8/time_entries", self.create_time_entry),
+            ("GET", r"/api/v8/time_entries/(\d+)", self.time_entry),
+            ("PUT", r"/api/v8/time_entries/(\d+)", self.update_time_entry),
+            ("DELETE", r"/api/v8/time_entries/(\d+)", self.delete_time_entry),
+            ("GET", r"/reports/api/v2/details", self.details),
+            ("GET", r"/reports/api/v2/weekly", self.weekly),
+        ]
+        self._routes = [(m, re.compile(p + "/?$"), f) for m, p, f in self._routes]
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Generates the account from the ``fake`` section of a config's api settings, see
+        the fake_toggl sub command
+
+        :rtype: FakeToggl
+        """
+        from replan.synthetic import SyntheticAccount
+
+        account = SyntheticAccount(years=settings.get("years", [2018]),
+                                   workspaces=settings.get("workspaces", 1),
+                                   projects=settings.get("projects", 6),
+                                   entries_per_day=settings.get("entries_per_day", 4),
+                                   seed=settings.get("seed", 1))
+        return cls(account, latency=settings.get("latency", 0.0), rate_limit=settings.get("rate_limit"),
+                   page_size=settings.get("page_size", 50))
+
+    def _throttle(self, token):
+        if self.rate_limit is None:
+            return False
+        second = int(time.monotonic())
+        with self._lock:
+            window, count = self._windows.get(token, (second, 0))
+            if window != second:
+                window, count = second, 0
+            self._windows[token] = (window, count + 1)
+            return count >= self.rate_limit
+
+    def handle(self, method, url, headers, body):
+        """
+        :return: Status, headers and body of the response
+        :rtype: (int, dict, bytes)
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+
+        auth = headers.get("Authorization", "")
+        if not auth.startswith("Basic "):
+            return self._json(403, {"error": "Authorization required"})
+        token = base64.b64decode(auth[6:]).decode("utf-8").split(":")[0]
+        if self._throttle(token):
+            with self._lock:
+                self.throttled += 1
+            return 429, {"Retry-After": "1", "Content-Type": "text/plain"}, b"Too many requests"
+
+        parts = urlsplit(url)
+        query = dict([(k, v[0]) for k, v in parse_qs(parts.query).items()])
+        for m, pattern, func in self._routes:
+            match = pattern.match(parts.path)
+            if match is None or m != method:
+                continue
+            try:
+                data = json.loads(body) if body else None
+                return self._json(200, func(*[int(g) for g in match.groups()], query=query, data=data))
+            except HttpError as e:
+                return self._json(e.status, {"error": str(e)})
+            except (KeyError, ValueError) as e:
+                return self._json(400, {"error": f"{e.__class__.__name__}: {e}"})
+        return self._json(404, {"error": f"No route for {method} {parts.path}"})
+
+    def _json(self, status, data):
+        return status, {"Content-Type": "application/json"}, json.dumps(data).encode("utf-8")
+
+    def _entry(self, id):
+        for entries in self.account.by_project.values():
+            for e in entries:
+                if e["id"] == id:
+                    return e
+        raise HttpError(404, f"Time entry {id} not found")
+
+    def _v8_entry(self, e):
+        return {"id": e["id"], "wid": e["wid"], "pid": e["pid"], "billable": False,
+                "start": _iso(e["start"]), "stop": _iso(e["stop"]), "duration": e["duration"],
+                "description": e["description"], "tags": e["tags"], "at": _iso(e["at"])}
+
+    def _v8_project(self, p):
+        return {"id": p["id"], "wid": p["wid"], "name": p["name"], "active": True}
+
+    def me(self, query, data):
+        return {"data": {"id": 1, "fullname": "Synthetic User", "default_wid": self.account.workspaces[0]["id"],
+                         "workspaces": self.account.workspaces}}
+
+    def workspaces(self, query, data):
+        return self.account.workspaces
+
+    def workspace(self, wid, query, data):
+        for ws in self.account.workspaces:
+            if ws["id"] == wid:
+                return {"data": ws}
+        raise HttpError(404, f"Workspace {wid} not found")
+
+    def projects(self, wid, query, data):
+        return [self._v8_project(p) for p in self.account.projects if p["wid"] == wid]
+
+    def _tag_ids(self, wid):
+        names = sorted(set([t for e in self.account.entries if e["wid"] == wid for t in e["tags"]]))
+        return dict([(n, wid * 1000 + i + 1) for i, n in enumerate(names)])
+
+    def tags(self, wid, query, data):
+        return [{"id": i, "wid": wid, "name": n} for n, i in self._tag_ids(wid).items()]
+
+    def project(self, pid, query, data):
+        for p in self.account.projects:
+            if p["id"] == pid:
+                return {"data": self._v8_project(p)}
+        raise HttpError(404, f"Project {pid} not found")
+
+    def _in_range(self, query, start_key, end_key):
+        start = _parse_time(query[start_key]) if start_key in query else None
+        end = _parse_time(query[end_key]) if end_key in query else None
+        if end is not None and len(query[end_key]) == 10:
+            # A plain date includes the whole day
+            end += datetime.timedelta(days=1, microseconds=-1)
+        if self._sorted is None:
+            self._sorted = sorted(self.account.entries, key=lambda x: x["start"])
+        for e in self._sorted:
+            if start is not None and e["start"] < start:
+                continue
+            if end is not None and e["start"] > end:
+                continue
+            yield e
+
+    def time_entries(self, query, data):
+        if "start_date" not in query:
+            # Toggl returns the entries of the last nine days without a start date
+            last = max([e["start"] for e in self.account.entries])
+            query["start_date"] = (last - datetime.timedelta(days=9)).isoformat()
+        entries = list(self._in_range(query, "start_date", "end_date"))
+        return [self._v8_entry(e) for e in entries[:self.max_entries]]
+
+    def time_entry(self, id, query, data):
+        return {"data": self._v8_entry(self._entry(id))}
+
+    def create_time_entry(self, query, data):
+        self._sorted = None
+        return {"data": self._v8_entry(self.account.create_entry(data["time_entry"]))}
+
+    def update_time_entry(self, id, query, data):
+        e = self._entry(id)
+        self._sorted = None
+        te = data["time_entry"]
+        for key in ("description", "tags"):
+            if key in te:
+                e[key] = te[key]
+        if "start" in te:
+            e["start"] = _parse_time(te["start"])
+        if "stop" in te:
+            e["stop"] = _parse_time(te["stop"])
+        if "duration" in te and "stop" not in te:
+            e["stop"] = e["start"] + datetime.timedelta(seconds=te["duration"])
+        e["duration"] = int((e["stop"] - e["start"]).total_seconds())
+        e["at"] = datetime.datetime.utcnow()
+        return {"data": self._v8_entry(e)}
+
+    def delete_time_entry(self, id, query, data):
+        e = self._entry(id)
+        self._sorted = None
+        self.account.by_project[e["pid"]].remove(e)
+        return [id]
+
+    def details(self, query, data):
+        wid = int(query["workspace_id"])
+        page = int(query.get("page", 1))
+        projects = dict([(p["id"], p["name"]) for p in self.account.projects])
+        pids = set([int(p) for p in query["project_ids"].split(",")]) if "project_ids" in query else None
+        entries = [e for e in self._in_range(query, "since", "until")
+                   if e["wid"] == wid and (pids is None or e["pid"] in pids)]
+        first = (page - 1) * self.page_size
+        return {
+            "total_count": len(entries),
+            "per_page": self.page_size,
+            "data": [{"id": e["id"], "pid": e["pid"], "project": projects[e["pid"]], "description": e["description"],
+                      "start": _iso(e["start"]), "end": _iso(e["stop"]), "dur": e["duration"] * 1000,
+                      "tags": e["tags"], "updated": _iso(e["at"])}
+                     for e in entries[first:first + self.page_size]]
+        }
+
+    def weekly(self, query, data):
+        from replan.timezones import epoch, get_zone
+
+        wid = int(query["workspace_id"])
+        zone = get_zone()
+        since = datetime.datetime.strptime(query["since"][:10], "%Y-%m-%d").date()
+        projects = dict([(p["id"], p["name"]) for p in self.account.projects])
+        tag_ids = set([int(t) for t in query["tag_ids"].split(",")]) if "tag_ids" in query else None
+        ids = self._tag_ids(wid)
+
+        rows = {}
+        for e in self.account.entries:
+            if e["wid"] != wid:
+                continue
+            i = (zone.local_day(epoch(e["start"])) - since).days
+            if not 0 <= i < 7:
+                continue
+            if tag_ids is not None:
+                entry_ids = set([ids[t] for t in e["tags"]]) or set([0])
+                if not entry_ids & tag_ids:
+                    continue
+            totals = rows.setdefault(e["pid"], [None] * 8)
+            totals[i] = (totals[i] or 0) + e["duration"] * 1000
+            totals[7] = (totals[7] or 0) + e["duration"] * 1000
+
+        week_totals = [sum([r[i] or 0 for r in rows.values()]) or None for i in range(8)]
+        return {
+            "total_grand": week_totals[7],
+            "week_totals": week_totals,
+            "data": [{"title": {"project": projects[pid], "client": None}, "pid": pid, "totals": totals}
+                     for pid, totals in sorted(rows.items())]
+        }
+
+
+class FakeTogglAdapter:
+    """
+    In-process transport for requests answering every request with :class:`FakeToggl`,
+    whatever host it is sent to. Mount it on a session or hand it to a
+    :class:`replan.api_client.ThrottledAdapter` as its transport.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    def send(self, request, **kwargs):
+        import requests
+        from requests.structures import CaseInsensitiveDict
+
+        body = request.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        status, headers, content = self.app.handle(request.method, request.url, request.headers, body)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "OK" if status < 400 else "Error"
+        return response
+
+    def close(self):
+        pass
+
+
+def serve(app, host="127.0.0.1", port=8766):
+    """
+    Serves a :class:`FakeToggl` over HTTP until interrupted
+    """
+    from http.server import BaseHTTPRequestHandler
+    from replan.daemon import ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def _handle(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else None
+            status, headers, content = app.handle(self.command, self.path, self.headers, body)
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+        def log_message(self, format, *args):
+            log.debug(format, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    log.info(f"Serving a fake Toggl on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,4 +1,5 @@
 from datetime import timedelta as tdelta
+from functools import lru_cache
 import datetime
 
 
@@ -36,6 +37,7 @@ def format_td(td):
     return f"{dh:02d}:{dm:02d}"
 
 
+@lru_cache(maxsize=None)
 def mk_headline(msg = "", sgn = "-", l = 90, indent = 3):
     h = [sgn]*l
     if msg != "":
@@ -1,6 +1,22 @@
+import atexit
 import logging
 
-from resource_logging import RainbowLoggingHandler
+from resource_logging import RainbowLoggingHandler, queued
 
 log = logging.getLogger(__name__)
-hdl = RainbowLoggingHandler()
\ No newline at end of file
+hdl = RainbowLoggingHandler()
+
+
+def enable_async_output():
+    """
+    Hands the log output over to a background thread. Log lines may then
+    interleave differently with plain prints.
+
+    :return: The listener writing the queued records
+    :rtype: logging.handlers.QueueListener
+    """
+    qhdl, listener = queued(hdl)
+    log.removeHandler(hdl)
+    log.addHandler(qhdl)
+    atexit.register(listener.stop)
+    return listener
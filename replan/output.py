@@ -0,0 +1,54 @@
+import datetime
+import json
+import sys
+
+__all__ = ["Report", "formats", "json_default"]
+
+formats = ["text", "json", "ndjson"]
+
+
+def json_default(o):
+    if isinstance(o, (datetime.date, datetime.datetime)):
+        return o.isoformat()
+    if hasattr(o, "as_dict"):
+        return o.as_dict()
+    raise TypeError(f"{o!r} is not JSON serializable")
+
+
+class Report:
+    """
+    Machine readable output of a run
+
+    Sections are added from the computed data, not from what has been logged. With
+    ``json`` the sections are collected and written as a single object on :meth:`close`,
+    with ``ndjson`` every record is written as a line of its own right away, tagged with
+    its section.
+    """
+    def __init__(self, fmt, stream=None):
+        assert fmt in formats, f"Unknown output format {fmt}"
+        self.format = fmt
+        self.stream = stream or sys.stdout
+        self.sections = {}
+
+    @property
+    def structured(self):
+        return self.format != "text"
+
+    def add(self, section, data):
+        """
+        :param section: Name of the section, e.g. summary or ezve
+        :param data: A record (dict) or a list of records
+        """
+        if self.format == "json":
+            self.sections[section] = data
+        elif self.format == "ndjson":
+            records = data if isinstance(data, list) else [data]
+            for r in records:
+                self.stream.write(json.dumps(dict(section=section, **r), default=json_default))
+                self.stream.write("\n")
+
+    def close(self):
+        if self.format == "json":
+            json.dump(self.sections, self.stream, default=json_default)
+            self.stream.write("\n")
+        self.stream.flush()
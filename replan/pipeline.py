@@ -0,0 +1,173 @@
+from replan.logging import log
+from replan.output import Report
+from replan.profiling import profiler
+
+
+class Stage:
+    def __init__(self, name, func, depends):
+        self.name = name
+        self.func = func
+        self.depends = depends
+
+
+def stage(*depends):
+    """
+    Marks a method of a :class:`Pipeline` as a stage
+
+    :param depends: Names of the stages that have to be built before this one, or functions
+                    of the pipeline returning such a name or None if there's nothing to build
+    """
+    def wrap(func):
+        func.stage = Stage(func.__name__, func, depends)
+        return func
+    return wrap
+
+
+class Pipeline:
+    """
+    The stages of a single run, each built lazily on first use
+
+    A stage is built at most once; its dependencies are built before it. Sub commands
+    only declare the stages they need (see :func:`needs`) so that e.g. adding an entry
+    doesn't fetch and check a whole month of time entries first.
+    """
+    def __init__(self, args, start, end):
+        self.args = args
+        self.start = start
+        self.end = end
+        self._built = {}
+        self.report = Report(getattr(args, "format", "text"))
+        # Whether the command needs the single entries, see :func:`needs`
+        self.entries = True
+
+    @classmethod
+    def stages(cls):
+        return dict([(s.stage.name, s.stage) for s in vars(cls).values() if hasattr(s, "stage")])
+
+    def get(self, name):
+        if name not in self._built:
+            st = self.stages().get(name)
+            if st is None:
+                raise ValueError(f"Unknown stage {name}")
+            for d in st.depends:
+                d = d(self) if callable(d) else d
+                if d is not None:
+                    self.get(d)
+            log.debug(f"Building stage {name}")
+            with profiler.measure(f"stage {name}"):
+                self._built[name] = st.func(self)
+        return self._built[name]
+
+    def require(self, *names):
+        for name in names:
+            self.get(name)
+
+    def is_built(self, name):
+        return name in self._built
+
+    @property
+    def totals_only(self):
+        """
+        Whether the totals of the reports API are enough: the command doesn't need the
+        entries and neither do the checks
+        """
+        return not self.entries and self.args.no_checks and not getattr(self.args, "full_fetch", False)
+
+    @stage()
+    def config(self):
+        from replan.config_cache import load_config
+        from replan.timezones import set_default_zone
+        config = load_config(self.args.config, use_cache=not self.args.no_config_cache)
+        set_default_zone(config.settings.get("timezone"))
+        return config
+
+    @stage("config")
+    def planner(self):
+        from replan.resource_planning import ResourcePlanner
+        return ResourcePlanner(self.start, self.end, config=self.get("config"),
+                               streaming=getattr(self.args, "streaming", False) or self.totals_only)
+
+    @stage("planner")
+    def api(self):
+        return self.get("planner").api
+
+    @stage("planner")
+    def calendar(self):
+        self.get("planner").log_header()
+        return self.get("planner").bh
+
+    @stage("api", "calendar")
+    def fetch(self):
+        if self.totals_only:
+            return self.get("planner").fetch_totals()
+        if self.get("planner").totals is not None:
+            return self.get("planner").fold_entries()
+        return self.get("planner").collect_entries()
+
+    @stage("fetch")
+    def days(self):
+        if self.get("planner").totals is not None:
+            # Already folded into the totals while fetching
+            return self.get("fetch")
+        return self.get("planner").bucket_entries(self.get("fetch"))
+
+    @stage("days")
+    def compact(self):
+        if self.get("planner").totals is not None or not getattr(self.args, "compact", False):
+            return self.get("days")
+        return self.get("planner").compact_days()
+
+    def _entries(self):
+        # A snapshot holds the days with the holidays already applied, nothing is fetched
+        return None if getattr(self.args, "from_snapshot", None) else "compact"
+
+    @stage("calendar", _entries)
+    def holidays(self):
+        snapshot = getattr(self.args, "from_snapshot", None)
+        if snapshot:
+            return self.get("planner").restore(snapshot, compacted=getattr(self.args, "compact", False))
+        self.get("planner").apply_holidays()
+        if self.get("planner").totals is not None:
+            return self.get("planner").totals
+        return self.get("planner").days
+
+    @stage("config")
+    def rollups(self):
+        from replan.rollups import RollupStore
+        return RollupStore.for_config(self.get("config"))
+
+    @stage("rollups", "calendar")
+    def forecast(self):
+        return self.get("planner").forecast(self.get("rollups"))
+
+    @stage("holidays")
+    def checks(self):
+        if self.args.no_checks:
+            return None
+        results = self.get("planner").checks()
+        if self.report.structured:
+            self.report.add("checks", [r.as_dict() for r in results])
+        elif self.args.quiet:
+            for r in results:
+                print(r)
+        return results
+
+
+def needs(*stages, entries=True):
+    """
+    Declares the pipeline stages a sub command needs before it can run
+
+    :param entries: Whether the command needs the single entries or gets along with the
+                    totals per day, project and tag class
+    """
+    def wrap(func):
+        def wrapper(self, *args, **kwargs):
+            self.pipeline.entries = entries
+            self.pipeline.require(*stages)
+            with profiler.measure(f"command {func.__name__}"):
+                return func(self, *args, **kwargs)
+        wrapper.stages = stages
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return wrap
@@ -0,0 +1,130 @@
+import functools
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+__all__ = ["Profiler", "profiler", "profiled"]
+
+
+class Timing:
+    """
+    What has been measured for a stage, summed over all of its calls
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "calls": self.calls,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "peak_memory": self.peak
+        }
+
+
+class Profiler:
+    """
+    Measures wall and CPU time, call counts and the peak of traced memory of stages
+
+    The peak memory is the peak of traced memory above what was allocated when the
+    stage started. Before Python 3.9 the peak can't be reset, so it's the peak of the
+    whole run up to the end of the stage instead.
+
+    Stages may be nested, e.g. a single check within the checks stage; times of nested
+    stages are included in the times of the outer ones. With a ``cprofile_dir`` the
+    outermost stages are additionally run under cProfile and written to
+    ``<cprofile_dir>/<stage>.prof``.
+
+    As long as it isn't enabled, nothing is measured.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.cprofile_dir = None
+        self.timings = {}
+        self._stack = []
+
+    def enable(self, cprofile_dir=None):
+        self.enabled = True
+        self.cprofile_dir = cprofile_dir
+        if cprofile_dir is not None:
+            os.makedirs(cprofile_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def measure(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = self.timings[name] = Timing(name)
+
+        prof = None
+        if self.cprofile_dir is not None and not self._stack:
+            import cProfile
+            prof = cProfile.Profile()
+
+        base, _ = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        frame = [base, 0]
+        self._stack.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        if prof is not None:
+            prof.enable()
+        try:
+            yield
+        finally:
+            if prof is not None:
+                prof.disable()
+            timing.wall += time.perf_counter() - wall
+            timing.cpu += time.process_time() - cpu
+            timing.calls += 1
+            self._stack.pop()
+
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, frame[1])
+            timing.peak = max(timing.peak, peak - base)
+            if self._stack:
+                # The peak is reset when a stage starts, so the outer stage has to learn of
+                # the peak of the inner one
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+
+            if prof is not None:
+                prof.dump_stats(os.path.join(self.cprofile_dir, f"{name.replace(' ', '_').replace('/', '_')}.prof"))
+
+    def records(self):
+        return [t.as_dict() for t in self.timings.values()]
+
+    def output(self, stream):
+        stream.write(f"{'Stage':<40s} {'Calls':>6s} {'Wall [s]':>10s} {'CPU [s]':>10s} {'Peak [KiB]':>11s}\n")
+        for t in self.timings.values():
+            stream.write(f"{t.name:<40s} {t.calls:>6d} {t.wall:>10.4f} {t.cpu:>10.4f} {t.peak / 1024.:>11.1f}\n")
+        stream.flush()
+
+
+#: The profiler of the current run
+profiler = Profiler()
+
+
+def profiled(name):
+    """
+    Measures every call of the decorated function as stage ``name``
+    """
+    def wrap(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with profiler.measure(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return wrap
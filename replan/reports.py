@@ -0,0 +1,150 @@
+import datetime
+
+from replan.aggregation import WORK, PAUSE, POSTPONED, OFF
+from replan.logging import log
+
+__all__ = ["ReportsClient", "ReportsError", "fold_weekly", "API_URL", "REPORTS_URL"]
+
+API_URL = "https://api.track.toggl.com/api/v8"
+REPORTS_URL = "https://api.track.toggl.com/reports/api/v2"
+
+#: Tags of the tag classes in the order of their precedence, see
+#: :func:`replan.aggregation.tag_class`
+CLASS_TAGS = [(PAUSE, ["pause"]), (POSTPONED, ["distribute", "overhead"]), (OFF, ["off"])]
+
+
+class ReportsError(Exception):
+    pass
+
+
+class ReportsClient:
+    """
+    Reads aggregated data from the reports API instead of every single time entry
+
+    :param session: Session to send the requests with, see :func:`replan.api_client.make_session`
+    :param api_key: API token of the user
+    """
+    def __init__(self, session, api_key, api_url=API_URL, reports_url=REPORTS_URL):
+        self.session = session
+        self.api_key = api_key
+        self.api_url = api_url.rstrip("/")
+        self.reports_url = reports_url.rstrip("/")
+
+    def _get(self, url, params=None):
+        import requests
+
+        try:
+            response = self.session.get(url, params=params, auth=(self.api_key, "api_token"))
+        except requests.RequestException as e:
+            raise ReportsError(f"GET {url} failed: {e}")
+        if response.status_code != 200:
+            raise ReportsError(f"GET {url} answered {response.status_code}: {response.text[:200]}")
+        try:
+            return response.json()
+        except ValueError:
+            raise ReportsError(f"GET {url} didn't answer with JSON")
+
+    def tags(self, wid):
+        """
+        Ids of the tags of a workspace by lower case name
+
+        :rtype: dict
+        """
+        ret = {}
+        for t in self._get(f"{self.api_url}/workspaces/{wid}/tags") or []:
+            ret.setdefault(t["name"].lower(), []).append(t["id"])
+        return ret
+
+    def projects(self, wid):
+        """
+        Names of the projects of a workspace by id
+
+        :rtype: dict
+        """
+        return dict([(p["id"], p["name"]) for p in self._get(f"{self.api_url}/workspaces/{wid}/projects") or []])
+
+    def time_entries(self, start, end):
+        """
+        Time entries of the user starting in the given range, in all workspaces, as the
+        API v8 returns them
+
+        :param start: Aware datetime
+        :param end: Aware datetime
+        :rtype: list
+        """
+        params = {"start_date": start.isoformat(), "end_date": end.isoformat()}
+        return self._get(f"{self.api_url}/time_entries", params) or []
+
+    def weekly(self, wid, since, tag_ids=None):
+        """
+        Seconds per project of the seven days from ``since`` on, in the time zone of the user
+
+        :param tag_ids: Only entries with any of these tags
+        :return: Seconds of every day by project name
+        :rtype: dict
+        """
+        params = {"workspace_id": wid, "since": since.isoformat(), "grouping": "projects",
+                  "calculate": "time", "user_agent": "replan"}
+        if tag_ids is not None:
+            params["tag_ids"] = ",".join([str(t) for t in tag_ids])
+        ret = {}
+        for row in self._get(f"{self.reports_url}/weekly", params).get("data", []):
+            name = (row.get("title") or {}).get("project")
+            if name is None:
+                # Entries without a project are skipped when fetching entries, too
+                continue
+            ret[name] = [(ms or 0) / 1000. for ms in row["totals"][:7]]
+        return ret
+
+
+def fold_weekly(client, wid, totals):
+    """
+    Folds the seconds per day and project of a workspace into the totals per tag class,
+    one week at a time
+
+    The reports API filters by tags but doesn't group by them. Entries with any of the
+    tags of the first classes are requested with growing tag filters, so every class is the
+    difference of two filters and each entry counts in the first class it has a tag of,
+    just like :func:`replan.aggregation.tag_class`. Entries crossing midnight count on the
+    day they start on, unlike when fetching the entries.
+
+    :type client: ReportsClient
+    :type totals: replan.aggregation.DayTotals
+    :return: Number of requests sent
+    :rtype: int
+    """
+    tags = client.tags(wid)
+    filters, tag_ids = [], []
+    for cls, names in CLASS_TAGS:
+        ids = [i for n in names for i in tags.get(n, [])]
+        tag_ids += ids
+        if ids:
+            filters.append((cls, list(tag_ids)))
+
+    requests = 1
+    last = totals.day(totals.ndays - 1)
+    since = totals.first
+    while since <= last:
+        seconds = client.weekly(wid, since)
+        before = dict([(n, [0.0] * 7) for n in seconds])
+        # Nothing to split in a week without time
+        for cls, ids in filters if seconds else []:
+            week = client.weekly(wid, since, ids)
+            requests += 1
+            for name in week:
+                done = before.setdefault(name, [0.0] * 7)
+                for i in range(7):
+                    _add(totals, since, i, name, cls, week[name][i] - done[i])
+                before[name] = week[name]
+        for name in seconds:
+            for i in range(7):
+                _add(totals, since, i, name, WORK, seconds[name][i] - before[name][i])
+        requests += 1
+        since += datetime.timedelta(days=7)
+    log.debug(f"Read the totals of workspace {wid} with {requests} requests")
+    return requests
+
+
+def _add(totals, since, i, name, cls, seconds):
+    if seconds > 0:
+        totals.add(since + datetime.timedelta(days=i), name, cls, seconds)
@@ -3,38 +3,36 @@
 import sys
 
 import datetime
-import icu
-import markdown2
 import os
-import pandas
-import pytz
-import pytz.reference
-import pytz.tzinfo
 import random
-import yaml
 from calendar import monthrange
 from datetime import datetime as dt, timedelta as tdelta
-from toggl.api import Api
-from toggl.workspace import Workspace
 
+from replan.aggregation import DayTotals, WORK, PAUSE, POSTPONED, OFF, tag_class
 from replan.checks import check_for_expected_hours, check_for_gaps_and_overlaps, check_for_completeness, check_weekends
 from replan.collections import StrictList, StrictDict, DefaultDict
 from replan.entry import Entry
 from replan.functions import add_hours, mk_headline
-from replan.logging import log, hdl
-from replan.working_hours import WorkingHours, parse_holidays
-from replan.yaml_classes import *
+from replan.logging import log, hdl, enable_async_output
+from replan.output import Report, formats
+from replan.pipeline import Pipeline, needs
+from replan.profiling import profiler, profiled
+from replan.timezones import DayTable, epoch, get_zone
+from replan.working_hours import WorkingHours
 
 __all__ = ["main"]
 
-from resource_objects import *
+from resource_objects import Workspace
 
 config_file = os.path.expanduser("~/.toggl_summary/config.yaml")
+matrix_file_name = "ccenters.matrix"
 
-import pprint
 import argparse
 import logging
 
+# Heavy third party modules (icu, pandas, markdown2, toggl) are imported where
+# they're used so that each sub command only pays for its own dependencies.
+
 
 def _try_parse(dt, p):
     tf = None
@@ -58,11 +56,11 @@ def parse(dt):
     else:
         raise ValueError("dt must be str or float")
 
-    d = datetime.datetime.fromtimestamp(ts, pytz.timezone("Europe/Berlin"))
-    return d
+    return get_zone().local(int(ts))
 
 
 def parse_to_ts(dt):
+    import icu
     df = icu.SimpleDateFormat('dd.MM.yyyy, HH:mm', icu.Locale('de_DE'))
     ts = _try_parse(dt, df)
     return ts
@@ -70,35 +68,100 @@ def parse_to_ts(dt):
 def parse_time(t):
     return datetime.datetime.strptime(t,"%H:%M")
 
-pp = pprint.PrettyPrinter()
-
 log.setLevel(logging.INFO)
 hdl.setLevel(logging.DEBUG)
 log.addHandler(hdl)
 
 
+def to_percents(project_seconds, total_seconds, base=5):
+    """
+    Turns seconds per project into percentages rounded to the given base
+    """
+    percents = {}
+    for p in project_seconds:
+        perc = round(project_seconds[p] / total_seconds * 100.)
+        percents[p] = round(perc / base) * base
+    return percents
+
+
 class ResourcePlanner:
-    def __init__(self, start_date, end_date, config):
+    def __init__(self, start_date, end_date, config, api=None, streaming=False):
+        """
+        :param streaming: Fold the entries into totals per day, project and tag class as
+                          they arrive instead of keeping them in :attr:`days`, see
+                          :meth:`fold_entries`
+        """
         self.special_projects = ["Vacations", "Sick", "Courses"]
         self.config = config
 
         self.api_key = config.api["api_key"]
         self.ezve_rounding = config.settings["ezve_rounding"]
         self.projects = config.projects
-        self.holidays = parse_holidays(config.holidays)
-        self.api = Api(self.api_key)
-        self.ws = self.api.workspaces
+        self.holidays = config.get_holidays()
+        self._api = api
+        self.api_session = None
         self.start = start_date
         self.end = end_date
         self.worktimings = config.settings["worktimings"]
         self.weekends = config.settings["weekends"]
         self.productivity_mappings = config.productivity_mappings
+        self.zone = get_zone(config.settings.get("timezone"))
+        self._day_table = None
 
         self.days = StrictDict(StrictList)
+        self.totals = DayTotals(self.start, self.end) if streaming else None
+        #: Whether back to back entries of the days were merged, see :meth:`compact_days`
+        self.compacted = False
 
         self.bh = WorkingHours(self.start, self.end, weekends=self.weekends, worktimings=self.worktimings,
                                holidays=self.holidays)
         # Workspace.working_hours = self.bh
+
+    @property
+    def api(self):
+        if self._api is None:
+            from toggl.api import Api
+            from replan.api_client import attach
+            self._api = Api(self.api_key)
+            attach(self._api, self.session)
+        return self._api
+
+    @property
+    def session(self):
+        """
+        The throttled session all requests to Toggl go through
+
+        :rtype: requests.Session
+        """
+        if self.api_session is None:
+            from replan.api_client import make_session
+            api_settings = self.config.api
+            transport = None
+            if api_settings.get("fake") is not None:
+                from replan.fake_toggl import FakeToggl, FakeTogglAdapter
+                transport = FakeTogglAdapter(FakeToggl.from_settings(api_settings["fake"]))
+            self.api_session = make_session(rate=api_settings.get("rate_limit", 1.0),
+                                            burst=api_settings.get("burst", 1),
+                                            max_retries=api_settings.get("max_retries", 5),
+                                            transport=transport)
+        return self.api_session
+
+    @property
+    def day_table(self):
+        """
+        Local midnights of the period
+
+        :rtype: DayTable
+        """
+        if self._day_table is None:
+            self._day_table = DayTable(self.zone, self.start, self.end)
+        return self._day_table
+
+    @property
+    def ws(self):
+        return self.api.workspaces
+
+    def log_header(self):
         log.info(mk_headline(sgn="="))
         log.info(mk_headline("Resource Planner", "#"))
         log.info(mk_headline(sgn="="))
@@ -109,6 +172,30 @@ class ResourcePlanner:
                     self.bh.get_actual_working_hours(), self.bh.get_number_of_actual_workdays()))
         log.info(mk_headline(sgn="="))
 
+    def split_months(self):
+        """
+        Partitions the loaded days into one planner per calendar month of the period.
+        The planners share the config and the entries, but each has its own working hours.
+
+        :return: Planners by (year, month)
+        :rtype: dict
+        """
+        months = {}
+        year, month = self.start.year, self.start.month
+        while (year, month) <= (self.end.year, self.end.month):
+            _, last = monthrange(year, month)
+            rp = ResourcePlanner(datetime.date(year, month, 1), datetime.date(year, month, last), config=self.config)
+            if self.totals is not None:
+                rp.totals = self.totals.slice(rp.start, rp.end)
+            months[(year, month)] = rp
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+        for d in sorted(self.days):
+            rp = months.get((d.year, d.month))
+            if rp is not None:
+                rp.days[d] = self.days[d]
+        return months
+
     def get_working_hours(self, day):
         return self.bh.get_daily_working_hours()
 
@@ -118,19 +205,19 @@ class ResourcePlanner:
     def load_data(self):
         pass
 
-    def calculate_percents(self):
+    def fetch_entries(self):
+        """
+        Fetches the finished time entries of the period from all workspaces
+
+        :return: Generator of (workspace, version stamp, entry) tuples. The stamp is the time
+                 of the entry's last change on Toggl if available.
+        """
+        zone = self.zone
+        period_start, period_end = self.day_table.start, self.day_table.end
         for ws in self.ws:
             ws_obj = Workspace(ws)
 
             log.info(mk_headline(f"Times in Workspace {ws}", "*"))
-            # seconds = {}
-            self.total_time = tdelta(0)
-
-            self.project_seconds = {
-                "Vacations": 0.0,
-                "Courses": 0.0,
-                "Sick": 0.0
-            }
 
             for project in ws_obj.native_projects:
                 p_name = project.name
@@ -140,43 +227,201 @@ class ResourcePlanner:
                     if not hasattr(i, "stop"):
                         log.warn("Entry %s seems to still be running" % i.description)
                         continue
-                    start = i.start.replace(tzinfo=pytz.timezone("UTC"))
-                    end = i.stop.replace(tzinfo=pytz.timezone("UTC"))
+                    start = epoch(i.start)
+                    end = epoch(i.stop)
 
-                    if start.date() < self.start or end.date() > self.end:
+                    # Entries reaching into the period are split at its bounds later on
+                    if end <= period_start or start >= period_end:
                         continue
 
-                    dur = end - start
+                    tags = list(set([t.lower() for t in i.tags])) if hasattr(i, "tags") else []
 
-                    if dur.total_seconds() / 3600. > 11:
+                    e = Entry(p_name, start, end, tags, id=getattr(i, "id", None), zone=zone)
+                    if e.seconds > 11 * 3600:
                         log.warn("Warning: the entry seems to be too long:")
-                        log.warn(f"{p_name} from {start} to {end}; duration {dur}")
+                        log.warn(f"{p_name} from {e.start} to {e.end}; duration {e.duration}")
+
+                    yield ws, getattr(i, "at", None), e
 
-                    if start.date() not in self.days:
-                        self.days[start.date()] = StrictList(Entry)
+    def collect_entries(self):
+        """
+        Fetches the entries of the period and sums up the seconds per project
 
-                    if p_name not in self.project_seconds:
-                        self.project_seconds[p_name] = 0.0
+        :return: The fetched entries, not yet assigned to days
+        :rtype: list
+        """
+        return list(self._count_entries())
 
-                    e = None
+    def _count_entries(self):
+        last_ws = None
+        for ws, stamp, e in self.fetch_entries():
+            if ws is not last_ws:
+                last_ws = ws
+                # seconds = {}
+                self.total_time = tdelta(0)
 
-                    tags = list(set([t.lower() for t in i.tags])) if hasattr(i, "tags") else []
+                self.project_seconds = {
+                    "Vacations": 0.0,
+                    "Courses": 0.0,
+                    "Sick": 0.0
+                }
+
+            p_name = e.name
+            if p_name not in self.project_seconds:
+                self.project_seconds[p_name] = 0.0
+
+            add_dur = not (p_name == "Holidays" or "pause" in e.tags)
+            if add_dur:
+                self.project_seconds[p_name] += e.seconds
+
+            yield e
+
+    def bucket_entries(self, entries):
+        """
+        Adds entries to the local days they fall on; entries crossing midnight are split,
+        see :meth:`replan.timezones.DayTable.split`
+        """
+        for d, e in self.day_table.split(entries):
+            if d not in self.days:
+                self.days[d] = StrictList(Entry)
+            self.days[d].append(e)
+        return self.days
+
+    def compact_days(self, threshold=None):
+        """
+        Merges back to back entries of the same project and tags on every day, see
+        :func:`replan.entry.compact`
+
+        :param threshold: Longest gap or overlap in seconds, the one of the gap check if None
+        """
+        from replan.checks import gap_threshold_seconds
+        from replan.entry import compact
+
+        threshold = gap_threshold_seconds if threshold is None else threshold
+        before = after = 0
+        for d in self.days:
+            day = self.days[d]
+            compacted = compact(day, threshold)
+            before, after = before + len(day), after + len(compacted)
+            self.days[d] = StrictList(Entry)
+            for e in compacted:
+                self.days[d].append(e)
+        self.compacted = True
+        log.info(f"Compacted {before} entries into {after}")
+        return self.days
+
+    def fold_entries(self, chunk_size=1024):
+        """
+        Streaming mode: fetches the entries of the period and folds them into the totals
+        per day, project and tag class, a chunk at a time, without keeping them
+
+        :rtype: replan.aggregation.DayTotals
+        """
+        chunk = []
+        for e in self._count_entries():
+            chunk.append(e)
+            if len(chunk) >= chunk_size:
+                self._fold(chunk)
+                chunk = []
+        self._fold(chunk)
+        return self.totals
+
+    def reports_client(self):
+        """
+        Client for the reports API and the parts of the API v8 that aren't read through the
+        Toggl client, sending its requests with :attr:`session`
+
+        :rtype: replan.reports.ReportsClient
+        """
+        from replan.reports import ReportsClient, API_URL, REPORTS_URL
+
+        api_settings = self.config.api
+        return ReportsClient(self.session, self.api_key, api_url=api_settings.get("api_url", API_URL),
+                             reports_url=api_settings.get("reports_url", REPORTS_URL))
+
+    def fetch_totals(self):
+        """
+        Reads the seconds per day, project and tag class from the weekly reports of the
+        reports API into the totals instead of fetching every entry, see
+        :func:`replan.reports.fold_weekly`. Falls back to :meth:`fold_entries` if the
+        reports can't be read.
 
-                    e = Entry(p_name, start, end, dur, tags)
-                    add_dur = not (p_name == "Holidays" or (hasattr(i, "tags") and "Pause" in i.tags))
-                    if add_dur:
-                        self.project_seconds[p_name] += dur.total_seconds()
+        :rtype: replan.aggregation.DayTotals
+        """
+        from replan.reports import ReportsError, fold_weekly
+
+        client = self.reports_client()
+        try:
+            for ws in self.ws:
+                log.info(mk_headline(f"Totals of Workspace {ws}", "*"))
+                ws_totals = DayTotals(self.start, self.end)
+                fold_weekly(client, ws.id, ws_totals)
+                self.totals.merge(ws_totals)
+
+                # Like when counting the entries, only the last workspace's seconds are kept
+                self.total_time = tdelta(0)
+                self.project_seconds = {"Vacations": 0.0, "Courses": 0.0, "Sick": 0.0}
+                for n, name in enumerate(ws_totals.names):
+                    seconds = ws_totals.seconds[:, n, :].sum(axis=0)
+                    if name not in self.project_seconds:
+                        self.project_seconds[name] = 0.0
+                    if name != "Holidays":
+                        self.project_seconds[name] += float(seconds.sum() - seconds[PAUSE])
+        except ReportsError as e:
+            log.warn(f"Can't read the reports, fetching the entries instead: {e}")
+            self.totals = DayTotals(self.start, self.end)
+            return self.fold_entries()
+        return self.totals
+
+    def _fold(self, entries):
+        import numpy as np
+
+        parts = list(self.day_table.split(entries))
+        if not parts:
+            return
+        first = self.totals.first
+        self.totals.add_arrays(np.array([(d - first).days for d, e in parts], dtype=np.int64),
+                               np.array([self.totals.name_index(e.name) for d, e in parts], dtype=np.int64),
+                               np.array([tag_class(e.tags) for d, e in parts], dtype=np.int64),
+                               np.array([e.seconds for d, e in parts], dtype=float))
 
-                    self.days[start.date()].append(e)
+    def calculate_percents(self):
+        if self.totals is not None:
+            return self.fold_entries()
+        return self.bucket_entries(self.collect_entries())
 
     def checks(self):
-        log.info(f"Performing checks on {', '.join([str(s) for s in self.days.keys()])}")
-        check_for_expected_hours(self.days, self.get_labor_hours)
-        check_for_gaps_and_overlaps(self.days)
-        check_for_completeness(self.days, self.bh.get_actual_work_days())
-        check_weekends(self.days, self.weekends)
+        if self.totals is not None:
+            return self._check_totals()
+        if log.isEnabledFor(logging.INFO):
+            log.info(f"Performing checks on {', '.join([str(s) for s in self.days.keys()])}")
+        self.check_results = [
+            check_for_expected_hours(self.days, self.get_labor_hours),
+            check_for_gaps_and_overlaps(self.days),
+            check_for_completeness(self.days, self.bh.get_actual_work_days()),
+            check_weekends(self.days, self.weekends)
+        ]
+        return self.check_results
+
+    def _check_totals(self):
+        days = dict.fromkeys(self.totals.days())
+        if log.isEnabledFor(logging.INFO):
+            log.info(f"Performing checks on {', '.join([str(s) for s in days])}")
+            log.info("Skipping the check for gaps and overlaps, it needs the entries")
+        self.check_results = [
+            check_for_expected_hours(days, self.get_labor_hours, hours=self.totals.day_hours(self.get_labor_hours)),
+            check_for_completeness(days, self.bh.get_actual_work_days()),
+            check_weekends(days, self.weekends, names=self.totals.day_names())
+        ]
+        return self.check_results
+
+    def holiday_entries(self):
+        """
+        The entries standing in for the holidays, vacations, sick and course days of the
+        period
 
-    def apply_holidays(self):
+        :return: Generator of (day, entry) tuples
+        """
         for h in self.bh.holidays:
             if h[1] == "Holidays":
                 continue
@@ -191,37 +436,84 @@ class ResourcePlanner:
                 log.warning(f"Skipping weekend day {d}")
                 continue
 
+            dwh = self.bh.get_daily_working_hours() - self.bh.breaks
+            dwstart = self.bh.worktimings[0]
+            start = self.zone.localize(add_hours(d, dwstart))
+            yield d, Entry(h[1], start, start + int(dwh * 3600), ["off"], zone=self.zone)
+
+    def apply_holidays(self):
+        for d, entry in self.holiday_entries():
+            if self.totals is not None:
+                self.project_seconds[entry.name] += entry.duration.total_seconds()
+                self.total_time += entry.duration
+                self.totals.add(d, entry.name, tag_class(entry.tags), entry.seconds)
+                continue
+
             if d not in self.days:
                 log.info(f"Adding new day entry list for day {d}")
                 self.days[d] = StrictList(Entry)
 
-            dwh = self.bh.get_daily_working_hours() - self.bh.breaks
-            dwstart = self.bh.worktimings[0]
-            dtime = add_hours(d, dwstart)
-            dtime = self.get_timezone().localize(dtime)
-
-            self.project_seconds[h[1]] += tdelta(hours=dwh).total_seconds()
-            self.total_time += tdelta(hours=dwh)
-            entry = Entry(h[1], dtime, add_hours(dtime, dwh), tdelta(hours=dwh), ["off"])
-            pause_entry = Entry(h[1], entry.end, add_hours(entry.end, self.bh.breaks), tdelta(hours = self.bh.breaks), ["pause", "off"])
-            log.info(f"Adding entry {entry} to {d}")
+            self.project_seconds[entry.name] += entry.duration.total_seconds()
+            self.total_time += entry.duration
+            if log.isEnabledFor(logging.INFO):
+                log.info(f"Adding entry {entry} to {d}")
             self.days[d].append(entry)
-            # log.info(f"Adding pause entry {pause_entry} to {d}")
-            # self.days[d].append(pause_entry)
+
+    def archive_totals(self, archive):
+        """
+        Seconds per day, project and tag class of the period read from an entry archive,
+        with the holidays added
+
+        :type archive: replan.archive.EntryArchive
+        :rtype: replan.aggregation.DayTotals
+        """
+        from replan.aggregation import tag_class
+
+        totals = archive.totals(self.start, self.end)
+        for d, entry in self.holiday_entries():
+            totals.add(d, entry.name, tag_class(entry.tags), entry.seconds)
+        return totals
+
+    def snapshot(self, path):
+        """
+        Writes the loaded days, project seconds and total time to a snapshot file, see
+        :func:`replan.snapshot.save_snapshot`
+        """
+        from replan.snapshot import save_snapshot
+
+        if self.totals is not None:
+            raise ValueError("Snapshots need the entries, they can't be taken in streaming mode")
+        save_snapshot(self, path)
+
+    def restore(self, path, compacted=False):
+        """
+        Loads days, project seconds and total time from a snapshot instead of fetching them
+
+        :param compacted: Whether the days are expected to be compacted, i.e. the snapshot
+                          was taken with ``--compact``
+        """
+        from replan.snapshot import load_snapshot
+
+        self.compacted = compacted
+        days = load_snapshot(self, path)
+        if self.totals is None:
+            return days
+        self._fold([e for d in days for e in days[d]])
+        self.days = StrictDict(StrictList)
+        return self.totals
 
     def output_results(self):
         log.info(mk_headline(f"Resulting resource distribution", "="))
         log.info(mk_headline(sgn="-"))
 
-        project_seconds, total_seconds = self.calc_project_and_total_seconds()
+        percents = self.calc_results()
 
         all_hours = self.bh.get_actual_working_hours()
         log.info(f"Total hours in month {self.start.month}: {all_hours}")
         print(mk_headline(sgn="-"))
         perc_sum = 0.0
-        for p in project_seconds:
-            perc = round(project_seconds[p] / total_seconds * 100.)
-            perc = round(perc / 5) * 5
+        for p in percents:
+            perc = percents[p]
             perc_sum += perc
             if perc > 0.0:
                 print(f"==> Project {p}: {perc}%")
@@ -229,25 +521,56 @@ class ResourcePlanner:
         print(f"Sum: {perc_sum}%")
         print(mk_headline(sgn="="))
 
-    def calc_project_and_total_seconds(self):
+    def calc_results(self):
+        """
+        Share of every project in the period, in percent rounded to 5
+
+        :rtype: dict
+        """
+        project_seconds, total_seconds = self.calc_project_and_total_seconds()
+        return to_percents(project_seconds, total_seconds)
+
+    def calc_day_seconds(self, day):
+        """
+        Seconds per project and seconds to be distributed over all projects of a day
+
+        :param day: The entries of the day
+        :rtype: (dict, float)
+        """
+        project_seconds = DefaultDict(0.0)
+        postponed_seconds = 0.0
+        for e in day:
+            if "pause" in e.tags:
+                continue
+            if "distribute" in e.tags or "overhead" in e.tags:
+                # postponed_entries[d].append(e)
+                postponed_seconds += e.seconds
+                continue
+            if "off" in e.tags:
+                continue
+
+            project = self.projects.get_by_name(e.name)
+            project_seconds[project.name] += e.seconds
+        return project_seconds, postponed_seconds
+
+    @profiled("calc_project_and_total_seconds")
+    def calc_project_and_total_seconds(self, day_seconds=None):
+        """
+        :param day_seconds: Results of :meth:`calc_day_seconds` for every day, computed from
+                            the loaded days if not given
+        """
         all_hours = self.bh.get_actual_working_hours(month=self.start.month)
         project_seconds = DefaultDict(0.0)
         total_seconds = all_hours * 3600
         postponed_seconds = 0.0
-        for d in self.days:
-            day = self.days[d]
-            for e in day:
-                if "pause" in e.tags:
-                    continue
-                if "distribute" in e.tags or "overhead" in e.tags:
-                    # postponed_entries[d].append(e)
-                    postponed_seconds += e.duration.seconds
-                    continue
-                if "off" in e.tags:
-                    continue
-
-                project = self.projects.get_by_name(e.name)
-                project_seconds[project.name] += e.duration.seconds
+        if day_seconds is None and self.totals is not None:
+            day_seconds = self.totals.day_seconds().values()
+        elif day_seconds is None:
+            day_seconds = [self.calc_day_seconds(self.days[d]) for d in self.days]
+        for seconds, postponed in day_seconds:
+            postponed_seconds += postponed
+            for p in seconds:
+                project_seconds[p] += seconds[p]
 
         sick_days = self.bh.get_sick_days(month=self.start.month, year=self.start.year)
         sick_seconds = self.bh.get_daily_working_hours() * 3600. * len(sick_days)
@@ -326,32 +649,131 @@ class ResourcePlanner:
 
         log.info(mk_headline(sgn="="))
 
-    def output_planning(self):
-        from string import Template
-        import locale
-        locale.setlocale(locale.LC_ALL, '')
-        mtemp_lines = self.config.templates["mail"]
-        mtemp = "\n".join(mtemp_lines)
-        temp = Template(mtemp)
-        dtemp = Template(self.config.templates["project_line"])
-        stemp = Template(self.config.templates["sum_line"])
+    def capacity_model(self):
+        """
+        Capacity buckets of all projects of the config except the special ones; a project
+        holds up to its ``max`` share of a month and overflows into the project given by
+        the code in its ``overflow``
+
+        :rtype: replan.Bucket.BucketArray
+        """
+        from replan.Bucket import BucketArray
+
+        projects = [p for p in self.projects.definitions if p.name not in self.special_projects]
+        names = [p.name for p in projects]
+        overflow = []
+        for p in projects:
+            target = self.projects.get_by_code(p.overflow).name if p.overflow is not None else None
+            overflow.append(target if target in names else None)
+        return BucketArray(names, [min(1.0, p.max) for p in projects], overflow=overflow)
+
+    def availability(self, month, year):
+        """
+        Share of a month's workdays that's neither vacation nor course days
+        """
+        workdays = self.bh.get_number_of_actual_workdays(month, year)
+        if not workdays:
+            return 0.0
+        absent = len(self.bh.get_vacations(month, year)) + len(self.bh.get_course_days(month, year))
+        return max(0.0, 1.0 - absent / workdays)
+
+    def simulate_capacity(self, months, capacities=None, shares=None, project_seconds=None, total_seconds=None):
+        """
+        Carries the project shares of this period forward through the capacity buckets
+
+        The shares of the time worked are scaled to the availability of every month and
+        distributed over the project capacities; what exceeds the end of an overflow chain
+        stays unallocated.
+
+        :param months: Number of months to simulate, starting with the next one
+        :param capacities: Capacities per scenario, shaped (scenarios, projects), for what-if
+                           simulations; the projects' ``max`` if not given
+        :param shares: Shares of the time worked by project name to start from, e.g. a
+                       :meth:`forecast`; this period's shares if not given
+        :return: The simulated months as (year, month) tuples, the project names, the allocated
+                 shares shaped (scenarios, months, projects) and the unallocated shares
+                 shaped (scenarios, months)
+        :rtype: (list, list, numpy.ndarray, numpy.ndarray)
+        """
+        import numpy as np
+
+        model = self.capacity_model()
+        if shares is None:
+            if project_seconds is None:
+                project_seconds, total_seconds = self.calc_project_and_total_seconds()
+            available = self.availability(self.start.month, self.start.year) or 1.0
+            shares = dict([(p, project_seconds[p] / total_seconds / available) for p in project_seconds])
+        shares = np.array([shares.get(p, 0.0) for p in model.names])
+
+        dates = []
+        year, month = self.start.year, self.start.month
+        for _ in range(months):
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            dates.append((year, month))
+        inflow = np.array([shares * self.availability(m, y) for y, m in dates])
+
+        levels, spills = model.simulate(inflow, capacity=capacities)
+        return dates, model.names, levels, spills.sum(axis=2)
+
+    def covers_month(self):
+        """
+        Whether the period is exactly one calendar month
+        """
+        _, last = monthrange(self.start.year, self.start.month)
+        return self.start.day == 1 and self.end == datetime.date(self.start.year, self.start.month, last)
+
+    def record_rollup(self, store):
+        """
+        Adds the rollup of the period to the store, if the period is a whole month
+
+        :type store: replan.rollups.RollupStore
+        """
+        if not self.covers_month():
+            return
+        project_seconds, total_seconds = self.calc_project_and_total_seconds()
+        store.add(self.start.year, self.start.month, project_seconds, total_seconds,
+                  self.availability(self.start.month, self.start.year))
+        store.save()
+
+    def forecast(self, store):
+        """
+        Shares of the time worked of every project in the month after the period,
+        exponentially weighted over the rollups of the preceding months
+
+        The number of months and the weight of the most recent one are taken from the
+        ``forecast_months`` (default 6) and ``forecast_alpha`` (default 0.5) settings.
+
+        :type store: replan.rollups.RollupStore
+        :return: Shares by project name, None without any rollups
+        :rtype: dict
+        """
+        from replan.rollups import ewma_shares
+
+        _, last = monthrange(self.start.year, self.start.month)
+        ndate = datetime.date(self.start.year, self.start.month, last) + tdelta(days=1)
+        rollups = store.before(ndate.year, ndate.month, self.config.settings.get("forecast_months", 6))
+        if not rollups:
+            return None
+        return ewma_shares(rollups, alpha=self.config.settings.get("forecast_alpha", 0.5),
+                           exclude=self.special_projects)
 
+    def calc_planning(self, forecast=None):
+        """
+        Project shares of this and the next month for the planning mail
+
+        :param forecast: Shares of the next month, see :meth:`forecast`; this month's
+                         shares are carried forward if not given
+
+        :return: Dates of both months and their data as dicts of project key to a dict
+                 with the project's display name and rounded percentage
+        :rtype: dict
+        """
         pdate = self.start
         _, mdays = monthrange(pdate.year, pdate.month)
         ndate = self.start + tdelta(days=mdays)
 
         log.info(f"Planning for {pdate} and {ndate}")
 
-        pmonth = dt.strftime(pdate, "%B")
-        nmonth = dt.strftime(ndate, "%B")
-        pyear = dt.strftime(pdate, "%Y")
-        nyear = dt.strftime(ndate, "%Y")
-        pyears = dt.strftime(pdate, "%y")
-        nyears = dt.strftime(ndate, "%y")
-
-        if pdate.year == ndate.year:
-            pyear = ""
-
         pvacation_days_no = len(self.bh.get_vacations(pdate.month, pdate.year))
         nvacation_days_no = len(self.bh.get_vacations(ndate.month, ndate.year))
         pcourse_days_no = len(self.bh.get_course_days(pdate.month, pdate.year))
@@ -397,6 +819,14 @@ class ResourcePlanner:
         #     "perc": (round((psick_perc * 100) / 5) * 5)
         # }
         #
+        _, names, levels, _ = self.simulate_capacity(1, shares=forecast, project_seconds=project_seconds,
+                                                     total_seconds=total_seconds)
+        for p, level in zip(names, levels[0, 0]):
+            ndata[p] = {
+                "project": p,
+                "perc": (round((level * 100) / 5) * 5)
+            }
+
         ndata["Courses"] = {
             "project": "Seminare/Weiterbildung",
             "perc": (round((ncourses_perc * 100) / 5) * 5)
@@ -440,15 +870,61 @@ class ResourcePlanner:
         for p in ndata:
             ndata[p]["percentage"] = "%3d" % ndata[p]["perc"]
 
+        return {
+            "pdate": pdate,
+            "ndate": ndate,
+            "pdata": pdata,
+            "ndata": ndata,
+            "rest": 100 - perc_sum(ndata)
+        }
+
+    def planning_record(self, forecast=None):
+        """
+        :return: Planning data of this and the next month for machine readable output
+        :rtype: dict
+        """
+        planning = self.calc_planning(forecast)
+        return {
+            "month": planning["pdate"],
+            "projects": dict([(p, planning["pdata"][p]["perc"]) for p in planning["pdata"]]),
+            "next_month": planning["ndate"],
+            "next_projects": dict([(p, planning["ndata"][p]["perc"]) for p in planning["ndata"]]),
+            "rest": planning["rest"]
+        }
+
+    def output_planning(self, forecast=None):
+        from string import Template
+        import locale
+        import markdown2
+        locale.setlocale(locale.LC_ALL, '')
+        mtemp_lines = self.config.templates["mail"]
+        mtemp = "\n".join(mtemp_lines)
+        temp = Template(mtemp)
+        dtemp = Template(self.config.templates["project_line"])
+        stemp = Template(self.config.templates["sum_line"])
+
+        planning = self.calc_planning(forecast)
+        pdate, ndate = planning["pdate"], planning["ndate"]
+        pdata, ndata = planning["pdata"], planning["ndata"]
+
+        pmonth = dt.strftime(pdate, "%B")
+        nmonth = dt.strftime(ndate, "%B")
+        pyear = dt.strftime(pdate, "%Y")
+        nyear = dt.strftime(ndate, "%Y")
+        pyears = dt.strftime(pdate, "%y")
+        nyears = dt.strftime(ndate, "%y")
+
+        if pdate.year == ndate.year:
+            pyear = ""
+
         pdata_str = [dtemp.substitute(pdata[p]) for p in pdata]
         ndata_str = [dtemp.substitute(ndata[p]) for p in ndata]
 
         psum_str = stemp.substitute({
-            "percsum": perc_sum(pdata)
+            "percsum": sum([pdata[p]["perc"] for p in pdata])
         })
 
-        nsum = perc_sum(ndata)
-        rest = 100 - nsum
+        rest = planning["rest"]
         d = {
             'pmonth': pmonth,
             'pyear': pyear,
@@ -480,30 +956,40 @@ class ResourcePlanner:
             if t.lower() in off_type:
                 yield d
 
-    def output_ezve(self, outfile):
-        days = sorted(self.days)
-        lines = []
+    def calc_ezve(self):
+        """
+        EZVE distribution of every day
+
+        :return: Generator of (day, [(project code, ccenter, fraction), ...]) tuples, sorted
+                 by day and without ignored or empty projects
+        """
+        verbose = log.isEnabledFor(logging.INFO)
+        days = sorted(self.days) if self.totals is None else self.totals.days()
         for d in days:
-            log.info(mk_headline(str(d)))
-            day = self.days[d]
+            if verbose:
+                log.info(mk_headline(str(d)))
 
             project_seconds = DefaultDict(0.0)
             day_seconds = 0.0
 
-            for e in day:
+            if self.totals is not None:
+                for name, seconds in self.totals.project_seconds(d, (WORK, POSTPONED, OFF)).items():
+                    project_seconds[self.projects.get_by_name(name).code] += seconds
+                    day_seconds += seconds
+
+            for e in self.days.get(d, []):
                 if "pause" in e.tags:
                     continue
 
                 project = self.projects.get_by_name(e.name)
-                project_seconds[project.code] += e.duration.seconds
-                day_seconds += e.duration.seconds
+                project_seconds[project.code] += e.seconds
+                day_seconds += e.seconds
 
-            prod_mapping_names = [m.code for m in self.productivity_mappings]
             mapped_seconds = DefaultDict(0.0)
             for s in project_seconds:
                 prod_proj = self.projects.get_by_code(s)
                 ps = project_seconds[s]
-                if s in prod_mapping_names:
+                if s in self.productivity_mappings:
                     mappings = self.productivity_mappings[s].mappings
                     for m in mappings:
                         prod_proj = self.projects.get_by_code(m.productive_project)
@@ -512,6 +998,7 @@ class ResourcePlanner:
                     mapped_seconds[(prod_proj.code, prod_proj.ccenter)] += ps
 
             day_sum = 0
+            rows = []
             codes = list(mapped_seconds.keys())
             percents = [0] * len(codes)
             percents = dict(zip(codes, percents))
@@ -564,11 +1051,39 @@ class ResourcePlanner:
 
                 p = percents[(c, cc)]
                 if p * 100 <= 1e-2:
-                    log.info(f"{p:>8.3f}% {c} {cc} skipped")
+                    if verbose:
+                        log.info(f"{p:>8.3f}% {c} {cc} skipped")
                     continue
 
                 day_sum += int(p * 100)
                 # log.info(f"  {c:15s} -> CC: {str(cc):15s} {p*100:>8.0f}%")
+                rows.append((c, cc, p))
+
+            if day_sum < 100:
+                log.warning(f"This day is only filled to {day_sum}%!")
+            elif day_sum > 100:
+                log.error(f"This day is overfilled to {day_sum}%!")
+
+            yield d, rows
+
+    def ezve_records(self):
+        """
+        :return: EZVE distribution of every day as records for machine readable output
+        :rtype: list
+        """
+        return [{"date": d, "project": c, "ccenter": cc, "percent": p * 100}
+                for d, rows in self.calc_ezve() for c, cc, p in rows]
+
+    @profiled("output_ezve")
+    def output_ezve(self, outfile):
+        verbose = log.isEnabledFor(logging.INFO)
+        render = outfile is not None or verbose
+        lines = []
+        for d, rows in self.calc_ezve():
+            if not render:
+                continue
+
+            for c, cc, p in rows:
                 if outfile is not None:
                     lines.append(f"{d.year}\t{d.month}\t{d.day}\t{cc:05d}\t{p*100}")
                 else:
@@ -578,11 +1093,6 @@ class ResourcePlanner:
 
                     lines.append(f"{dt.strftime(d, '%d.%m.%Y')}\t{c:20}\t{cc:8}\t{p*100:5.0f}%")
 
-            if day_sum < 100:
-                log.warning(f"This day is only filled to {day_sum}%!")
-            elif day_sum > 100:
-                log.error(f"This day is overfilled to {day_sum}%!")
-
             if outfile is None:
                 lines.append(mk_headline())
 
@@ -595,6 +1105,7 @@ class ResourcePlanner:
                 log.info(l.strip())
 
     def add_from_csv(self, csv_file):
+        import pandas
         pd = pandas.read_csv(csv_file, index_col=False)
         for i, row in pd.iterrows():
             print(row)
@@ -606,8 +1117,6 @@ class ResourcePlanner:
                 assert isinstance(wid, int)
                 ws = self.ws.get(wid)
 
-            inf = self.get_timezone()
-
             start = parse(f"{row['Date']}, {row['From']}+2:00")
 
             try:
@@ -669,7 +1178,7 @@ class ResourcePlanner:
             )
 
     def get_timezone(self):
-        return pytz.timezone("Europe/Berlin")
+        return self.zone
 
     def _find_ws_from_project_name(self, project):
         """
@@ -723,27 +1232,381 @@ class ResourcePlanner:
 
 
 class SubCommandSplitter:
-    def __init__(self, rp):
-        self.rp = rp  # type: ResourcePlanner
+    def __init__(self, pipeline):
+        self.pipeline = pipeline  # type: Pipeline
+
+    @property
+    def rp(self):
+        return self.pipeline.get("planner")  # type: ResourcePlanner
+
+    @property
+    def report(self):
+        return self.pipeline.report  # type: Report
 
+    @needs("checks", entries=False)
     def summary(self):
-        self.rp.output_results()
+        if self.report.structured:
+            percents = self.rp.calc_results()
+            self.report.add("summary", [{"project": p, "percent": percents[p]} for p in percents])
+        else:
+            self.rp.output_results()
 
+    @needs("checks", entries=False)
     def ezve(self):
         parser = argparse.ArgumentParser()
-        parser.add_argument("--to-file", "-t", nargs="?", default=None, type=str, help="Where to output the EZVE data")
+        parser.add_argument("--to-file", "-t", nargs="?", default=None, type=str,
+                            help="Where to output the EZVE data (text format only)")
         args, classlist = parser.parse_known_args(sys.argv[2:])
-        self.rp.output_ezve(args.to_file)
+        if self.report.structured:
+            self.report.add("ezve", self.rp.ezve_records())
+        else:
+            self.rp.output_ezve(args.to_file)
 
+    @needs("checks", entries=False)
     def mail(self):
-        self.rp.output_planning()
+        self.rp.record_rollup(self.pipeline.get("rollups"))
+        forecast = self.pipeline.get("forecast")
+        if self.report.structured:
+            self.report.add("planning", self.rp.planning_record(forecast))
+        else:
+            self.rp.output_planning(forecast)
 
+    @needs("holidays")
+    def snapshot(self):
+        parser = argparse.ArgumentParser()
+        parser.add_argument("path", type=str, help="File to write the snapshot to")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        self.rp.snapshot(args.path)
+        entries = sum([len(self.rp.days[d]) for d in self.rp.days])
+        if self.report.structured:
+            self.report.add("snapshot", {"path": args.path, "days": len(self.rp.days), "entries": entries})
+        else:
+            print(f"Snapshot of {entries} entries on {len(self.rp.days)} days written to {args.path}")
+
+    @needs("fetch")
+    def archive(self):
+        from replan.archive import EntryArchive
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("path", type=str, help="Directory of the archive")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        if self.rp.totals is not None:
+            raise ValueError("The archive needs the entries, it can't be written in streaming mode")
+        archive = EntryArchive(args.path, zone=self.rp.zone)
+        written = archive.append(self.pipeline.get("fetch"))
+        if self.report.structured:
+            self.report.add("archive", {"path": args.path, "records": written, "months": archive.months()})
+        else:
+            print(f"Archived {written} new records in {args.path}")
+
+    @needs("calendar")
+    def audit(self):
+        from replan.archive import EntryArchive
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("path", type=str, help="Directory of the archive")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        archive = EntryArchive(args.path, zone=self.rp.zone)
+        months = self.rp.split_months()
+        records = []
+        for k in sorted(months):
+            m = months[k]
+            totals = m.archive_totals(archive)
+            day_seconds = totals.day_seconds()
+            hours = totals.day_hours(m.get_labor_hours)
+            checked = check_for_expected_hours(dict.fromkeys(hours), m.get_labor_hours, hours=hours)
+            records.append({
+                "year": k[0],
+                "month": k[1],
+                "days": len(hours),
+                "total_hours": checked.aggregates["total_hours"],
+                "balance": checked.aggregates["balance"],
+                "summary": to_percents(*m.calc_project_and_total_seconds(day_seconds=list(day_seconds.values())))
+            })
+
+        if self.report.structured:
+            self.report.add("audit", records)
+            return
+        for r in records:
+            shares = ", ".join([f"{p} {perc}%" for p, perc in r["summary"].items() if perc > 0.0])
+            print(f"{r['year']}-{r['month']:02d}: {r['total_hours']:>6.1f}h on {r['days']:>2d} days; "
+                  f"+/- {r['balance']:>+6.1f}h; {shares}")
+        print(mk_headline(sgn="-"))
+        print(f"Balance: {sum([r['balance'] for r in records]):>+6.1f}h")
+
+    @needs("planner")
+    def query(self):
+        from replan.archive import EntryArchive
+        from replan.entry_index import query, group_keys
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("path", type=str, help="Directory of the archive, see the archive command")
+        parser.add_argument("--tag", "-t", type=str, action="append", default=[], help="Only entries with this tag")
+        parser.add_argument("--without", "-w", type=str, action="append", default=[], help="Only entries without this tag")
+        parser.add_argument("--project", "-p", type=str, action="append", default=[], help="Only entries of this project")
+        parser.add_argument("--ccenter", type=str, action="append", default=[], help="Only entries of this cost center")
+        parser.add_argument("--by", "-b", choices=group_keys, default="project", help="What to group the results by")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        archive = EntryArchive(args.path, zone=self.rp.zone)
+        ccenters = dict([(n, self.rp.projects.get_by_name(n).ccenter) for n in archive.names])
+        projects = None
+        if args.project or args.ccenter:
+            projects = set(args.project) | set([n for n in archive.names if str(ccenters[n]) in args.ccenter])
+
+        results = query(archive, self.pipeline.start, self.pipeline.end, projects=projects,
+                        tags=[t.lower() for t in args.tag], without=[t.lower() for t in args.without],
+                        by=args.by, ccenters=ccenters)
+        keys = sorted(results, key=lambda k: str(k))
+        if self.report.structured:
+            self.report.add("query", [{args.by: k, "hours": results[k][0], "entries": results[k][1]} for k in keys])
+            return
+        for k in keys:
+            hours, entries = results[k]
+            print(f"{str(k):<32s} {hours:>9.2f}h {entries:>7d} entries")
+        print(mk_headline(sgn="-"))
+        print(f"{'Sum':<32s} {sum([r[0] for r in results.values()]):>9.2f}h")
+
+    @needs("holidays")
+    def simulate(self):
+        import numpy as np
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--months", type=int, default=12, help="Number of months to simulate")
+        parser.add_argument("--scenario", type=str, action="append", default=[],
+                            help="What-if capacities as comma separated code=share pairs, e.g. alpha=0.8,beta=0.2; "
+                                 "may be given several times")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        model = self.rp.capacity_model()
+        capacities = [model.capacity]
+        for scenario in args.scenario:
+            capacity = model.capacity.copy()
+            for pair in scenario.split(","):
+                code, share = pair.split("=")
+                capacity[model.names.index(self.rp.projects.get_by_code(code.strip()).name)] = float(share)
+            capacities.append(capacity)
+
+        dates, names, levels, spills = self.rp.simulate_capacity(args.months, capacities=np.array(capacities))
+        labels = ["as configured"] + args.scenario
+        if self.report.structured:
+            self.report.add("simulation", [
+                {"scenario": labels[s], "year": y, "month": m, "unallocated": spills[s, t] * 100,
+                 "projects": dict([(p, levels[s, t, i] * 100) for i, p in enumerate(names)])}
+                for s in range(len(labels)) for t, (y, m) in enumerate(dates)])
+            return
+
+        for s, label in enumerate(labels):
+            print(mk_headline(f"Scenario: {label}", "="))
+            for t, (y, m) in enumerate(dates):
+                shares = ", ".join([f"{p} {levels[s, t, i] * 100:.0f}%" for i, p in enumerate(names) if levels[s, t, i] > 0.005])
+                print(f"{y}-{m:02d}: {shares}; unallocated {spills[s, t] * 100:.0f}%")
+
+    @needs("checks")
+    def batch(self):
+        from replan.batch import run_batch, write_ezve_file
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--jobs", "-j", type=int, default=None, help="Number of months computed in parallel")
+        parser.add_argument("--to-dir", "-t", type=str, default=None, help="Where to write the EZVE file of every month")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        reports, total = run_batch(self.rp, args.jobs)
+
+        rollups = self.pipeline.get("rollups")
+        for r in reports:
+            if r["complete"]:
+                rollups.add(r["year"], r["month"], r["project_seconds"], r["total_seconds"], r["available"])
+        rollups.save()
+
+        if args.to_dir is not None:
+            os.makedirs(args.to_dir, exist_ok=True)
+            for r in reports:
+                write_ezve_file(os.path.join(args.to_dir, f"ezve-{r['year']}-{r['month']:02d}.tsv"), r["ezve"])
+
+        if self.report.structured:
+            self.report.add("months", [dict([(k, r[k]) for k in ("year", "month", "summary", "ezve")]) for r in reports])
+            self.report.add("rollup", {"months": total["months"], "summary": total["summary"]})
+            return
+
+        for r in reports:
+            print(mk_headline(f"{r['year']}-{r['month']:02d}", "="))
+            for p in r["summary"]:
+                if r["summary"][p] > 0.0:
+                    print(f"==> Project {p}: {r['summary'][p]}%")
+        print(mk_headline(f"All {total['months']} months", "="))
+        for p in total["summary"]:
+            if total["summary"][p] > 0.0:
+                print(f"==> Project {p}: {total['summary'][p]}%")
+        print(mk_headline(sgn="="))
+
+    @needs()
+    def team(self):
+        from replan.ezve_matrix import EzveMatrix
+        from replan.team import run_team
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("source", type=str, help="Directory or manifest with the configs of the team")
+        parser.add_argument("--out", "-o", type=str, default="team_results", help="Where to write the results per user")
+        parser.add_argument("--jobs", "-j", type=int, default=None, help="Number of users processed in parallel")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        results = run_team(args.source, self.pipeline.start, self.pipeline.end, args.out,
+                           jobs=args.jobs, no_checks=self.pipeline.args.no_checks)
+
+        # Only the users of this run; the directory may hold files of earlier runs
+        users = set([r["user"] for r in results if r["okay"]])
+        EzveMatrix.from_ezve_files(args.out, users=users).save(os.path.join(args.out, matrix_file_name))
+
+        if self.report.structured:
+            self.report.add("team", [dict([(k, r[k]) for k in r if k != "traceback"]) for r in results])
+            return
+
+        for r in results:
+            if r["okay"]:
+                print(f"==> {r['user']:<20s} {'OK' if r['checks_okay'] else 'checks not OK'}: {r['file']}")
+            else:
+                print(f"==> {r['user']:<20s} FAILED: {r['error']}")
+
+    @needs()
+    def ccenters(self):
+        from replan.ezve_matrix import EzveMatrix
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("source", type=str, help="Output directory of a team run or a saved matrix")
+        parser.add_argument("--ccenter", "-C", type=int, default=None, help="Show who booked to this cost center")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        if os.path.isdir(args.source):
+            matrix_file = os.path.join(args.source, matrix_file_name)
+            if os.path.exists(matrix_file):
+                m = EzveMatrix.load(matrix_file)
+            else:
+                m = EzveMatrix.from_ezve_files(args.source)
+                m.save(matrix_file)
+        else:
+            m = EzveMatrix.load(args.source)
+
+        year, month = self.pipeline.start.year, self.pipeline.start.month
+        if args.ccenter is not None:
+            people = m.people(args.ccenter, year, month)
+            if self.report.structured:
+                self.report.add("people", [{"user": u, "person_days": people[u]} for u in sorted(people)])
+                return
+            for u in sorted(people):
+                print(f"==> {u:<20s}: {people[u]:>6.2f} days")
+            return
+
+        fte = m.fte(year, month)
+        days = m.person_days(year, month)
+        if self.report.structured:
+            self.report.add("ccenters", [{"ccenter": cc, "fte": fte[cc], "person_days": days[cc]} for cc in sorted(fte)])
+            return
+        for cc in sorted(fte):
+            print(f"==> CC {cc:05d}: {fte[cc]:>6.2f} FTE ({days[cc]:>6.2f} person days)")
+
+    @needs()
+    def bench(self):
+        from replan import benchmark
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--scales", type=str, default="1,2,4", help="Comma separated numbers of years to generate")
+        parser.add_argument("--workspaces", type=int, default=1, help="Workspaces of the synthetic account")
+        parser.add_argument("--projects", type=int, default=6, help="Projects per workspace")
+        parser.add_argument("--entries-per-day", type=int, default=8, help="Entries per workday")
+        parser.add_argument("--seed", type=int, default=1, help="Seed of the generator")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        results = benchmark.run_benchmark(scales=[int(x) for x in args.scales.split(",")],
+                                          workspaces=args.workspaces, projects=args.projects,
+                                          entries_per_day=args.entries_per_day, seed=args.seed)
+        if self.report.structured:
+            self.report.add("benchmark", results)
+        else:
+            benchmark.output_benchmark(results)
+        if any([r["differences"] for r in results]):
+            log.error("Results differ from the reference implementation")
+            self.report.close()
+            exit(1)
+
+    @needs()
+    def fake_toggl(self):
+        from replan.fake_toggl import FakeToggl, serve
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--years", type=str, default="2018", help="Comma separated years to generate entries for")
+        parser.add_argument("--workspaces", type=int, default=1, help="Workspaces of the synthetic account")
+        parser.add_argument("--projects", type=int, default=6, help="Projects per workspace")
+        parser.add_argument("--entries-per-day", type=int, default=4, help="Entries per workday")
+        parser.add_argument("--seed", type=int, default=1, help="Seed of the generator")
+        parser.add_argument("--latency", type=float, default=0.0, help="Seconds every request takes")
+        parser.add_argument("--rate-limit", type=int, default=None, help="Requests per second before answering 429")
+        parser.add_argument("--page-size", type=int, default=50, help="Entries per page of the detailed report")
+        parser.add_argument("--write-config", type=str, default=None,
+                            help="Write the config of the account to this file instead of serving it; "
+                                 "runs with that config use the fake Toggl in process")
+        parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+        parser.add_argument("--port", "-p", type=int, default=8766, help="Port to listen on")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        settings = {
+            "years": [int(y) for y in args.years.split(",")],
+            "workspaces": args.workspaces,
+            "projects": args.projects,
+            "entries_per_day": args.entries_per_day,
+            "seed": args.seed,
+            "latency": args.latency,
+            "rate_limit": args.rate_limit,
+            "page_size": args.page_size
+        }
+        app = FakeToggl.from_settings(settings)
+        if args.write_config is not None:
+            with open(args.write_config, "w") as f:
+                f.write(app.account.config_yaml(fake=settings))
+            print(f"Config of the fake account written to {args.write_config}")
+            return
+        serve(app, host=args.host, port=args.port)
+
+    @needs("api", "calendar")
+    def serve(self):
+        from replan import daemon
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+        parser.add_argument("--port", "-p", type=int, default=8765, help="Port to listen on")
+        parser.add_argument("--socket", type=str, default=None, help="Listen on this Unix socket instead of a port")
+        parser.add_argument("--interval", "-i", type=int, default=300, help="Seconds between background syncs")
+        parser.add_argument("--token", type=str, default=os.environ.get("REPLAN_TOKEN"),
+                            help="Token POST requests have to send in the X-Replan-Token header; "
+                                 "generated for a TCP port if not given")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        daemon.serve(self.pipeline, host=args.host, port=args.port, socket_path=args.socket, interval=args.interval,
+                     token=args.token)
+
+    @needs("api", "calendar")
+    def watch(self):
+        from replan.watch import watch
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--interval", "-i", type=int, default=60, help="Seconds between two polls")
+        args, classlist = parser.parse_known_args(sys.argv[2:])
+
+        if self.rp.totals is not None:
+            raise ValueError("Watching needs the entries, it can't be done in streaming mode")
+        watch(self.rp, self.report, interval=args.interval)
+
+    @needs("api")
     def imp(self):
         parser = argparse.ArgumentParser()
         parser.add_argument("--csv-file", type=str, help="What CSV file to parse")
         args, classlist = parser.parse_known_args()
         self.rp.add_from_csv(args.csv_file)
 
+    @needs("api")
     def add(self):
         parser = argparse.ArgumentParser()
         parser.add_argument("project", type=str)
@@ -763,6 +1626,7 @@ class SubCommandSplitter:
 
         self.rp.add(args.project, args.description, args.tags, date_start, date_end)
 
+    @needs("api")
     def add_default_break(self):
         parser = argparse.ArgumentParser()
         parser.add_argument("date", type=str)
@@ -790,6 +1654,28 @@ def main():
     parser.add_argument("--end", "-e", type=str, default=False, help="End date of period to be evaluated")
     parser.add_argument("--config", "-c", default=config_file, help="File containing configuration")
     parser.add_argument("--no-checks", "-n", action="store_true", help="Skip all checks")
+    parser.add_argument("--no-config-cache", action="store_true", help="Always parse the config file from scratch")
+    parser.add_argument("--from-snapshot", type=str, default=None,
+                        help="Load the entries of the period from a snapshot (see the snapshot command) instead of Toggl")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Fold the entries into totals per day and project instead of keeping them; "
+                             "skips the check for gaps and overlaps")
+    parser.add_argument("--full-fetch", action="store_true",
+                        help="Fetch the single entries even if the command only needs the totals of the reports API")
+    parser.add_argument("--compact", action="store_true",
+                        help="Merge back to back entries of the same project and tags before the checks; "
+                             "the worked time stays the sum of the merged entries")
+    parser.add_argument("--async-log", action="store_true", help="Write log output from a background thread")
+    parser.add_argument("--format", "-f", choices=formats, default="text",
+                        help="Output format; json and ndjson are written to stdout, the log to stderr")
+    parser.add_argument("--quiet", "-q", action="store_true",
+                        help="Batch mode: only keep the check findings and final results, skip the per day report")
+    parser.add_argument("--profile", action="store_true",
+                        help="Report wall and CPU time, calls and peak memory of every stage to stderr")
+    parser.add_argument("--api-stats", action="store_true",
+                        help="Report requests, retries, latency and traffic per API endpoint to stderr")
+    parser.add_argument("--profile-dir", type=str, default=None,
+                        help="With --profile, additionally write cProfile stats of every stage to this directory")
 
     # parser.add_argument("--ezve-csv", "-zc", type=str, default=False, help="Write EZVE CSV file")
     # parser.add_argument("--ezve", "-z", action="store_true", default=False, help="Print out EZVE data to console")
@@ -812,31 +1698,43 @@ def main():
     if args.start and args.end:
         start = parse(args.start)
         end = parse(args.end)
+    elif args.command == "batch":
+        start = datetime.date(args.year, 1, 1)
+        end = datetime.date(args.year, 12, 31)
     else:
         (first, last) = monthrange(args.year, args.month)
         start = datetime.date(args.year, args.month, 1)
         end = datetime.date(args.year, args.month, last)
 
-    with open(args.config, "r") as f:
-        config = yaml.load(f)
-
-    rp = ResourcePlanner(start, end, config=config)
+    if args.quiet:
+        log.setLevel(logging.ERROR)
 
-    # if args.add_from_csv:
-    #     rp.add_from_csv(args.add_from_csv)
-    #     return
+    if args.async_log:
+        enable_async_output()
 
-    rp.calculate_percents()
-    rp.apply_holidays()
-    if not args.no_checks:
-        rp.checks()
+    if args.profile:
+        profiler.enable(args.profile_dir)
 
-    s = SubCommandSplitter(rp)
+    s = SubCommandSplitter(Pipeline(args, start, end))
     if not hasattr(s, args.command):
         print(f"Unrecognized command {args.command}")
         parser.print_help()
         exit(1)
     getattr(s, args.command)()
+    if args.profile:
+        if s.pipeline.report.structured:
+            s.pipeline.report.add("profile", profiler.records())
+        else:
+            profiler.output(sys.stderr)
+    if args.api_stats and s.pipeline.is_built("planner") and s.rp.api_session is not None:
+        from replan.api_client import check_attached
+        check_attached(s.rp.api_session, fetched=s.pipeline.is_built("fetch"))
+        adapter = s.rp.api_session.adapter
+        if s.pipeline.report.structured:
+            s.pipeline.report.add("api", adapter.records())
+        else:
+            adapter.output(sys.stderr)
+    s.pipeline.report.close()
 
     # if args.mail:
     #     rp.output_planning()
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import pickle
+
+from replan.config_cache import cache_dir
+from replan.logging import log
+
+__all__ = ["RollupStore", "ewma_shares"]
+
+#: Bump whenever the layout of stored rollups changes
+ROLLUP_VERSION = 1
+
+
+class RollupStore:
+    """
+    Monthly rollups of an account: the seconds per project, the total seconds and the
+    availability of every month that has been computed before
+
+    Stored as a pickle per API key in the cache directory, so that forecasts don't need
+    to fetch the entries of past months again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.months = {}
+
+    @classmethod
+    def for_config(cls, config):
+        digest = hashlib.sha1(str(config.api["api_key"]).encode("utf-8")).hexdigest()
+        return cls(os.path.join(cache_dir, f"rollups-{digest}.pickle")).load()
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                version, months = pickle.load(f)
+            if version == ROLLUP_VERSION:
+                self.months = months
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.debug(f"Ignoring unreadable rollups {self.path}: {e}")
+        return self
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_file = f"{self.path}.{os.getpid()}"
+            with open(tmp_file, "wb") as f:
+                pickle.dump((ROLLUP_VERSION, self.months), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            log.debug(f"Could not write rollups {self.path}: {e}")
+
+    def add(self, year, month, project_seconds, total_seconds, available):
+        self.months[(year, month)] = {
+            "project_seconds": dict(project_seconds),
+            "total_seconds": total_seconds,
+            "available": available
+        }
+
+    def before(self, year, month, n):
+        """
+        The last ``n`` rollups before the given month, oldest first
+
+        :rtype: list
+        """
+        keys = sorted([k for k in self.months if k < (year, month)])[-n:]
+        return [self.months[k] for k in keys]
+
+
+def ewma_shares(rollups, alpha=0.5, exclude=()):
+    """
+    Exponentially weighted share of the time worked of every project, the most recent
+    month weighing ``alpha``
+
+    A month's shares are relative to the time that was available for work, so that months
+    with many absences don't pull the forecast down.
+
+    :param rollups: Monthly rollups, oldest first
+    :param exclude: Projects to leave out, e.g. vacations
+    :rtype: dict
+    """
+    shares = {}
+    for i, r in enumerate(rollups):
+        total = r["total_seconds"] * (r["available"] or 1.0)
+        month = dict([(p, s / total) for p, s in r["project_seconds"].items() if p not in exclude and total > 0])
+        for p in set(shares) | set(month):
+            x = month.get(p, 0.0)
+            shares[p] = x if i == 0 else alpha * x + (1 - alpha) * shares.get(p, 0.0)
+    return shares
@@ -0,0 +1,148 @@
+import json
+import os
+
+from replan.logging import log
+
+__all__ = ["SnapshotError", "save_snapshot", "load_snapshot", "SNAPSHOT_VERSION"]
+
+#: Bump whenever the layout of snapshots changes
+SNAPSHOT_VERSION = 2
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _header(rp):
+    return {
+        "format": "replan-snapshot",
+        "version": SNAPSHOT_VERSION,
+        "config": rp.config.digest(),
+        "timezone": rp.zone.name,
+        "compacted": rp.compacted,
+        "start": rp.start.isoformat(),
+        "end": rp.end.isoformat()
+    }
+
+
+def save_snapshot(rp, path):
+    """
+    Writes the loaded state of a planner, i.e. its days with all entries, the seconds per
+    project and the total time, to a compressed numpy archive
+
+    Entries are stored as columns: day, start and end in epoch seconds, worked seconds, id
+    and indexes into the tables of project names and tag sets. The ids of the parts of
+    compacted entries are stored in one column with the number of parts of every entry,
+    0 if it wasn't compacted. A JSON header holds the version of the format, a digest of
+    the config, the period and whether the days were compacted.
+
+    :type rp: replan.resource_planning.ResourcePlanner
+    """
+    import numpy as np
+
+    names, tag_sets = {}, {}
+    columns = dict([(c, []) for c in ("day", "start", "end", "seconds", "id", "name", "tags", "parts")])
+    merged = []
+    for d in rp.days:
+        day = d.toordinal()
+        for e in rp.days[d]:
+            columns["day"].append(day)
+            columns["start"].append(e.start_ts)
+            columns["end"].append(e.end_ts)
+            columns["seconds"].append(e.seconds)
+            columns["id"].append(-1 if e.id is None else e.id)
+            columns["name"].append(names.setdefault(e.name, len(names)))
+            columns["tags"].append(tag_sets.setdefault("\t".join(e.tags), len(tag_sets)))
+            columns["parts"].append(0 if e.merged is None else len(e.merged))
+            merged += e.merged or []
+
+    project_seconds = getattr(rp, "project_seconds", {})
+    arrays = {
+        "header": np.array(json.dumps(_header(rp))),
+        "day": np.array(columns["day"], dtype=np.int32),
+        "start": np.array(columns["start"], dtype=np.int64),
+        "end": np.array(columns["end"], dtype=np.int64),
+        "seconds": np.array(columns["seconds"], dtype=np.int64),
+        "id": np.array(columns["id"], dtype=np.int64),
+        "name": np.array(columns["name"], dtype=np.int32),
+        "tags": np.array(columns["tags"], dtype=np.int32),
+        "parts": np.array(columns["parts"], dtype=np.int32),
+        "merged": np.array(merged, dtype=np.int64),
+        "names": np.array(list(names), dtype=str),
+        "tag_sets": np.array(list(tag_sets), dtype=str),
+        "project_names": np.array(list(project_seconds), dtype=str),
+        "project_seconds": np.array(list(project_seconds.values()), dtype=float),
+        "total_seconds": np.array(rp.total_time.total_seconds() if hasattr(rp, "total_time") else 0.0)
+    }
+
+    tmp_file = f"{path}.{os.getpid()}"
+    with open(tmp_file, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_file, path)
+    log.info(f"Wrote snapshot of {len(columns['day'])} entries on {len(rp.days)} days to {path}")
+
+
+def load_snapshot(rp, path):
+    """
+    Restores the state written by :func:`save_snapshot` into a planner of the same period
+    and config
+
+    :type rp: replan.resource_planning.ResourcePlanner
+    :raises SnapshotError: If the snapshot has another version, config or period, or its days
+                           were compacted and the planner's weren't to be or vice versa,
+                           see :attr:`ResourcePlanner.compacted`
+    """
+    import datetime
+    import numpy as np
+    from replan.collections import StrictList
+    from replan.entry import Entry
+
+    try:
+        data = np.load(path, allow_pickle=False)
+    except ValueError:
+        raise SnapshotError(f"{path} is not a snapshot")
+    if not hasattr(data, "files"):
+        raise SnapshotError(f"{path} is not a snapshot")
+
+    with data:
+        try:
+            header = json.loads(str(data["header"]))
+        except (KeyError, ValueError):
+            raise SnapshotError(f"{path} is not a snapshot")
+        if header.get("format") != "replan-snapshot" or header.get("version") != SNAPSHOT_VERSION:
+            raise SnapshotError(f"{path} has version {header.get('version')}, expected {SNAPSHOT_VERSION}")
+        expected = _header(rp)
+        if header["config"] != expected["config"]:
+            raise SnapshotError(f"{path} was taken with another config")
+        if (header["start"], header["end"]) != (expected["start"], expected["end"]):
+            raise SnapshotError(f"{path} covers {header['start']} to {header['end']}, "
+                                f"not {expected['start']} to {expected['end']}")
+        if header["compacted"] != expected["compacted"]:
+            raise SnapshotError(f"{path} was taken {'with' if header['compacted'] else 'without'} --compact")
+
+        columns = [data[c].tolist() for c in ("day", "start", "end", "seconds", "id", "name", "tags", "parts")]
+        merged = data["merged"].tolist()
+        names = data["names"].tolist()
+        tag_sets = [t.split("\t") if t else [] for t in data["tag_sets"].tolist()]
+        project_seconds = dict(zip(data["project_names"].tolist(), data["project_seconds"].tolist()))
+        total_seconds = float(data["total_seconds"])
+
+    zone = rp.zone
+    days = {}
+    offset = 0
+    for day, start, end, seconds, id, name, tags, parts in zip(*columns):
+        d = days.get(day)
+        if d is None:
+            d = days[day] = datetime.date.fromordinal(day)
+            rp.days[d] = StrictList(Entry)
+        e = Entry(names[name], start, end, list(tag_sets[tags]), id=None if id < 0 else id, zone=zone,
+                  seconds=None if seconds == end - start else seconds)
+        if parts:
+            e.merged = tuple(merged[offset:offset + parts])
+            offset += parts
+        rp.days[d].append(e)
+
+    rp.project_seconds = project_seconds
+    rp.total_time = datetime.timedelta(seconds=total_seconds)
+    log.info(f"Restored {len(columns[0])} entries on {len(rp.days)} days from {path}")
+    return rp.days
@@ -0,0 +1,243 @@
+import datetime
+import json
+import random
+from datetime import timedelta as tdelta
+
+__all__ = ["SyntheticAccount", "FakeApi"]
+
+fixed_holidays = {1: [1], 5: [1], 10: [3], 12: [25, 26]}
+tag_choices = [[], [], ["dev"], ["meeting"], ["review", "dev"], ["distribute"], ["overhead"]]
+
+
+class SyntheticAccount:
+    """
+    Randomly generated, but reproducible Toggl account with a matching config
+
+    Every workday that isn't a holiday, vacation, sick or course day gets
+    ``entries_per_day`` entries of the account's projects with a break of an hour in
+    between, starting at 7:00 UTC. Entries are kept as Toggl delivers them:
+    plain dicts with naive UTC ``start``, ``stop`` and ``at`` datetimes.
+    """
+    def __init__(self, years=(2018,), workspaces=1, projects=6, entries_per_day=4, seed=1):
+        self.years = list(years)
+        self.rnd = random.Random(seed)
+        self.entries_per_day = entries_per_day
+        self.workspaces = [{"id": w + 1, "name": f"Workspace {w + 1}"} for w in range(workspaces)]
+        self.projects = []
+        self.by_project = {}
+        self.holidays = {}
+        self._next_id = 1
+
+        pid = 1
+        for ws in self.workspaces:
+            for p in range(projects):
+                self.projects.append({"id": pid, "wid": ws["id"], "name": f"Project {pid:03d}",
+                                      "code": f"p{pid:03d}", "ccenter": 10000 + pid})
+                pid += 1
+            self.projects.append({"id": pid, "wid": ws["id"], "name": f"Sonstiges {ws['id']}",
+                                  "code": f"sonst{ws['id']}", "ccenter": 99000 + ws["id"], "ezve_ignore": True})
+            pid += 1
+        self._pause_projects = dict([(p["wid"], p) for p in self.projects if p.get("ezve_ignore")])
+
+        for y in self.years:
+            self.holidays[y] = self._gen_holidays(y)
+        self._gen_entries()
+
+    @property
+    def entries(self):
+        return [e for p in self.projects for e in self.by_project.get(p["id"], [])]
+
+    @property
+    def start(self):
+        return datetime.date(self.years[0], 1, 1)
+
+    @property
+    def end(self):
+        return datetime.date(self.years[-1], 12, 31)
+
+    def _gen_holidays(self, year):
+        rnd = self.rnd
+        vacations = {}
+        for month in rnd.sample(range(1, 13), 2):
+            first = rnd.randint(1, 20)
+            vacations.setdefault(month, []).append([first, first + 6])
+        sick = {}
+        for month in rnd.sample(range(1, 13), 2):
+            sick.setdefault(month, []).append(rnd.randint(1, 28))
+        month = rnd.randint(1, 12)
+        first = rnd.randint(1, 26)
+        courses = {month: [[first, first + 1]]}
+        return {"Holidays": fixed_holidays, "Vacations": vacations, "Sick": sick, "Courses": courses}
+
+    def days_off(self):
+        from replan.working_hours import parse_holidays
+        return set([d for d, _ in parse_holidays(self.holidays)])
+
+    def _gen_entries(self):
+        rnd = self.rnd
+        off = self.days_off()
+        work = [p for p in self.projects if not p.get("ezve_ignore")]
+        d = self.start
+        while d <= self.end:
+            if d.weekday() < 5 and d not in off:
+                t = datetime.datetime.combine(d, datetime.time(7, 0))
+                for k in range(self.entries_per_day):
+                    p = rnd.choice(work)
+                    dur = tdelta(minutes=rnd.choice([30, 60, 90, 120]))
+                    self._add_entry(p, t, t + dur, rnd.choice(tag_choices))
+                    t += dur
+                    if rnd.random() < 0.05:
+                        # A small gap now and then
+                        t += tdelta(minutes=5)
+                    if k == self.entries_per_day // 2 - 1:
+                        self._add_entry(self._pause_projects[p["wid"]], t, t + tdelta(hours=1), ["Pause"])
+                        t += tdelta(hours=1)
+            d += tdelta(days=1)
+
+    def _add_entry(self, project, start, stop, tags, description="synthetic"):
+        e = {
+            "id": self._next_id,
+            "wid": project["wid"],
+            "pid": project["id"],
+            "start": start,
+            "stop": stop,
+            "duration": int((stop - start).total_seconds()),
+            "description": description,
+            "tags": list(tags),
+            "at": stop
+        }
+        self._next_id += 1
+        self.by_project.setdefault(project["id"], []).append(e)
+        return e
+
+    def create_entry(self, time_entry):
+        """
+        Adds an entry as sent to the API, with ``start`` as ISO string and ``duration``
+        in seconds
+        """
+        from dateutil.parser import parse
+
+        start = parse(time_entry["start"])
+        if start.tzinfo is not None:
+            start = start.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        stop = start + tdelta(seconds=time_entry["duration"])
+        project = [p for p in self.projects if p["id"] == time_entry["pid"]][0]
+        return self._add_entry(project, start, stop, time_entry.get("tags") or [],
+                               time_entry.get("description", ""))
+
+    def config_yaml(self, fake=None):
+        """
+        The config of the account as YAML text
+
+        :param fake: Settings of the fake Toggl serving the account, see
+                     :meth:`replan.fake_toggl.FakeToggl.from_settings`
+        """
+        lines = ["--- !Config",
+                 "api:",
+                 "  api_key: synthetic"]
+        if fake is not None:
+            lines.append("  fake:")
+            for k in sorted(fake):
+                if fake[k] is not None:
+                    lines.append(f"    {k}: {json.dumps(fake[k])}")
+        lines += ["settings:",
+                  "  worktimings: [9, 18]",
+                  "  weekends: [6, 7]",
+                  "  ezve_rounding: 10",
+                  "  mail_summary_recipients: [someone@example.com]",
+                  "holidays:"]
+        for y in self.years:
+            lines.append(f"  {y}:")
+            for htype, months in self.holidays[y].items():
+                lines.append(f"    {htype}:")
+                for m in sorted(months):
+                    lines.append(f"      {m}: {months[m]}")
+        lines.append("projects: !ProjectDict")
+        lines.append("  definitions:")
+        for p in self.projects:
+            ignore = ", ezve_ignore: true" if p.get("ezve_ignore") else ""
+            lines.append(f"    - !Project {{code: {p['code']}, name: {p['name']}, ccenter: {p['ccenter']}{ignore}}}")
+        for i, special in enumerate(["Vacations", "Sick", "Courses"]):
+            lines.append(f"    - !Project {{code: {special.lower()}, name: {special}, ccenter: {i}, ezve_ignore: true}}")
+
+        # The first project of every workspace is distributed to the next two
+        lines.append("productivity_mappings: !PMappingDict")
+        lines.append("  mappings:")
+        for ws in self.workspaces:
+            work = [p for p in self.projects if p["wid"] == ws["id"] and not p.get("ezve_ignore")]
+            if len(work) < 3:
+                continue
+            lines.append("    - !PMapping")
+            lines.append(f"      code: {work[0]['code']}")
+            lines.append("      mappings:")
+            for target in work[1:3]:
+                lines.append(f"        - !Mapping {{productive_project: {target['code']}, fraction: 0.5}}")
+
+        lines.append("templates:")
+        lines.append('  mail: ["$pmonth/$pyear", "$pdata", "$psum", "$nmonth/$nyear", "$ndata", "$rest"]')
+        lines.append('  project_line: "* $project: $percentage%"')
+        lines.append('  sum_line: "* Sum ${percsum}%"')
+        return "\n".join(lines) + "\n"
+
+    def config(self):
+        """
+        :rtype: replan.yaml_classes.Config
+        """
+        import yaml
+        from replan.yaml_classes import Loader
+
+        return yaml.load(self.config_yaml(), Loader=Loader).compile()
+
+    def api(self):
+        """
+        An in-process stand-in for the Toggl API client serving this account
+
+        :rtype: FakeApi
+        """
+        return FakeApi(self)
+
+
+class _Record:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.__dict__})"
+
+
+class _TimeEntries:
+    def __init__(self, account, pid=None):
+        self.account = account
+        self.pid = pid
+
+    def list(self):
+        return [_Record(**e) for e in self.account.by_project.get(self.pid, [])]
+
+    def create(self, time_entry):
+        return _Record(**self.account.create_entry(time_entry))
+
+
+class _Workspaces(list):
+    def get(self, wid):
+        return [w for w in self if w.id == wid][0]
+
+
+class FakeWorkspace:
+    def __init__(self, account, ws):
+        self.id = ws["id"]
+        self.name = ws["name"]
+        self.projects = [_Record(id=p["id"], wid=p["wid"], name=p["name"], time_entries=_TimeEntries(account, p["id"]))
+                         for p in account.projects if p["wid"] == self.id]
+
+    def __str__(self):
+        return self.name
+
+
+class FakeApi:
+    """
+    Serves a :class:`SyntheticAccount` through the object interface of the Toggl client
+    """
+    def __init__(self, account):
+        self.account = account
+        self.workspaces = _Workspaces([FakeWorkspace(account, ws) for ws in account.workspaces])
+        self.time_entries = _TimeEntries(account)
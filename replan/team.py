@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from replan.logging import log
+
+__all__ = ["find_configs", "merge_shared", "run_user", "run_team"]
+
+#: Name of the config in a team directory holding the definitions shared by everyone
+shared_config_name = "shared.yaml"
+
+
+def find_configs(source):
+    """
+    Finds the configs of a team
+
+    ``source`` is either a directory, in which every ``*.yaml`` file is the config of
+    the user named like the file and ``shared.yaml`` holds shared definitions, or a
+    manifest like this::
+
+        shared: shared.yaml
+        users:
+          alice: alice.yaml
+          bob: /somewhere/else/bob.yaml
+
+    Relative paths in a manifest are relative to the manifest.
+
+    :return: Path of the shared config (or None) and the config paths by user name
+    :rtype: (str, dict)
+    """
+    if os.path.isdir(source):
+        shared = None
+        users = {}
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if name == shared_config_name:
+                shared = path
+            elif name.endswith((".yaml", ".yml")):
+                users[os.path.splitext(name)[0]] = path
+        return shared, users
+
+    import yaml
+
+    with open(source, "r") as f:
+        manifest = yaml.safe_load(f)
+    base = os.path.dirname(os.path.abspath(source))
+    shared = manifest.get("shared")
+    if shared is not None:
+        shared = os.path.join(base, shared)
+    users = dict([(u, os.path.join(base, p)) for u, p in manifest["users"].items()])
+    return shared, users
+
+
+def merge_shared(config, shared):
+    """
+    Fills everything a user's config doesn't define itself from the shared config,
+    e.g. the project and cost center definitions and productivity mappings
+    """
+    merged = False
+    for attr, val in vars(shared).items():
+        if attr.startswith("_") or hasattr(config, attr):
+            continue
+        setattr(config, attr, val)
+        merged = True
+    if merged:
+        config._holidays = None
+        config.compile()
+    return config
+
+
+def run_user(user, config_path, shared, start, end, out_dir, no_checks=False, log_level=None):
+    """
+    Runs the pipeline of a single user and writes the results to ``<out_dir>/<user>.json``
+    and the EZVE data to ``<out_dir>/<user>.ezve.tsv``
+
+    Failures are returned instead of raised so that they don't affect other users.
+
+    :param log_level: Level of the log in the worker process, left as it is if None
+    :rtype: dict
+    """
+    if log_level is not None:
+        # Pools only take an initializer from Python 3.7 on
+        log.setLevel(log_level)
+
+    from replan.batch import write_ezve_file
+    from replan.config_cache import load_config
+    from replan.output import json_default
+    from replan.resource_planning import ResourcePlanner
+    from replan.rollups import RollupStore
+
+    try:
+        config = load_config(config_path)
+        if shared is not None:
+            merge_shared(config, shared)
+
+        rp = ResourcePlanner(start, end, config=config)
+        rp.calculate_percents()
+        rp.apply_holidays()
+        checks = [] if no_checks else rp.checks()
+
+        rollups = RollupStore.for_config(config)
+        rp.record_rollup(rollups)
+
+        ezve = rp.ezve_records()
+        result = {
+            "user": user,
+            "start": start,
+            "end": end,
+            "checks": [c.as_dict() for c in checks],
+            "summary": rp.calc_results(),
+            "planning": rp.planning_record(rp.forecast(rollups)),
+            "ezve": ezve
+        }
+
+        out_file = os.path.join(out_dir, f"{user}.json")
+        with open(out_file, "w") as f:
+            json.dump(result, f, default=json_default)
+        write_ezve_file(os.path.join(out_dir, f"{user}.ezve.tsv"), ezve)
+
+        return {"user": user, "okay": True, "checks_okay": all(checks), "file": out_file}
+    except Exception as e:
+        return {"user": user, "okay": False, "error": f"{e.__class__.__name__}: {e}",
+                "traceback": traceback.format_exc()}
+
+
+def run_team(source, start, end, out_dir, jobs=None, no_checks=False):
+    """
+    Runs the pipeline of every user of a team in a process pool
+
+    The shared config is loaded once and handed to every worker.
+
+    :param source: Team directory or manifest, see :func:`find_configs`
+    :return: Status of every user, ordered by user name
+    :rtype: list
+    """
+    from replan.config_cache import load_config
+
+    shared_path, users = find_configs(source)
+    shared = load_config(shared_path) if shared_path is not None else None
+    os.makedirs(out_dir, exist_ok=True)
+
+    jobs = min(jobs or os.cpu_count() or 1, max(len(users), 1))
+    log.info(f"Running {len(users)} users in {jobs} processes")
+    sys.stdout.flush()
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = dict([(pool.submit(run_user, u, users[u], shared, start, end, out_dir, no_checks, logging.ERROR), u)
+                        for u in users])
+        for f in as_completed(futures):
+            user = futures[f]
+            try:
+                results[user] = f.result()
+            except Exception as e:
+                results[user] = {"user": user, "okay": False, "error": f"{e.__class__.__name__}: {e}"}
+            if not results[user]["okay"]:
+                log.error(f"{user}: {results[user]['error']}")
+
+    return [results[u] for u in sorted(results)]
@@ -0,0 +1,242 @@
+import bisect
+import calendar
+import datetime
+from functools import lru_cache
+
+__all__ = ["Zone", "DayTable", "get_zone", "set_default_zone", "epoch", "DEFAULT_TIMEZONE"]
+
+#: Zone used if the config doesn't set ``settings.timezone``
+DEFAULT_TIMEZONE = "Europe/Berlin"
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_default = DEFAULT_TIMEZONE
+
+
+def epoch(d):
+    """
+    Seconds since the epoch of a datetime; naive datetimes are taken as UTC, like the ones
+    the Toggl API returns
+
+    :rtype: int
+    """
+    if d.tzinfo is None:
+        return calendar.timegm(d.timetuple())
+    return int(d.timestamp())
+
+
+class Zone:
+    """
+    A time zone resolved once into a table of UTC transitions and offsets
+
+    Entries keep their times as int epoch seconds; the zone turns them into local days and
+    local datetimes with a binary search in the table instead of asking pytz every time.
+    Every function has a vectorized variant working on numpy arrays of epoch seconds.
+    """
+    def __init__(self, name=DEFAULT_TIMEZONE):
+        import pytz
+
+        self.name = name
+        tz = pytz.timezone(name)
+        transitions = getattr(tz, "_utc_transition_times", None)
+        if transitions:
+            self.transitions = [-2 ** 62] + [calendar.timegm(t.timetuple()) for t in transitions[1:]]
+            self.offsets = [int(info[0].total_seconds()) for info in tz._transition_info]
+        else:
+            self.transitions = [-2 ** 62]
+            self.offsets = [int(tz.utcoffset(datetime.datetime(2000, 1, 1)).total_seconds())]
+        self._tzinfos = {}
+        self._arrays = None
+
+    def __repr__(self):
+        return f"Zone({self.name!r})"
+
+    def __reduce__(self):
+        return get_zone, (self.name,)
+
+    def offset(self, ts):
+        """
+        UTC offset in seconds at the given epoch second
+        """
+        return self.offsets[bisect.bisect_right(self.transitions, ts) - 1]
+
+    def local_day(self, ts):
+        """
+        :rtype: datetime.date
+        """
+        return datetime.date.fromordinal(_EPOCH_ORDINAL + (ts + self.offset(ts)) // 86400)
+
+    def local(self, ts):
+        """
+        The epoch second as datetime in the zone, for display
+
+        :rtype: datetime.datetime
+        """
+        off = self.offset(ts)
+        tz = self._tzinfos.get(off)
+        if tz is None:
+            tz = self._tzinfos[off] = datetime.timezone(datetime.timedelta(seconds=off))
+        return datetime.datetime.fromtimestamp(ts, tz)
+
+    def localize(self, d):
+        """
+        Epoch seconds of a naive datetime of the zone's wall clock
+
+        :rtype: int
+        """
+        wall = calendar.timegm(d.timetuple())
+        return wall - self.offset(wall - self.offset(wall))
+
+    def _table(self):
+        import numpy as np
+
+        if self._arrays is None:
+            self._arrays = np.array(self.transitions, dtype=np.int64), np.array(self.offsets, dtype=np.int64)
+        return self._arrays
+
+    def offset_array(self, ts):
+        """
+        Vectorized :meth:`offset`
+
+        :param ts: Epoch seconds
+        :rtype: numpy.ndarray
+        """
+        import numpy as np
+
+        transitions, offsets = self._table()
+        ts = np.asarray(ts, dtype=np.int64)
+        return offsets[np.searchsorted(transitions, ts, side="right") - 1]
+
+    def local_day_numbers(self, ts):
+        """
+        Vectorized :meth:`local_day` returning days since the epoch
+
+        :rtype: numpy.ndarray
+        """
+        import numpy as np
+
+        ts = np.asarray(ts, dtype=np.int64)
+        return (ts + self.offset_array(ts)) // 86400
+
+    def local_wall_times(self, ts):
+        """
+        Vectorized local wall clock times as naive ``datetime64[s]``, for display
+
+        :rtype: numpy.ndarray
+        """
+        import numpy as np
+
+        ts = np.asarray(ts, dtype=np.int64)
+        return (ts + self.offset_array(ts)).astype("datetime64[s]")
+
+    def midnight(self, day):
+        """
+        Epoch seconds of the local midnight starting the given day
+
+        :rtype: int
+        """
+        return self.localize(datetime.datetime.combine(day, datetime.time()))
+
+    @staticmethod
+    def day(number):
+        """
+        The date of a day number as returned by :meth:`local_day_numbers`
+
+        :rtype: datetime.date
+        """
+        return datetime.date.fromordinal(_EPOCH_ORDINAL + int(number))
+
+
+class DayTable:
+    """
+    The local midnights of a period as an array of epoch seconds, for assigning entries to
+    the local days they fall on
+
+    Days are found by binary search in the boundaries, so bucketing ``n`` entries into
+    ``d`` days takes O(n log d) and stays correct over DST changes, where days are 23 or
+    25 hours long.
+    """
+    def __init__(self, zone, first, last):
+        """
+        :param first: First day of the period
+        :param last: Last day of the period
+        """
+        import numpy as np
+
+        # Periods given with --start and --end are datetimes
+        first, last = [datetime.date(d.year, d.month, d.day) for d in (first, last)]
+        self.zone = zone
+        self.days = [first + datetime.timedelta(days=i) for i in range((last - first).days + 1)]
+        self.boundaries = np.array([zone.midnight(d) for d in self.days]
+                                   + [zone.midnight(last + datetime.timedelta(days=1))], dtype=np.int64)
+
+    @property
+    def start(self):
+        return int(self.boundaries[0])
+
+    @property
+    def end(self):
+        return int(self.boundaries[-1])
+
+    def index(self, ts):
+        """
+        Index of the day every epoch second falls on; -1 before the period and the number
+        of days after it
+
+        :rtype: numpy.ndarray
+        """
+        import numpy as np
+
+        return np.searchsorted(self.boundaries, np.asarray(ts, dtype=np.int64), side="right") - 1
+
+    def split(self, entries):
+        """
+        Assigns entries to their local days, splitting the ones that cross midnight at the
+        boundary. Parts outside of the period are dropped.
+
+        :param entries: List of :class:`replan.entry.Entry`
+        :return: Generator of (day, entry) tuples; entries that don't cross midnight are
+                 yielded as they are, the others as one new entry per day with the same id
+        """
+        import numpy as np
+        from replan.entry import Entry
+
+        n = len(entries)
+        starts = np.fromiter((e.start_ts for e in entries), dtype=np.int64, count=n)
+        ends = np.fromiter((e.end_ts for e in entries), dtype=np.int64, count=n)
+        first = self.index(starts).tolist()
+        # An entry ending at midnight ends on the day before
+        last = self.index(np.maximum(ends - 1, starts)).tolist()
+
+        count = len(self.days)
+        for e, i, j in zip(entries, first, last):
+            if i == j:
+                if 0 <= i < count:
+                    yield self.days[i], e
+                continue
+            for k in range(max(i, 0), min(j, count - 1) + 1):
+                start = max(e.start_ts, int(self.boundaries[k]))
+                end = min(e.end_ts, int(self.boundaries[k + 1]))
+                yield self.days[k], Entry(e.name, start, end, list(e.tags), id=e.id, zone=e.zone)
+
+
+@lru_cache(maxsize=None)
+def _resolve(name):
+    return Zone(name)
+
+
+def get_zone(name=None):
+    """
+    The resolved zone of the given name, the one of the loaded config if None
+
+    :rtype: Zone
+    """
+    return _resolve(name or _default)
+
+
+def set_default_zone(name):
+    """
+    Sets the zone :func:`get_zone` returns by default, see ``settings.timezone``
+    """
+    global _default
+    _default = name or DEFAULT_TIMEZONE
+    return get_zone()
@@ -0,0 +1,284 @@
+import datetime
+import time
+from datetime import timedelta as tdelta
+
+from replan.checks import day_hours
+from replan.collections import StrictList
+from replan.entry import Entry
+from replan.functions import mk_headline
+from replan.logging import log
+from replan.timezones import epoch
+
+__all__ = ["Watcher", "watch", "LOOKBACK", "FULL_EVERY"]
+
+#: How long before the last sync the entries an incremental poll fetches may start
+LOOKBACK = tdelta(days=1)
+
+#: Every how many polls all entries of the period are fetched again
+FULL_EVERY = 60
+
+
+def _stamp(at):
+    # Time of the last change as epoch seconds; clients deliver it as string or datetime
+    if at is None:
+        return None
+    if isinstance(at, str):
+        from dateutil.parser import parse
+        at = parse(at)
+    return epoch(at)
+
+
+def _signature(e):
+    return e.name, e.start_ts, e.end_ts, tuple(sorted(e.tags))
+
+
+def _key(e):
+    # Entries without an id, e.g. created locally, can't share the key None
+    if e.id is None:
+        return e.start_ts, e.name, tuple(sorted(e.tags))
+    return e.id
+
+
+class Watcher:
+    """
+    Keeps a planner up to date with Toggl by applying only what changed since the last poll
+
+    Entries are tracked by their id together with the time of their last change (or their
+    contents, if Toggl doesn't deliver that); entries without an id by their start, project
+    and tags. New, changed and deleted entries are applied
+    to the day buckets of the planner, and hours, breaks, balance and project seconds are
+    recomputed for the affected days only.
+
+    Polls fetch only the entries that started from ``lookback`` before the last sync on;
+    changes of older entries, e.g. deleting one of last month, are picked up by fetching all
+    entries of the period every ``full_every`` polls.
+    """
+    def __init__(self, rp, lookback=LOOKBACK, full_every=FULL_EVERY):
+        """
+        :param rp: Planner with the working hours calendar set up, but no entries fetched yet
+        :type rp: replan.resource_planning.ResourcePlanner
+        """
+        self.rp = rp
+        self.lookback = lookback
+        self.full_every = full_every
+        self.index = {}
+        self.hours = {}
+        self.seconds = {}
+        self.polls = 0
+        self.synced = None
+        self._touched = None
+        self._client = None
+        self._names = None
+
+    def _versions(self):
+        for ws, stamp, e in self.rp.fetch_entries():
+            stamp = _stamp(stamp)
+            yield _key(e), (stamp if stamp is not None else _signature(e)), e
+
+    def _changed_versions(self, start, end):
+        from dateutil.parser import parse
+
+        rp = self.rp
+        if self._client is None:
+            self._client = rp.reports_client()
+            self._names = {}
+            for ws in rp.ws:
+                self._names.update(self._client.projects(ws.id))
+
+        period_start, period_end = rp.day_table.start, rp.day_table.end
+        for te in self._client.time_entries(start, end):
+            name = self._names.get(te.get("pid"))
+            # Like when fetching all entries, running ones and the ones without a project
+            # of the planner's workspaces are skipped
+            if name is None or not te.get("stop") or te.get("duration", -1) < 0:
+                continue
+            e_start, e_end = epoch(parse(te["start"])), epoch(parse(te["stop"]))
+            if e_end <= period_start or e_start >= period_end:
+                continue
+            tags = list(set([t.lower() for t in te.get("tags") or []]))
+            e = Entry(name, e_start, e_end, tags, id=te.get("id"), zone=rp.zone)
+            stamp = _stamp(te.get("at"))
+            yield _key(e), (stamp if stamp is not None else _signature(e)), e
+
+    def _remove(self, id):
+        _, parts, _ = self.index.pop(id)
+        for d, e in parts:
+            self.rp.days[d].remove(e)
+        return set([d for d, e in parts])
+
+    def _insert(self, id, version, e):
+        parts = list(self.rp.day_table.split([e]))
+        for d, part in parts:
+            if d not in self.rp.days:
+                self.rp.days[d] = StrictList(Entry)
+            self.rp.days[d].append(part)
+        self.index[id] = (version, parts, e.start_ts)
+        return set([d for d, part in parts])
+
+    def _update_day(self, d):
+        if d in self.rp.days and not len(self.rp.days[d]):
+            del self.rp.days[d]
+        if d not in self.rp.days:
+            self.hours.pop(d, None)
+            self.seconds.pop(d, None)
+            return
+        self.hours[d] = day_hours(self.rp.days[d], self.rp.get_labor_hours(d))
+        self.seconds[d] = self.rp.calc_day_seconds(self.rp.days[d])
+
+    def load(self):
+        """
+        Fetches all entries of the period and adds the holidays
+
+        :return: All days of the period with entries
+        :rtype: set
+        """
+        rp = self.rp
+        rp.total_time = tdelta(0)
+        rp.project_seconds = {
+            "Vacations": 0.0,
+            "Courses": 0.0,
+            "Sick": 0.0
+        }
+        self.synced = time.time()
+        for id, version, e in self._versions():
+            self._insert(id, version, e)
+        rp.apply_holidays()
+        for d in rp.days:
+            self._update_day(d)
+        return set(rp.days)
+
+    def touch(self, day):
+        """
+        Makes the next poll fetch the entries from the day before ``day`` on, e.g. after
+        adding an entry to a day in the past
+        """
+        since = self.rp.zone.midnight(day - tdelta(days=1))
+        self._touched = since if self._touched is None else min(self._touched, since)
+
+    def fetch(self):
+        """
+        Fetches the current version of the entries that may have changed since the last
+        sync, for :meth:`apply`; every ``full_every`` polls the ones of the whole period
+
+        :return: (id, version, entry) tuples and the range of start times they cover, None
+                 if they are all entries of the period
+        :rtype: (list, tuple)
+        """
+        now = time.time()
+        touched = self._touched
+        self.polls += 1
+        if self.synced is None or self.polls % self.full_every == 0:
+            versions, window = list(self._versions()), None
+        else:
+            since = int(self.synced - self.lookback.total_seconds())
+            if touched is not None:
+                since = min(since, touched)
+            # Toggl returns at most 1000 entries, none after the period are needed
+            window = (since, min(int(now), self.rp.day_table.end))
+            versions = []
+            if since < window[1]:
+                versions = list(self._changed_versions(
+                    *[datetime.datetime.fromtimestamp(ts, datetime.timezone.utc) for ts in window]))
+        self.synced = now
+        if self._touched == touched:
+            self._touched = None
+        return versions, window
+
+    def poll(self):
+        """
+        Applies new, changed and deleted entries
+
+        :return: The days that changed
+        :rtype: set
+        """
+        return self.apply(*self.fetch())
+
+    def apply(self, versions, window=None):
+        """
+        Applies the entries that are new or changed in ``versions`` and removes the ones
+        missing from it
+
+        :param versions: (id, version, entry) tuples as returned by :meth:`fetch`
+        :param window: Range of the start times ``versions`` covers, see :meth:`fetch`; only
+                       entries starting in it are removed if missing, all if None
+        :return: The days that changed
+        :rtype: set
+        """
+        dirty = set()
+        seen = set()
+        for id, version, e in versions:
+            seen.add(id)
+            known = self.index.get(id)
+            if known is not None and known[0] == version:
+                continue
+            if known is not None:
+                dirty |= self._remove(id)
+            dirty |= self._insert(id, version, e)
+
+        missing = [i for i in self.index if i not in seen]
+        if window is not None:
+            missing = [i for i in missing if window[0] <= self.index[i][2] <= window[1]]
+        for id in missing:
+            dirty |= self._remove(id)
+
+        for d in dirty:
+            self._update_day(d)
+        return dirty
+
+    def balance(self):
+        return sum([h[2] for h in self.hours.values()])
+
+    def summary(self):
+        from replan.resource_planning import to_percents
+
+        project_seconds, total_seconds = self.rp.calc_project_and_total_seconds(
+            day_seconds=[self.seconds[d] for d in self.rp.days])
+        return to_percents(project_seconds, total_seconds)
+
+    def record(self, days):
+        return {
+            "days": [{"date": d, "hours": self.hours[d][0], "breaks": self.hours[d][1],
+                      "balance": self.hours[d][2]} for d in sorted(days) if d in self.hours],
+            "balance": self.balance(),
+            "summary": self.summary()
+        }
+
+    def output(self, days):
+        for d in sorted(days):
+            if d not in self.hours:
+                print(f"{d:%d.%m.%Y}: no entries anymore")
+                continue
+            hours, breaks, balance, _ = self.hours[d]
+            print(f"{d:%d.%m.%Y}: {hours:>5.2f}h; breaks: {breaks:>5.2f}h => +/- {balance:>+5.2f}h")
+        print(mk_headline(sgn="-"))
+        print(f"Balance: {self.balance():>+6.1f}h")
+        percents = self.summary()
+        for p in percents:
+            if percents[p] > 0.0:
+                print(f"==> Project {p}: {percents[p]}%")
+        print(mk_headline(sgn="="))
+
+
+def watch(rp, report, interval=60):
+    """
+    Polls Toggl every ``interval`` seconds and reports the changed days with the updated
+    balance and resource distribution, until interrupted
+    """
+    watcher = Watcher(rp)
+    days = watcher.load()
+    try:
+        while True:
+            if days:
+                if report.structured:
+                    report.add("watch", watcher.record(days))
+                    report.stream.flush()
+                else:
+                    watcher.output(days)
+            time.sleep(interval)
+            try:
+                days = watcher.poll()
+            except Exception as e:
+                log.error(f"Polling failed: {e}")
+                days = set()
+    except KeyboardInterrupt:
+        pass
@@ -1,6 +1,8 @@
 from datetime import timedelta as tdelta, datetime as dt
 from calendar import monthrange
 
+from replan.logging import log
+
 
 class WorkingHours:
     def __init__(self, start, end, sum_of_breaks=1, worktimings=None, weekends=None, holidays=None):
@@ -16,7 +18,7 @@ class WorkingHours:
 
     def get_vacations(self, month=-1, year=-1):
         by_type = self._get_days_by_type("Vacations", month, year)
-        print(f"Vacation days {len(by_type)} in {month}/{year}")
+        log.info(f"Vacation days {len(by_type)} in {month}/{year}")
         return by_type
 
     def get_sick_days(self, month=-1, year=-1):
@@ -55,8 +57,9 @@ class WorkingHours:
                 yield day
 
     def get_actual_work_days(self, month=-1, year = -1):
+        holidays = set(self.get_holidays(month, year))
         for d in self.get_all_work_days(month, year):
-            if d not in self.get_holidays(month, year):
+            if d not in holidays:
                 yield d
 
     def get_number_of_all_workdays(self, month=-1, year = -1):
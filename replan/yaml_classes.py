@@ -1,11 +1,17 @@
 import yaml
 
 from replan.logging import log
+from replan.working_hours import parse_holidays
 
-__all__=["Config", "Project", "Mapping", "ProjectDict", "ProductivityMapping", "ProductivityMappingDict"]
+__all__=["Config", "Project", "Mapping", "ProjectDict", "ProductivityMapping", "ProductivityMappingDict", "Loader"]
+
+#: libyaml's C loader if PyYAML has been built with it, the pure Python one otherwise
+Loader = getattr(yaml, "CLoader", yaml.Loader)
 
 
 class YamlBase(yaml.YAMLObject):
+    yaml_loader = [yaml.Loader] if Loader is yaml.Loader else [yaml.Loader, Loader]
+
     @classmethod
     def from_yaml(cls, loader, node, *args, **kwargs):
         fields = loader.construct_mapping(node, deep = True)
@@ -14,24 +20,60 @@ class YamlBase(yaml.YAMLObject):
     def __init__(self, *args, **kwargs):
         for attr in kwargs:
             val = kwargs[attr]
-            log.debug("YAML Base %s: set Attribute %s -> %s" % (self.__class__.__name__, attr, val))
+            log.debug("YAML Base %s: set Attribute %s -> %s", self.__class__.__name__, attr, val)
             setattr(self, attr, val)
 
 
 class Config(YamlBase):
     yaml_tag = u"!Config"
 
+    def get_holidays(self):
+        """
+        All holidays, vacations, sick and course days as expanded (date, type) tuples
+        """
+        if getattr(self, "_holidays", None) is None:
+            self._holidays = parse_holidays(getattr(self, "holidays", None) or {})
+        return self._holidays
+
+    def digest(self):
+        """
+        Hash of everything the loaded state of a planner depends on: the account, the
+        timezone, the working hours, the holiday calendar and the projects
+
+        :rtype: str
+        """
+        import hashlib
+
+        settings = getattr(self, "settings", {})
+        parts = [getattr(self, "api", {}).get("api_key"), settings.get("timezone"), settings.get("worktimings"),
+                 settings.get("weekends"), self.get_holidays(),
+                 [(p.code, p.name) for p in self.projects.definitions] if hasattr(self, "projects") else []]
+        return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+    def compile(self):
+        """
+        Resolves everything derived from the plain YAML data, i.e. the expanded
+        holiday calendar and the project and mapping indexes
+        """
+        self.get_holidays()
+        if hasattr(self, "projects"):
+            self.projects.build_index()
+        if hasattr(self, "productivity_mappings"):
+            self.productivity_mappings.build_index()
+        return self
+
 
 class Project(YamlBase):
     yaml_tag = u"!Project"
 
-    def __init__(self, code, name, ccenter, max = 1.0, ezve_ignore = False):
+    def __init__(self, code, name, ccenter, max = 1.0, ezve_ignore = False, overflow = None):
         super(Project, self).__init__()
         self.code = code
         self.name = name
         self.ccenter = ccenter
         self.max = max
         self.ezve_ignore = ezve_ignore
+        self.overflow = overflow
 
     def __repr__(self):
         return f"Project: [{self.code}] [{self.name}] [{self.ccenter}] [{self.max}] [EZVE: {'no' if self.ezve_ignore else 'yes'}]"
@@ -56,8 +98,19 @@ class ProjectDict(YamlBase):
         super(ProjectDict, self).__init__()
         self.definitions = definitions
 
+    def build_index(self):
+        self._index = {"name": {}, "code": {}, "ccenter": {}}
+        for s in self.definitions:
+            for attr in self._index:
+                self._index[attr].setdefault(getattr(s, attr), []).append(s)
+        return self._index
+
+    def _lookup(self, attr, value):
+        index = getattr(self, "_index", None) or self.build_index()
+        return index[attr].get(value, [])
+
     def get_by_name(self, name):
-        ret = [s for s in self.definitions if s.name == name]
+        ret = self._lookup("name", name)
         if not any(ret):
             p = Project(
                 code = "empty",
@@ -73,7 +126,7 @@ class ProjectDict(YamlBase):
         return ret[0]
 
     def get_by_code(self, code):
-        ret = [s for s in self.definitions if s.code == code]
+        ret = self._lookup("code", code)
         if not any(ret):
             p = Project(
                 code="empty",
@@ -89,7 +142,7 @@ class ProjectDict(YamlBase):
         return ret[0]
     
     def get_by_ccenter(self, ccenter):
-        ret = [s for s in self.definitions if s.ccenter == ccenter]
+        ret = self._lookup("ccenter", ccenter)
         if ccenter <= 0 or not any(ret):
             p = Project()
             p.name = ccenter
@@ -118,10 +171,25 @@ class ProductivityMapping(YamlBase):
 class ProductivityMappingDict(YamlBase):
     yaml_tag = u"!PMappingDict"
 
+    def build_index(self):
+        self._index = {}
+        for s in self.mappings:
+            self._index.setdefault(s.code, []).append(s)
+        return self._index
+
     def __getitem__(self, i):
-        ret = [s for s in self.mappings if s.code == i]
+        ret = self._mappings_of(i)
         assert len(ret) <= 1, f"There's more than one mapping for project {i}"
         return ret[0]
 
+    def __contains__(self, code):
+        return any(self._mappings_of(code))
+
+    def _mappings_of(self, code):
+        index = getattr(self, "_index", None)
+        if index is None:
+            index = self.build_index()
+        return index.get(code, [])
+
     def __iter__(self):
         return self.mappings.__iter__()
\ No newline at end of file
@@ -8,9 +8,11 @@
 __author__ = "Mikko Ohtamaa <mikko@opensourcehacker.com>"
 __license__ = "MIT"
 
-__all__ = ["RainbowLoggingHandler"]
+__all__ = ["RainbowLoggingHandler", "queued"]
 
 import logging
+import logging.handlers
+import queue
 
 from logutils.colorize import ColorizingStreamHandler
 
@@ -50,6 +52,25 @@ class RainbowLoggingHandler(ColorizingStreamHandler):
     #: Show logger name
     show_name = True
 
+    def __init__(self, *args, **kwargs):
+        super(RainbowLoggingHandler, self).__init__(*args, **kwargs)
+        self._formatters = {}
+        self._is_tty = None
+
+    @property
+    def is_tty(self):
+        """
+        Whether the stream is a terminal; only determined once per stream
+        """
+        if self._is_tty is None:
+            isatty = getattr(self.stream, "isatty", None)
+            self._is_tty = bool(isatty and isatty())
+        return self._is_tty
+
+    def setStream(self, stream):
+        self._is_tty = None
+        return super(RainbowLoggingHandler, self).setStream(stream)
+
     def get_color(self, fg=None, bg=None, bold=False):
         """
         Construct a terminal color code
@@ -72,67 +93,49 @@ class RainbowLoggingHandler(ColorizingStreamHandler):
 
         return color_code
 
-    def colorize(self, record):
+    def get_formatter(self, levelno):
         """
-        Get a special format string with ASCII color codes.
+        Get the formatter for a logging level, with its color codes compiled in.
         """
+        formatter = self._formatters.get(levelno)
+        if formatter is None:
+            # Dynamic message color based on logging level
+            if levelno in self.level_map:
+                fg, bg, bold = self.level_map[levelno]
+            else:
+                # Defaults
+                bg = None
+                fg = "white"
+                bold = False
+
+            # Magician's hat
+            # https://www.youtube.com/watch?v=1HRa4X07jdE
+            template = [
+                # "[",
+                # self.get_color("black", None, True),
+                # "%(asctime)s",
+                # self.reset,
+                # "] ",
+                # self.get_color("white", None, True) if self.show_name else "",
+                # "%(name)s " if self.show_name else "",
+                self.get_color(bg, fg, bold),
+                "%(message)s",
+                self.reset,
+            ]
 
-        # Dynamic message color based on logging level
-        if record.levelno in self.level_map:
-            fg, bg, bold = self.level_map[record.levelno]
-        else:
-            # Defaults
-            bg = None
-            fg = "white"
-            bold = False
-
-        # Magician's hat
-        # https://www.youtube.com/watch?v=1HRa4X07jdE
-        template = [
-            # "[",
-            # self.get_color("black", None, True),
-            # "%(asctime)s",
-            # self.reset,
-            # "] ",
-            # self.get_color("white", None, True) if self.show_name else "",
-            # "%(name)s " if self.show_name else "",
-            # "%(padded_who)s",
-            # self.reset,
-            # " ",
-            self.get_color(bg, fg, bold),
-            "%(message)s",
-            self.reset,
-        ]
-
-        format = "".join(template)
-
-        who = [self.get_color("green"),
-               getattr(record, "funcName", ""),
-               "()",
-               self.get_color("black", None, True),
-               ":",
-               self.get_color("cyan"),
-               str(getattr(record, "lineno", 0))]
-
-        who = "".join(who)
-
-        # We need to calculate padding length manualy
-        # as color codes mess up string length based calcs
-        unformatted_who = getattr(record, "funcName", "") + "()" + \
-            ":" + str(getattr(record, "lineno", 0))
-
-        if len(unformatted_who) < self.who_padding:
-            spaces = " " * (self.who_padding - len(unformatted_who))
-        else:
-            spaces = ""
-
-        record.padded_who = who + spaces
+            formatter = logging.Formatter("".join(template), self.date_format)
+            self._formatters[levelno] = formatter
+        return formatter
 
-        formatter = logging.Formatter(format, self.date_format)
+    def colorize(self, record):
+        """
+        Get a special format string with ASCII color codes.
+        """
+        formatter = self.get_formatter(record.levelno)
         self.colorize_traceback(formatter, record)
         output = formatter.format(record)
         # Clean cache so the color codes of traceback don't leak to other formatters
-        record.ext_text = None
+        record.exc_text = None
         return output
 
     def colorize_traceback(self, formatter, record):
@@ -161,6 +164,36 @@ class RainbowLoggingHandler(ColorizingStreamHandler):
 
         return message
 
+    def emit(self, record):
+        """
+        Writes a record to the stream.
+
+        Plain streams take the standard library's path; only terminals need
+        the colorizing one.
+        """
+        if self.is_tty:
+            super(RainbowLoggingHandler, self).emit(record)
+        else:
+            logging.StreamHandler.emit(self, record)
+
+
+def queued(handler):
+    """
+    Puts a handler behind a queue so that formatting and writing happen in a
+    background thread instead of in the logging call.
+
+    The returned listener has to be stopped to flush the remaining records.
+
+    :param handler: The handler doing the actual output
+    :return: The handler to attach to the logger and the started listener
+    :rtype: (logging.handlers.QueueHandler, logging.handlers.QueueListener)
+    """
+    # Unbounded; queue.SimpleQueue only exists from Python 3.7 on
+    q = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(q, handler, respect_handler_level=True)
+    listener.start()
+    return logging.handlers.QueueHandler(q), listener
+
 
 if __name__ == "__main__":
     # Run test output on stdout
@@ -14,6 +14,7 @@ setup(
     description = ("A tool to process and sum up working times tracked on toggl.com"),
     license = "BSD",
     packages=['replan', 'resource_logging', 'resource_objects'],
+    install_requires=['numpy'],
     entry_points={
         'console_scripts': [
             'toggl_summary=replan.resource_planning:main'
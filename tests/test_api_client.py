@@ -0,0 +1,70 @@
+import sys
+import threading
+import types
+
+import requests
+
+from replan.api_client import ThrottledAdapter, attach, make_session
+from replan.fake_toggl import FakeToggl, FakeTogglAdapter
+from replan.synthetic import SyntheticAccount
+
+URL = "https://toggl.example/api/v8"
+
+
+def _session(app, **kwargs):
+    return make_session(rate=1000.0, burst=1000, transport=FakeTogglAdapter(app), **kwargs)
+
+
+def test_retry_after_is_capped():
+    adapter = ThrottledAdapter(max_backoff=2.0)
+    assert adapter._delay(0, 3600.0) == 2.0
+    assert adapter._delay(0, 1.5) == 1.5
+    assert adapter._delay(0, -1.0) == 0.0
+
+
+def test_stats_of_parallel_requests():
+    app = FakeToggl(SyntheticAccount(years=[2018]))
+    session = _session(app)
+
+    def get():
+        for _ in range(25):
+            session.get(f"{URL}/workspaces", auth=("token", "api_token"))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    records = session.adapter.records()
+    assert [r["requests"] for r in records] == [200]
+    assert app.requests == 200
+
+
+def test_attach_to_module_level_requests():
+    # A client calling requests.get in a module of its package and creating its own sessions
+    package = types.ModuleType("fakeclient")
+    http = types.ModuleType("fakeclient.http")
+    http.requests = requests
+    exec("def workspaces():\n"
+         f"    return requests.get('{URL}/workspaces', auth=('token', 'api_token')).json()\n"
+         "def me():\n"
+         f"    return requests.Session().get('{URL}/me', auth=('token', 'api_token')).json()\n",
+         http.__dict__)
+    Api = type("Api", (), {"__module__": "fakeclient"})
+    sys.modules.update({"fakeclient": package, "fakeclient.http": http})
+    try:
+        app = FakeToggl(SyntheticAccount(years=[2018], workspaces=2))
+        session = _session(app)
+        assert attach(Api(), session)
+        assert len(http.workspaces()) == 2
+        assert http.me()["data"]["id"] == 1
+        assert sorted([r["endpoint"] for r in session.adapter.records()]) == \
+            ["GET /api/v8/me", "GET /api/v8/workspaces"]
+    finally:
+        del sys.modules["fakeclient"], sys.modules["fakeclient.http"]
+
+
+def test_attach_to_unknown_clients():
+    Api = type("Api", (), {"__module__": "nosuchclient"})
+    app = FakeToggl(SyntheticAccount(years=[2018]))
+    assert not attach(Api(), _session(app))
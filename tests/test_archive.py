@@ -0,0 +1,20 @@
+from replan.archive import EntryArchive
+from replan.entry import Entry
+from replan.timezones import get_zone
+
+#: 2018-03-06 09:00 in Berlin
+NINE = 1520323200
+
+
+def entry(id, start, end, name="A"):
+    return Entry(name, NINE + start, NINE + end, ["dev"], id=id, zone=get_zone("Europe/Berlin"))
+
+
+def test_append_twice(tmp_path):
+    archive = EntryArchive(str(tmp_path), zone=get_zone("Europe/Berlin"))
+    # Entries without an id, like the ones of holidays, the last one crossing midnight
+    entries = [entry(1, 0, 3600), entry(None, 3600, 7200, name="Vacations"), entry(None, 50400, 57600)]
+    assert archive.append(entries) == 4
+    assert archive.append(entries) == 0
+    assert archive.append(entries + [entry(None, 7200, 9000, name="Vacations")]) == 1
+    assert len(EntryArchive(str(tmp_path)).month(2018, 3)) == 5
@@ -0,0 +1,43 @@
+import datetime
+
+from replan.checks import check_for_gaps_and_overlaps
+from replan.entry import Entry
+from replan.timezones import DayTable, get_zone
+
+
+def _days(*entries):
+    zone = get_zone("Europe/Berlin")
+    table = DayTable(zone, datetime.date(2018, 3, 5), datetime.date(2018, 3, 8))
+    days = {}
+    for d, e in table.split([Entry(name, zone.localize(start), zone.localize(end), id=i + 1, zone=zone)
+                             for i, (name, start, end) in enumerate(entries)]):
+        days.setdefault(d, []).append(e)
+    return days
+
+
+def _findings(days):
+    return sorted([(f.kind, str(f.day)) for f in check_for_gaps_and_overlaps(days).findings])
+
+
+def at(day, hour, minute=0):
+    return datetime.datetime(2018, 3, day, hour, minute)
+
+
+def test_entry_crossing_midnight():
+    days = _days(("A", at(6, 22), at(6, 23)), ("B", at(6, 23), at(7, 0, 30)),
+                 ("C", at(7, 9), at(7, 12)), ("D", at(7, 12), at(7, 17)))
+    # The part of B after midnight leaves no gap to C on the 7th
+    assert _findings(days) == [("midnight", "2018-03-06")]
+
+
+def test_entry_ending_at_midnight():
+    days = _days(("A", at(6, 22), at(6, 23)), ("B", at(6, 23), at(7, 0)),
+                 ("C", at(7, 9), at(7, 12)))
+    assert _findings(days) == []
+
+
+def test_overlap_with_entry_crossing_midnight():
+    days = _days(("A", at(6, 22), at(7, 1)), ("B", at(6, 23, 30), at(7, 0, 30)))
+    findings = check_for_gaps_and_overlaps(days).findings
+    assert [(f.kind, f.details.get("seconds")) for f in findings] == \
+        [("midnight", None), ("midnight", None), ("ovl", 5400.0)]
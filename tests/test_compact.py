@@ -0,0 +1,26 @@
+from replan.checks import day_hours
+from replan.entry import Entry, compact
+from replan.timezones import get_zone
+
+#: 2018-03-06 09:00 in Berlin
+NINE = 1520323200
+
+
+def entry(id, start, end, name="A", tags=("x",)):
+    return Entry(name, NINE + start, NINE + end, list(tags), id=id, zone=get_zone("Europe/Berlin"))
+
+
+def test_back_to_back_entries_are_merged():
+    entries = [entry(1, 0, 3600), entry(2, 3600, 7200), entry(3, 7200, 9000, name="B")]
+    compacted = compact(entries)
+    assert [(e.name, e.ids, e.seconds) for e in compacted] == [("A", (1, 2), 7200), ("B", (3,), 1800)]
+    # The entries passed in stay as they are
+    assert [e.seconds for e in entries] == [3600, 3600, 1800]
+
+
+def test_gaps_and_overlaps_keep_the_worked_time():
+    entries = [entry(1, 0, 3600), entry(2, 3630, 7200), entry(3, 7150, 9000), entry(4, 9000, 9010, tags=())]
+    compacted = compact(entries, threshold=60)
+    assert [(e.ids, e.start_ts - NINE, e.end_ts - NINE, e.seconds) for e in compacted] == \
+        [((1, 2, 3), 0, 9000, 3600 + 3570 + 1850), ((4,), 9000, 9010, 10)]
+    assert day_hours(compacted, 8.0)[0] == day_hours(entries, 8.0)[0]
@@ -0,0 +1,54 @@
+import datetime
+
+import pytest
+
+from replan.api_client import attach, make_session
+from replan.fake_toggl import FakeToggl, FakeTogglAdapter
+from replan.synthetic import SyntheticAccount
+
+
+@pytest.fixture
+def client():
+    """
+    The real Toggl client (pytoggl, see the Pipfile) sending its requests to a fake Toggl
+    """
+    api_module = pytest.importorskip("toggl.api")
+    account = SyntheticAccount(years=[2018], workspaces=2, projects=3, entries_per_day=2)
+    app = FakeToggl(account)
+    session = make_session(rate=1000.0, burst=1000, transport=FakeTogglAdapter(app))
+    api = api_module.Api("synthetic")
+    assert attach(api, session), "The Toggl client can't be sent to the fake Toggl"
+    return api, account, app
+
+
+def test_round_trip(client):
+    api, account, app = client
+
+    workspaces = list(api.workspaces)
+    assert sorted([w.id for w in workspaces]) == [w["id"] for w in account.workspaces]
+
+    ws = api.workspaces.get(account.workspaces[0]["id"])
+    projects = dict([(p.name, p) for p in ws.projects])
+    expected = [p for p in account.projects if p["wid"] == ws.id]
+    assert sorted(projects) == sorted([p["name"] for p in expected])
+
+    p = expected[0]
+    entries = projects[p["name"]].time_entries.list()
+    assert sorted([e.id for e in entries]) == sorted([e["id"] for e in account.by_project[p["id"]]])
+    assert all([hasattr(e, "start") and hasattr(e, "stop") and hasattr(e, "tags") for e in entries])
+
+    before = len(account.entries)
+    api.time_entries.create(time_entry={
+        "wid": ws.id,
+        "pid": p["id"],
+        "billable": False,
+        "start": datetime.datetime(2018, 3, 1, 9, 0, tzinfo=datetime.timezone.utc).isoformat(),
+        "duration": 3600,
+        "description": "round trip",
+        "tags": ["dev"],
+        "created_with": "resource_planner"
+    })
+    assert len(account.entries) == before + 1
+    assert account.by_project[p["id"]][-1]["description"] == "round trip"
+    # Everything went through the fake, nothing through the network
+    assert app.requests > 0
@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#: Seconds importing the command line module may take; pandas alone takes longer
+IMPORT_BUDGET = 0.3
+
+#: Modules only the sub commands that need them may import
+HEAVY_MODULES = ["pandas", "numpy", "yaml", "icu", "markdown2", "pytz", "requests", "toggl"]
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import replan.resource_planning
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _import():
+    out = subprocess.run([sys.executable, "-c", SCRIPT], cwd=ROOT, check=True,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+    return json.loads(out.decode("utf-8").strip().splitlines()[-1])
+
+
+def test_no_heavy_modules_on_import():
+    assert _import()["modules"] == []
+
+
+def test_import_time_budget():
+    # The best of a few runs, so that a busy machine doesn't fail the test
+    seconds = min([_import()["seconds"] for _ in range(3)])
+    assert seconds < IMPORT_BUDGET, f"Importing replan.resource_planning took {seconds:.3f}s"
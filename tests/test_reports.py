@@ -0,0 +1,53 @@
+import datetime
+
+import numpy as np
+
+from replan.aggregation import DayTotals, WORK, POSTPONED
+from replan.api_client import make_session
+from replan.fake_toggl import FakeToggl, FakeTogglAdapter
+from replan.reports import ReportsClient, fold_weekly
+from replan.resource_planning import ResourcePlanner
+from replan.synthetic import SyntheticAccount
+
+START, END = datetime.date(2018, 3, 1), datetime.date(2018, 3, 31)
+
+
+def _account():
+    account = SyntheticAccount(years=[2018], projects=4, seed=3)
+    pid = account.projects[0]["id"]
+    # The weeks of the reports start on Thursdays, the first of the period. From 22:30 to
+    # 0:30 into the next week and from 23:30 summer time to 1:30 into the next month.
+    for start, tags in [("2018-03-07T21:30:00", ["dev"]), ("2018-03-31T21:30:00", ["distribute"])]:
+        account.create_entry({"pid": pid, "start": start, "duration": 7200, "tags": tags})
+    return account
+
+
+def _seconds(totals):
+    return dict([(name, totals.seconds[:, n, :]) for n, name in enumerate(totals.names)
+                 if totals.seconds[:, n, :].any()])
+
+
+def test_weekly_reports_fold_like_the_entries():
+    account = _account()
+    rp = ResourcePlanner(START, END, account.config(), api=account.api(), streaming=True)
+    expected = _seconds(rp.fold_entries())
+
+    app = FakeToggl(account)
+    client = ReportsClient(make_session(rate=1000.0, burst=1000, transport=FakeTogglAdapter(app)), "synthetic",
+                           api_url="https://toggl.example/api/v8", reports_url="https://toggl.example/reports/api/v2")
+    totals = DayTotals(START, END)
+    requests = fold_weekly(client, 1, totals)
+    actual = _seconds(totals)
+
+    # Five weeks with tags for pauses and postponed time, a request for each, one for the tags
+    assert requests == 1 + 5 * 3
+    assert sorted(actual) == sorted(expected)
+    # The reports count entries crossing midnight on the day they start on: all of the first
+    # one on the 7th and the hour and a half of the second one on the 1st of April, which is
+    # dropped when fetching the entries, on the 31st
+    name = account.projects[0]["name"]
+    expected[name][6, WORK] += 1800.0
+    expected[name][7, WORK] -= 1800.0
+    expected[name][30, POSTPONED] += 5400.0
+    for name in expected:
+        assert np.allclose(actual[name], expected[name]), name
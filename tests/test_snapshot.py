@@ -0,0 +1,35 @@
+import datetime
+
+import pytest
+
+from replan.resource_planning import ResourcePlanner
+from replan.snapshot import SnapshotError
+from replan.synthetic import SyntheticAccount
+
+START, END = datetime.date(2018, 3, 1), datetime.date(2018, 3, 31)
+
+
+def _entries(rp):
+    return sorted([(d, e.name, e.start_ts, e.end_ts, e.seconds, e.ids) for d in rp.days for e in rp.days[d]])
+
+
+def test_snapshot_of_compacted_days(tmp_path):
+    account = SyntheticAccount(years=[2018], projects=3)
+    pid = account.projects[0]["id"]
+    # Two entries with a gap of five minutes in between
+    for start, duration in [("2018-03-06T19:00:00", 1800), ("2018-03-06T19:35:00", 1500)]:
+        account.create_entry({"pid": pid, "start": start, "duration": duration, "tags": ["dev"]})
+    config = account.config()
+    rp = ResourcePlanner(START, END, config, api=account.api())
+    rp.bucket_entries(rp.collect_entries())
+    rp.compact_days(threshold=600)
+    assert [e.seconds for e in rp.days[datetime.date(2018, 3, 6)] if e.start_ts == 1520362800] == [3300]
+    path = str(tmp_path / "march.npz")
+    rp.snapshot(path)
+
+    restored = ResourcePlanner(START, END, config)
+    restored.restore(path, compacted=True)
+    assert _entries(restored) == _entries(rp)
+
+    with pytest.raises(SnapshotError):
+        ResourcePlanner(START, END, config).restore(path)
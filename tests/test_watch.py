@@ -0,0 +1,48 @@
+import datetime
+
+from replan.api_client import make_session
+from replan.fake_toggl import FakeToggl, FakeTogglAdapter
+from replan.resource_planning import ResourcePlanner
+from replan.synthetic import SyntheticAccount
+from replan.watch import Watcher
+
+START, END = datetime.date(2018, 3, 1), datetime.date(2018, 3, 31)
+
+
+def _watcher(account, app, **kwargs):
+    rp = ResourcePlanner(START, END, account.config(), api=account.api())
+    rp.api_session = make_session(rate=1000.0, burst=1000, transport=FakeTogglAdapter(app))
+    watcher = Watcher(rp, **kwargs)
+    watcher.load()
+    return watcher
+
+
+def test_polls_fetch_only_recent_entries():
+    account = SyntheticAccount(years=[2018], projects=3)
+    app = FakeToggl(account)
+    watcher = _watcher(account, app, full_every=3)
+
+    pid = account.projects[0]["id"]
+    app.create_time_entry({}, {"time_entry": {"pid": pid, "start": "2018-03-06T19:00:00", "duration": 1800,
+                                              "tags": ["dev"]}})
+    march = sorted([e for e in account.entries if START <= e["start"].date() <= END], key=lambda e: e["start"])
+    old = march[0]
+    new = [e for e in march if e["start"].date() > datetime.date(2018, 3, 6)][0]
+    for e in (old, new):
+        app.delete_time_entry(e["id"], {}, None)
+
+    # The period is over, so the first poll doesn't even ask for the entries of today
+    assert watcher.poll() == set()
+    assert app.requests == 0
+
+    # One request for the projects, one for the entries from the 5th of March on
+    watcher.touch(datetime.date(2018, 3, 6))
+    assert watcher.poll() == set([datetime.date(2018, 3, 6), new["start"].date()])
+    assert app.requests == 2
+
+    # Every third poll fetches all entries and finds the older change
+    assert watcher.poll() == set([old["start"].date()])
+
+    fresh = _watcher(account, app)
+    assert watcher.hours == fresh.hours
+    assert watcher.seconds == fresh.seconds